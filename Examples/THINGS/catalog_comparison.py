@@ -6,8 +6,10 @@ from astropy.coordinates import SkyCoord
 from astropy.io import fits
 import astropy.units as u
 from spectral_cube import SpectralCube
-from basics import Bubble2D, Bubble3D
-import glob
+import os
+from basics import Bubble2D
+from basics.bubble_io import BubbleFile
+from basics.cross_match import cross_match, best_matches, pixel_positions
 import matplotlib.pyplot as p
 
 '''
@@ -20,21 +22,6 @@ match well at this point.
 '''
 
 
-def get_closest_posn(posn, spatial_footprint):
-    '''
-    '''
-
-    spatial_coords = SkyCoord(ra=spatial_footprint[1],
-                              dec=spatial_footprint[0],
-                              frame='fk5')
-
-    min_posn = spatial_coords.separation(posn).argmin()
-
-    twod_posn = np.unravel_index(min_posn, spatial_footprint[0].shape[::-1])
-
-    return twod_posn
-
-
 def get_maj_min(diam, ratio):
     '''
     Convert the diameter and ratio (min/maj) into the
@@ -47,9 +34,10 @@ def get_maj_min(diam, ratio):
     return major, minor
 
 
-def make_region(row, pixscale, cube):
+def make_region(row, pixscale, cube, posn):
     '''
-    Create an ellipse from the Bagetakos catalogue.
+    Create an ellipse from the Bagetakos catalogue. posn is the (y, x) pixel
+    position of the centre.
     '''
 
     # These are in pc
@@ -62,9 +50,8 @@ def make_region(row, pixscale, cube):
     # May need to shift PA by 90 deg
     pa = row["PA"]
 
-    # Find pixel position using footprint from the cube
-    center = SkyCoord(*row["Coords"].split(","), unit=u.deg)
-    y, x = get_closest_posn(center, cube.spatial_coordinate_map)
+    # Closest pixel to the centre
+    y, x = np.round(posn).astype(int)
 
     # Find the closest center channel
     cent_chan = cube.closest_spectral_channel(row["Vhel"] * u.km / u.s)
@@ -77,21 +64,30 @@ def make_region(row, pixscale, cube):
 
 def match_sources(set_one, set_two, return_corr=False):
     '''
-    Look for spatial matches between 2 sets of bubbles
+    Look for spatial matches between 2 sets of bubbles. Returns the largest
+    overlap with the second set for each bubble in the first.
     '''
 
-    dists = np.zeros((len(set_one), len(set_two)))
+    idx1, idx2, overlaps = cross_match(set_one, set_two,
+                                       return_corr=return_corr)
 
-    for i, one in enumerate(set_one):
-        for j, two in enumerate(set_two):
-            dists[i, j] = one.overlap_with(two, return_corr=return_corr)
+    return best_matches(len(set_one), idx1, idx2, overlaps)[0]
 
-    return dists
 
+def load_bubbles(filename):
+    '''
+    Load the bubbles saved by BubbleFinder.save_bubbles. Returns an empty
+    list when the file does not exist.
+    '''
 
-if __name__ == "__main__":
+    if not os.path.exists(filename):
+        return []
+
+    with BubbleFile(filename) as bubble_file:
+        return bubble_file.bubbles
 
-    import os
+
+if __name__ == "__main__":
 
     # Load in galaxy info
     execfile(os.path.expanduser("~/Dropbox/code_development/BaSiCs/Examples/THINGS/info_THINGS.py"))
@@ -138,25 +134,31 @@ if __name__ == "__main__":
         mom0 = fits.getdata(os.path.join(data_path, key,
                                          "{}_NA_MOM0_THINGS.FITS".format(key)))
 
+        # Convert all of the centres to pixel positions at once
+        gal_rows = np.where(bagetakos_cat["Name"] == props["name"])[0]
+        ras, decs = zip(*[bagetakos_cat[idx]["Coords"].split(",")
+                          for idx in gal_rows])
+        centers = SkyCoord(ras, decs, unit=u.deg)
+        posns = np.vstack(pixel_positions(centers, cube.wcs)).T
+
         regions = []
-        for idx in np.where(bagetakos_cat["Name"] == props["name"])[0]:
-            regions.append(make_region(bagetakos_cat[idx], pixscale, cube))
+        for idx, posn in zip(gal_rows, posns):
+            regions.append(make_region(bagetakos_cat[idx], pixscale, cube,
+                                       posn))
 
-        # Now load in the pkl bubbles
-        pkls = glob.glob(os.path.join(data_path, bubble_folder,
-                                      key + "_bubbles_NA", "*.pkl"))
-        bubbles = [Bubble3D.load_bubble(pk) for pk in pkls]
+        # Now load in the saved bubbles
+        bubbles = load_bubbles(os.path.join(data_path, bubble_folder,
+                                            key + "_bubbles.npz"))
 
-        pkls = glob.glob(os.path.join(data_path, bubble_ro_folder,
-                                      key + "_bubbles_RO", "*.pkl"))
-        bubbles_ro = [Bubble3D.load_bubble(pk) for pk in pkls]
+        bubbles_ro = load_bubbles(os.path.join(data_path, bubble_ro_folder,
+                                               key + "_bubbles.npz"))
 
         if len(bubbles) != 0:
             # continue
             dists = match_sources(regions, bubbles, return_corr=return_corr)
 
             overlaps[key] = \
-                (dists.max(1) > min_corr).sum() / float(len(regions))
+                (dists > min_corr).sum() / float(len(regions))
             print("NA Fraction with overlap")
             print(overlaps[key])
         else:
@@ -169,7 +171,7 @@ if __name__ == "__main__":
                                      return_corr=return_corr)
 
             overlaps_ro[key] = \
-                (dists_ro.max(1) > min_corr).sum() / float(len(regions))
+                (dists_ro > min_corr).sum() / float(len(regions))
             print("RO Fraction with overlap")
             print(overlaps_ro[key])
         else:
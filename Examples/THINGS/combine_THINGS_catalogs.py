@@ -0,0 +1,37 @@
+
+import os
+from basics.bubble_catalog import PPV_Catalog, write_catalog_store
+
+'''
+Combine the catalogs of all galaxies into a single store with a galaxy
+column. Population studies can then read only the columns and galaxies they
+need, e.g.:
+
+cat = PPV_Catalog.from_file(store_name, columns=["galaxy", "tkin"],
+                            where=[("galaxy", "in", ["NGC_628", "NGC_3031"])])
+'''
+
+script_path = "/lustre/home/ekoch/code_repos/BaSiCs/Examples/THINGS/"
+
+# Load in the info dict for the names
+execfile(os.path.join(script_path, "info_THINGS.py"))
+
+datapath = "/lustre/home/ekoch/THINGS/"
+
+cube_type = "RO"
+
+catalogs = {}
+
+for name in galaxy_props:
+    cat_name = os.path.join(datapath, name, "bubbles_{}".format(cube_type),
+                            "{0}_{1}_bubbles.npz".format(name, cube_type))
+
+    if not os.path.exists(cat_name):
+        print("No catalog found for {}".format(name))
+        continue
+
+    catalogs[name] = PPV_Catalog.from_file(cat_name)
+
+# Use a .parquet extension instead if pyarrow is installed
+store_name = os.path.join(datapath, "THINGS_{}_bubbles.npz".format(cube_type))
+write_catalog_store(store_name, catalogs)
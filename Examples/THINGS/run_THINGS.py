@@ -77,15 +77,18 @@ except OSError:
 # Save the bubble objects
 bub_find.save_bubbles(folder=output_folder, name=name)
 
-# Create the catalog as an ecsv
+# Create the catalog as an ecsv, and as a columnar npz for combining with
+# the other galaxies (see combine_THINGS_catalogs.py)
 catalog = bub_find.to_catalog()
 catalog.write_table(os.path.join(output_folder,
                                  "{0}_{1}_bubbles.ecsv".format(name, cube_type)))
+catalog.write_table(os.path.join(output_folder,
+                                 "{0}_{1}_bubbles.npz".format(name, cube_type)))
 
-# Save the mask as an npy file. This isn't intended for normal output, but I
-# want to be able to tweak parameters dependent on the expansion velocity
-np.save(os.path.join(output_folder, "{0}_{1}_bubble_mask.npy".format(name, cube_type)),
-        bub_find.mask)
+# Save the mask as a compressed, bit-packed npz file. This isn't intended for
+# normal output, but I want to be able to tweak parameters dependent on the
+# expansion velocity. Load with basics.masking_utils.PackedMask.load
+bub_find.mask.save(os.path.join(output_folder, "{0}_{1}_bubble_mask.npz".format(name, cube_type)))
 
 # Save some plots of the distribution
 # Bubble outlines only
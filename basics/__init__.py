@@ -1,5 +1,5 @@
 
 from bubble_segment3D import BubbleFinder
 from bubble_segment2D import BubbleFinder2D
-from bubble_objects import Bubble2D, Bubble3D
+from bubble_objects import Bubble2D, Bubble3D, RegionTable
 from bubble_catalog import PPV_Catalog
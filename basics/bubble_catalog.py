@@ -1,12 +1,24 @@
 
 import numpy as np
-from astropy.table import Table, Column
+import os
+import json
+import operator
+from astropy.table import Table, Column, vstack
 import astropy.units as u
 from astropy.coordinates import SkyCoord
 import matplotlib.pyplot as p
 from warnings import warn
 
 from galaxy_utils import gal_props_checker
+from bubble_physics import (kinetic_age, shell_volume_density, hole_volume,
+                            hole_mass, formation_energy)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_FLAG = True
+except ImportError:
+    PYARROW_FLAG = False
 
 
 all_columns = ["pa", "bubble_type", "velocity_center", "velocity_width",
@@ -21,6 +33,30 @@ all_columns = ["pa", "bubble_type", "velocity_center", "velocity_width",
 not_numerical = ["col0"]  # Once finished, this will be center_coord
 
 
+def _property_array(bubbles, name, unit):
+    '''
+    Values of a property for all bubbles in the given unit. The stored
+    values are gathered without making Quantities, then converted together
+    when they share a unit.
+    '''
+
+    try:
+        raw = [bub._raw(name) for bub in bubbles]
+    except (KeyError, AttributeError):
+        return np.array([bub.raw_value(name, unit) for bub in bubbles],
+                        dtype=np.float64)
+
+    values = np.array([val for val, _ in raw])
+
+    from_unit = raw[0][1]
+    if all(un is from_unit or un == from_unit for _, un in raw):
+        if from_unit is unit:
+            return values
+        return values * from_unit.to(unit)
+
+    return np.array([val * un.to(unit) for val, un in raw])
+
+
 def _has_nan(values, name):
     if np.isnan(np.array(values)).any():
         # raise ValueError("NaN in {}".format(name))
@@ -28,6 +64,360 @@ def _has_nan(values, name):
     return values
 
 
+# Formats guessed from the file extension. Anything else is written with
+# astropy as ECSV.
+_EXTENSION_FORMATS = {".parquet": "parquet", ".h5": "hdf5", ".hdf5": "hdf5",
+                      ".npz": "npz", ".ecsv": "ascii.ecsv"}
+
+# The binary formats store the SkyCoord column as two float columns.
+_COORD_NAMES = ("center_ra", "center_dec")
+
+_OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt,
+              "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+              "in": lambda values, options: np.in1d(values, options),
+              "not in": lambda values, options: ~np.in1d(values, options)}
+
+
+def _guess_format(filename, format=None):
+    if format is not None:
+        return format
+    ext = os.path.splitext(filename)[1].lower()
+    return _EXTENSION_FORMATS.get(ext, "ascii.ecsv")
+
+
+def _split_coords(table):
+    '''
+    Replace the SkyCoord column with RA and Dec columns in degrees. The
+    other columns are not copied.
+    '''
+
+    if "col0" not in table.colnames:
+        return table
+
+    table = Table(table, copy=False)
+    coords = table["col0"]
+    table.remove_column("col0")
+    table.add_column(Column(coords.dec.to(u.deg).value, name=_COORD_NAMES[1],
+                            unit=u.deg, description="Center Dec"), index=0)
+    table.add_column(Column(coords.ra.to(u.deg).value, name=_COORD_NAMES[0],
+                            unit=u.deg, description="Center RA"), index=0)
+    return table
+
+
+def _join_coords(table):
+    '''
+    Inverse of `_split_coords`.
+    '''
+
+    if not all(name in table.colnames for name in _COORD_NAMES):
+        return table
+
+    index = table.colnames.index(_COORD_NAMES[0])
+    coords = SkyCoord(np.asarray(table[_COORD_NAMES[0]]),
+                      np.asarray(table[_COORD_NAMES[1]]),
+                      unit=(u.deg, u.deg))
+    table.remove_columns(list(_COORD_NAMES))
+    table.add_column(coords, name="col0", index=index)
+    return table
+
+
+def _check_where(where):
+    '''
+    Predicates are given as a list of (column, operator, value) tuples,
+    which must all be true for a row to be kept.
+    '''
+
+    if where is None:
+        return []
+
+    if isinstance(where, tuple):
+        where = [where]
+
+    for cond in where:
+        if len(cond) != 3:
+            raise TypeError("where must be a list of (column, operator, "
+                            "value) tuples.")
+        if cond[1] not in _OPERATORS:
+            raise ValueError("Unknown operator {0}. Must be one of "
+                             "{1}".format(cond[1], sorted(_OPERATORS)))
+
+    return list(where)
+
+
+def _needed_columns(colnames, columns, where):
+    '''
+    Names of the stored columns to read for the projection and the
+    predicates.
+    '''
+
+    if columns is None:
+        columns = list(colnames)
+    else:
+        # The SkyCoord column is stored as RA and Dec
+        expanded = []
+        for name in columns:
+            if name == "col0" and "col0" not in colnames:
+                expanded.extend(_COORD_NAMES)
+            else:
+                expanded.append(name)
+        columns = expanded
+
+    where_cols = [cond[0] for cond in where]
+
+    for name in columns + where_cols:
+        if name not in colnames:
+            raise ValueError("{} is not a column in the catalog.".format(name))
+
+    return columns, where_cols
+
+
+def _where_mask(get_column, where):
+    mask = None
+    for name, op, value in where:
+        if isinstance(value, u.Quantity):
+            value = value.value
+        cond = _OPERATORS[op](np.asarray(get_column(name)), value)
+        mask = cond if mask is None else mask & cond
+    return mask
+
+
+def _select(table, columns=None, where=None):
+    '''
+    Column projection and row filtering of a Table already in memory.
+    '''
+
+    where = _check_where(where)
+    columns, _ = _needed_columns(table.colnames, columns, where)
+
+    mask = _where_mask(lambda name: table[name], where)
+
+    table = table[columns]
+    if mask is not None:
+        table = table[mask]
+    return table
+
+
+def _column_meta(table):
+    return {"colnames": table.colnames,
+            "units": dict((name, None if table[name].unit is None else
+                           table[name].unit.to_string())
+                          for name in table.colnames),
+            "descriptions": dict((name, table[name].description)
+                                 for name in table.colnames)}
+
+
+def _table_from_arrays(arrays, meta, columns):
+    return Table([Column(arrays[name], name=name,
+                         unit=meta["units"].get(name),
+                         description=meta["descriptions"].get(name))
+                  for name in columns])
+
+
+def _write_npz(table, filename):
+    '''
+    One array per column, so reading only loads the columns requested.
+    '''
+
+    arrays = dict(("column_{}".format(i), np.asarray(table[name]))
+                  for i, name in enumerate(table.colnames))
+    arrays["meta"] = np.array(json.dumps(_column_meta(table)))
+
+    np.savez(filename, **arrays)
+
+
+def _read_npz(filename, columns=None, where=None):
+
+    where = _check_where(where)
+
+    with np.load(filename) as data:
+        meta = json.loads(str(data["meta"]))
+        colnames = meta["colnames"]
+        columns, where_cols = _needed_columns(colnames, columns, where)
+
+        def get_column(name):
+            return data["column_{}".format(colnames.index(name))]
+
+        # The predicates are applied before reading the remaining columns
+        mask = _where_mask(get_column, where)
+
+        arrays = {}
+        for name in columns:
+            arrays[name] = get_column(name)
+            if mask is not None:
+                arrays[name] = arrays[name][mask]
+
+    return _table_from_arrays(arrays, meta, columns)
+
+
+def _write_parquet(table, filename):
+
+    if not PYARROW_FLAG:
+        raise ImportError("pyarrow must be installed to write Parquet "
+                          "files (pip install pyarrow).")
+
+    arrow_table = pa.Table.from_arrays([pa.array(np.asarray(table[name]))
+                                        for name in table.colnames],
+                                       names=table.colnames)
+    arrow_table = arrow_table.replace_schema_metadata(
+        {"basics": json.dumps(_column_meta(table))})
+
+    pq.write_table(arrow_table, filename)
+
+
+def _read_parquet(filename, columns=None, where=None):
+
+    if not PYARROW_FLAG:
+        raise ImportError("pyarrow must be installed to read Parquet "
+                          "files (pip install pyarrow).")
+
+    where = _check_where(where)
+
+    parquet_file = pq.ParquetFile(filename)
+    meta = json.loads(parquet_file.schema.to_arrow_schema()
+                      .metadata[b"basics"].decode("utf-8"))
+    columns, where_cols = _needed_columns(meta["colnames"], columns, where)
+
+    read_cols = columns + [name for name in where_cols if name not in columns]
+    arrow_table = parquet_file.read(columns=read_cols)
+
+    def get_column(name):
+        column = arrow_table.column(name)
+        # Older pyarrow only converts each chunk
+        if hasattr(column, "to_numpy"):
+            values = column.to_numpy()
+        elif column.num_chunks == 0:
+            values = np.empty(0)
+        else:
+            values = np.concatenate([chunk.to_numpy(zero_copy_only=False)
+                                     for chunk in column.chunks])
+        # Strings come back as objects
+        if values.dtype == np.object:
+            values = np.asarray(values.tolist())
+        return values
+
+    mask = _where_mask(get_column, where)
+
+    arrays = {}
+    for name in columns:
+        arrays[name] = get_column(name)
+        if mask is not None:
+            arrays[name] = arrays[name][mask]
+
+    return _table_from_arrays(arrays, meta, columns)
+
+
+def read_table(filename, format=None, columns=None, where=None):
+    '''
+    Read a catalog table, keeping only the given columns and the rows
+    where all of the predicates are true.
+
+    Parameters
+    ----------
+    filename : str
+        Catalog file.
+    format : str, optional
+        Format of the file. Guessed from the extension when not given.
+    columns : list, optional
+        Columns to read. All columns are read by default.
+    where : list of tuples, optional
+        Predicates as (column, operator, value), e.g.,
+        [("galaxy", "==", "NGC_628"), ("diameter_physical", ">", 100)].
+        Quantities are compared in the units of the stored column.
+
+    Returns
+    -------
+    table : astropy.table.Table
+        Table of the selected columns and rows.
+
+    Notes
+    -----
+    Only the npz and Parquet readers skip the unselected columns. HDF5,
+    ECSV and the other astropy formats are read in full, then the columns
+    and rows are selected in memory.
+    '''
+
+    format = _guess_format(filename, format)
+
+    if format == "npz":
+        table = _read_npz(filename, columns=columns, where=where)
+    elif format == "parquet":
+        table = _read_parquet(filename, columns=columns, where=where)
+    elif format == "hdf5":
+        # astropy reads the whole table
+        table = _select(Table.read(filename, format="hdf5", path="catalog"),
+                        columns=columns, where=where)
+    else:
+        table = _select(_split_coords(Table.read(filename, format=format)),
+                        columns=columns, where=where)
+
+    return _join_coords(table)
+
+
+def write_table(table, filename, format=None, overwrite=True):
+    '''
+    Write a catalog table. Parquet ('.parquet', requires pyarrow), HDF5
+    ('.h5' or '.hdf5', requires h5py) and numpy ('.npz') files are columnar
+    binary formats. All other extensions are written with astropy, with
+    ECSV as the default.
+    '''
+
+    format = _guess_format(filename, format)
+
+    if format == "npz":
+        _write_npz(_split_coords(table), filename)
+    elif format == "parquet":
+        _write_parquet(_split_coords(table), filename)
+    elif format == "hdf5":
+        _split_coords(table).write(filename, format="hdf5", path="catalog",
+                                   serialize_meta=True, overwrite=overwrite)
+    else:
+        _split_coords(table).write(filename, format=format,
+                                   overwrite=overwrite)
+
+
+def write_catalog_store(filename, catalogs, format=None,
+                        galaxy_column="galaxy"):
+    '''
+    Combine the catalogs of many galaxies into one table, keyed by a galaxy
+    column. Single galaxies, or a subset of the columns, are then read with
+    `PPV_Catalog.from_file`::
+
+        >>> cat = PPV_Catalog.from_file("things.parquet",
+        ...                             columns=["galaxy", "tkin"],
+        ...                             where=[("galaxy", "==", "NGC_628")])
+
+    Parameters
+    ----------
+    filename : str
+        Output file. The binary formats are best suited for the store.
+    catalogs : dict
+        PPV_Catalog or Table for each galaxy name.
+    format : str, optional
+        Format of the file. Guessed from the extension when not given.
+    galaxy_column : str, optional
+        Name of the galaxy key column.
+    '''
+
+    tables = []
+    for name in sorted(catalogs):
+        table = catalogs[name]
+        if isinstance(table, PPV_Catalog):
+            table = table.table
+
+        table = Table(_split_coords(table), copy=False)
+        if galaxy_column in table.colnames:
+            raise ValueError("The catalog for {0} already has a column "
+                             "named {1}.".format(name, galaxy_column))
+        table.add_column(Column([name] * len(table), name=galaxy_column,
+                                description="Galaxy name"), index=0)
+        tables.append(table)
+
+    if len(tables) == 0:
+        raise ValueError("No catalogs given.")
+
+    write_table(vstack(tables, join_type="exact"), filename, format=format)
+
+
 class PP_Catalog(object):
     """docstring for PP_Catalog"""
     def __init__(self, bubbles):
@@ -61,13 +451,14 @@ class PPV_Catalog(object):
                             "pre-made astropy table.")
 
     @staticmethod
-    def from_file(filename, format='ascii.ecsv'):
+    def from_file(filename, format=None, columns=None, where=None):
+        '''
+        Load a catalog. Only the given columns and the rows passing all of
+        the predicates are kept. See `read_table`.
+        '''
 
-        try:
-            tab = Table.read(filename, format=format)
-        except Exception as e:
-            # Add something a more helpful here.
-            raise e
+        tab = read_table(filename, format=format, columns=columns,
+                         where=where)
 
         self = PPV_Catalog(tab)
 
@@ -116,33 +507,40 @@ class PPV_Catalog(object):
                  "is_closed": [u.dimensionless_unscaled, "Closed or partial "
                                "shell (shell fraction > 0.9 is closed)"]}
 
-        prop_funcs = {"tkin": [u.Myr, "Kinetic age of the bubble.", {}],
+        # Properties computed from the others. The values are computed below.
+        prop_funcs = {"tkin": [u.Myr, "Kinetic age of the bubble."],
                       "shell_volume_density":
                       [u.cm ** -3,
                        "Average hydrogen volume "
-                       "density in the shell.",
-                       {"scale_height": galaxy_props["scale_height"],
-                        "inclination": galaxy_props["inclination"]}],
+                       "density in the shell."],
                       "volume":
-                      [u.pc ** 3, "Volume of the hole.",
-                       {"scale_height": galaxy_props["scale_height"]}],
+                      [u.pc ** 3, "Volume of the hole."],
                       "hole_mass":
                       [u.Msun, "Inferred mass of the hole from the shell"
-                               " volume density.",
-                       {"scale_height": galaxy_props["scale_height"],
-                        "inclination": galaxy_props["inclination"]}],
+                               " volume density."],
                       "formation_energy":
-                      [u.erg, "Energy required to create the hole.",
-                       {"scale_height": galaxy_props["scale_height"],
-                        "inclination": galaxy_props["inclination"]}]}
+                      [u.erg, "Energy required to create the hole."]}
 
         columns = []
 
-        # The center coordinates are different, since they're SkyCoords
-        columns.append(SkyCoord([bub.center_coordinate for bub in bubbles]))
+        # Gather each property for all bubbles once
+        values = dict((name, _property_array(bubbles, name, props[name][0]))
+                      for name in props if name != "is_closed")
+
+        # The center coordinates are different, since they're SkyCoords.
+        # Make them all at once from the stored positions.
+        columns.append(SkyCoord(_property_array(bubbles, "ra", u.deg),
+                                _property_array(bubbles, "dec", u.deg),
+                                unit=(u.deg, u.deg)))
 
         # Same for is_closed
-        columns.append(Column([bub.is_closed for bub in bubbles],
+        if any(not hasattr(bub, "_shell_fraction") for bub in bubbles):
+            raise Warning("Bubble3D must be created from Bubble2D objects for"
+                          " shell_fraction to be defined.")
+        is_closed = values["shell_fraction"] >= 0.9
+        values["is_closed"] = is_closed.astype(np.float64)
+
+        columns.append(Column(is_closed,
                               unit=u.dimensionless_unscaled,
                               description="Closed or partial shell.",
                               name="closed_shell"))
@@ -150,18 +548,40 @@ class PPV_Catalog(object):
         # Add the properties
         for name in props:
             unit, descrip = props[name]
-            columns.append(Column(_has_nan([getattr(bub, name).to(unit).value
-                                            for bub in bubbles], name),
+            columns.append(Column(_has_nan(values[name], name),
                                   name=name, description=descrip,
                                   unit=unit.to_string()))
 
+        # The functions are computed with the arrays of properties
+        scale_height = galaxy_props["scale_height"]
+        inclination = galaxy_props["inclination"]
+
+        diameter = values["diameter_physical"] * props["diameter_physical"][0]
+        exp_vel = values["expansion_velocity"] * \
+            props["expansion_velocity"][0]
+        column_density = values["shell_column_density"] * \
+            props["shell_column_density"][0]
+
+        vol_dens = shell_volume_density(column_density,
+                                        scale_height=scale_height,
+                                        inclination=inclination)
+        volume = hole_volume(diameter, values["bubble_type"],
+                             scale_height=scale_height)
+
+        func_values = \
+            {"tkin": kinetic_age(diameter, exp_vel),
+             "shell_volume_density": vol_dens,
+             "volume": volume,
+             "hole_mass": hole_mass(vol_dens, volume),
+             "formation_energy": formation_energy(vol_dens, diameter,
+                                                  exp_vel)}
+
         # Add the functions
         for name in prop_funcs:
-            unit, descrip, imps = prop_funcs[name]
+            unit, descrip = prop_funcs[name]
             columns.append(
-                Column(_has_nan([getattr(bub, name)(**imps).to(unit).value
-                                 for bub in bubbles], name), name=name,
-                       description=descrip,
+                Column(_has_nan(func_values[name].to(unit).value, name),
+                       name=name, description=descrip,
                        unit=unit.to_string()))
 
         # all_names = ["center_coordinate"] + props.keys() + prop_funcs.keys()
@@ -273,8 +693,10 @@ class PPV_Catalog(object):
                quantiles=[0.16, 0.5, 0.84],
                show_titles=True, title_kwargs={"fontsize": 12})
 
-    def write_table(self, filename, format='ascii.ecsv'):
+    def write_table(self, filename, format=None, overwrite=True):
         '''
-        Write the table. Format must be supported by astropy.table.
+        Write the table. Parquet, HDF5 and npz files are written as
+        columnar binary tables, otherwise the format must be supported by
+        astropy.table. See `write_table`.
         '''
-        self.table.write(filename, format=format)
+        write_table(self.table, filename, format=format, overwrite=overwrite)
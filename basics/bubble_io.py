@@ -0,0 +1,419 @@
+
+'''
+Single-file storage for bubbles and 2D regions.
+
+Everything is written to one uncompressed NumPy .npz file. Each bubble
+attribute is a column, and the ragged shell coordinates and 2D region tables
+are concatenated with offset arrays. Since the file is not compressed, the
+arrays are memory-mapped when read, so loading a single bubble only reads
+the parts of the file that it needs.
+'''
+
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+import json
+import struct
+import zipfile
+
+from bubble_objects import Bubble2D, Bubble3D, RegionTable
+
+FORMAT_VERSION = 1
+
+BUBBLE_CLASSES = {"Bubble2D": Bubble2D, "Bubble3D": Bubble3D}
+
+# These attributes are ragged and stored separately from the columns
+RAGGED_ATTRS = ("_shell_coords", "_twoD_regions", "_units")
+
+# Flags for attributes that are not set on every bubble
+NOT_SET, IS_SET, IS_NONE = 0, 1, 2
+
+
+def _json_default(obj):
+    if isinstance(obj, SkyCoord):
+        return {"__skycoord__": [np.asarray(obj.ra.to(u.deg).value).tolist(),
+                                 np.asarray(obj.dec.to(u.deg).value).tolist(),
+                                 obj.frame.name]}
+    if isinstance(obj, u.Quantity):
+        return {"__quantity__": [np.asarray(obj.value).tolist(),
+                                 obj.unit.to_string()]}
+    if isinstance(obj, u.UnitBase):
+        return {"__unit__": obj.to_string()}
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot store {} in the metadata.".format(type(obj)))
+
+
+def _json_hook(obj):
+    if "__skycoord__" in obj:
+        ra, dec, frame = obj["__skycoord__"]
+        return SkyCoord(ra * u.deg, dec * u.deg, frame=frame)
+    if "__quantity__" in obj:
+        value, unit = obj["__quantity__"]
+        return u.Quantity(value, unit)
+    if "__unit__" in obj:
+        return u.Unit(obj["__unit__"])
+    return obj
+
+
+def _to_json(obj):
+    return np.array(json.dumps(obj, default=_json_default))
+
+
+def _from_json(arr):
+    return json.loads(str(arr[()]), object_hook=_json_hook)
+
+
+def _ragged_arrays(prefix, arrays, width):
+    '''
+    Concatenate a list of 2D arrays (or None) with offsets.
+    '''
+
+    counts = np.array([0 if arr is None else len(arr) for arr in arrays],
+                      dtype=np.int)
+
+    out = {}
+    out[prefix] = \
+        np.vstack([np.empty((0, width))] +
+                  [np.asarray(arr, dtype=np.float64).reshape(-1, width)
+                   for arr in arrays if arr is not None])
+    out[prefix + "_offsets"] = np.append(0, np.cumsum(counts))
+    out[prefix + "_present"] = np.array([arr is not None for arr in arrays],
+                                        dtype=bool)
+
+    return out
+
+
+def _table_arrays(prefix, tables):
+    '''
+    Store a list of RegionTables as one table with group offsets.
+    '''
+
+    tables = [RegionTable.from_regions(table) for table in tables]
+    joined = RegionTable.concatenate(tables)
+
+    out = {}
+    out[prefix + "_data"] = joined.data
+    out[prefix + "_shell_coords"] = joined._shell_coords
+    out[prefix + "_shell_offsets"] = joined._offsets
+    out[prefix + "_offsets"] = \
+        np.append(0, np.cumsum([len(table) for table in tables]))
+    out[prefix + "_distance"] = _to_json([table.distance for table in tables])
+
+    return out
+
+
+def _column(name, states):
+    '''
+    Turn the values of one attribute for all bubbles into arrays.
+    '''
+
+    values = [state.get(name) for state in states]
+
+    present = np.array([val is not None for val in values], dtype=bool)
+
+    example = values[np.argmax(present)] if present.any() else 0.0
+
+    out = {}
+
+    if isinstance(example, u.Quantity):
+        unit = example.unit
+        fill = np.empty(example.shape)
+        fill.fill(np.NaN)
+        out["attr" + name] = \
+            np.array([fill if val is None else val.to(unit).value
+                      for val in values])
+        out["attr" + name + "_unit"] = np.array(unit.to_string())
+    elif isinstance(example, (basestring, np.ndarray)) or \
+            not np.isscalar(example):
+        raise TypeError("Cannot store the {} attribute.".format(name))
+    elif present.all():
+        out["attr" + name] = np.array(values)
+    else:
+        out["attr" + name] = \
+            np.array([np.NaN if val is None else val for val in values],
+                     dtype=np.float64)
+
+    if not present.all():
+        out["attr" + name + "_flag"] = \
+            np.array([NOT_SET if name not in state else
+                      IS_NONE if state[name] is None else IS_SET
+                      for state in states], dtype=np.int8)
+
+    return out
+
+
+def write_bubble_file(filename, bubbles=[], regions=[], metadata=None):
+    '''
+    Write bubbles, groups of 2D regions and metadata to a single .npz file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the output file.
+    bubbles : list of Bubble2D or Bubble3D, optional
+        Bubbles to save.
+    regions : list of RegionTable, optional
+        Groups of 2D regions, e.g. the unclustered regions from
+        `~BubbleFinder.get_bubbles`.
+    metadata : dict, optional
+        Information about the run. Values can be anything JSON can store,
+        as well as Quantities, units and SkyCoords.
+    '''
+
+    arrays = {}
+    arrays["format_version"] = np.array(FORMAT_VERSION)
+    arrays["metadata"] = _to_json(metadata if metadata is not None else {})
+
+    states = [bub.__getstate__() for bub in bubbles]
+
+    names = set()
+    for bub, state in zip(bubbles, states):
+        if type(bub).__name__ not in BUBBLE_CLASSES:
+            raise TypeError("bubbles must be Bubble2D or Bubble3D objects.")
+        names.update(state.keys())
+
+    arrays["bubble_class"] = np.array([type(bub).__name__ for bub in bubbles])
+    arrays["bubble_units"] = \
+        _to_json([state.get("_units", {}) for state in states])
+
+    for name in sorted(names):
+        if name in RAGGED_ATTRS:
+            continue
+        arrays.update(_column(name, states))
+
+    shell_coords = [state.get("_shell_coords") for state in states]
+    widths = set(np.shape(coords)[1] for coords in shell_coords
+                 if coords is not None and len(coords) > 0)
+    if len(widths) > 1:
+        raise ValueError("All bubbles must have the same shell coordinate "
+                         "dimensions.")
+    width = widths.pop() if len(widths) > 0 else 2
+
+    arrays.update(_ragged_arrays("shell_coords", shell_coords, width))
+
+    if any("_twoD_regions" in state for state in states):
+        arrays.update(_table_arrays("bubble_regions",
+                                    [state.get("_twoD_regions") or []
+                                     for state in states]))
+
+    arrays.update(_table_arrays("regions", regions))
+
+    np.savez(filename, **arrays)
+
+
+def _memmap_member(filename, key):
+    '''
+    Memory-map an array stored in an uncompressed .npz file. Returns None
+    when this is not possible.
+    '''
+
+    with zipfile.ZipFile(filename) as zf:
+        info = zf.getinfo(key + ".npy")
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(filename, 'rb') as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_len, extra_len = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    shape, fortran_order, dtype = header
+
+    if dtype.hasobject or len(shape) == 0 or np.prod(shape) == 0:
+        return None
+
+    return np.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran_order else 'C', offset=offset)
+
+
+class BubbleFile(object):
+    """
+    Read a file written by `write_bubble_file`. Nothing is loaded until it
+    is accessed, and individual bubbles can be loaded by index.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the .npz file.
+    mmap : bool, optional
+        Memory-map the arrays in the file.
+    """
+    def __init__(self, filename, mmap=True):
+        super(BubbleFile, self).__init__()
+
+        self.filename = filename
+        self._npz = np.load(filename)
+        self._mmap = mmap
+        self._arrays = {}
+
+        version = int(self._array("format_version"))
+        if version > FORMAT_VERSION:
+            raise ValueError("{0} was written with a newer format version "
+                             "({1}).".format(filename, version))
+
+    def _array(self, key):
+        if key not in self._arrays:
+            arr = None
+            if self._mmap:
+                arr = _memmap_member(self.filename, key)
+            if arr is None:
+                arr = self._npz[key]
+            self._arrays[key] = arr
+
+        return self._arrays[key]
+
+    def _has(self, key):
+        return key in self._npz.files
+
+    def close(self):
+        self._arrays = {}
+        self._npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def metadata(self):
+        return _from_json(self._array("metadata"))
+
+    @property
+    def num_bubbles(self):
+        return len(self._array("bubble_class"))
+
+    def __len__(self):
+        return self.num_bubbles
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self._bubble(i)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if key < 0 or key >= len(self):
+                raise IndexError("Index out of range.")
+            return self._bubble(key)
+
+        return [self._bubble(i) for i in np.arange(len(self))[key]]
+
+    @property
+    def bubbles(self):
+        return list(self)
+
+    @property
+    def _attr_names(self):
+        return [key[4:] for key in self._npz.files
+                if key.startswith("attr_") and
+                not key.endswith("_flag") and not key.endswith("_unit")]
+
+    def _table(self, prefix, i):
+        '''
+        The ith RegionTable stored under prefix.
+        '''
+
+        offsets = self._array(prefix + "_offsets")
+        start, stop = offsets[i], offsets[i + 1]
+
+        shell_offsets = self._array(prefix + "_shell_offsets")
+
+        distance = self._distances(prefix)[i]
+
+        return RegionTable(np.array(self._array(prefix + "_data")[start:stop]),
+                           shell_coords=np.array(
+                               self._array(prefix + "_shell_coords")
+                               [shell_offsets[start]:shell_offsets[stop]]),
+                           offsets=shell_offsets[start:stop + 1] -
+                           shell_offsets[start],
+                           distance=distance)
+
+    def _distances(self, prefix):
+        key = prefix + "_distance_list"
+        if key not in self._arrays:
+            self._arrays[key] = _from_json(self._array(prefix + "_distance"))
+        return self._arrays[key]
+
+    def _bubble(self, i):
+        cls = BUBBLE_CLASSES[str(self._array("bubble_class")[i])]
+
+        state = {}
+
+        for name in self._attr_names:
+            key = "attr" + name
+            if self._has(key + "_flag"):
+                flag = self._array(key + "_flag")[i]
+                if flag == NOT_SET:
+                    continue
+                elif flag == IS_NONE:
+                    state[name] = None
+                    continue
+
+            value = self._array(key)[i]
+
+            if self._has(key + "_unit"):
+                state[name] = u.Quantity(np.array(value),
+                                         str(self._array(key + "_unit")))
+            else:
+                state[name] = value.item()
+
+        if "bubble_units_list" not in self._arrays:
+            self._arrays["bubble_units_list"] = \
+                _from_json(self._array("bubble_units"))
+        state["_units"] = \
+            dict((name, u.Unit(unit)) for name, unit in
+                 self._arrays["bubble_units_list"][i].items())
+
+        if self._array("shell_coords_present")[i]:
+            offsets = self._array("shell_coords_offsets")
+            state["_shell_coords"] = \
+                np.array(self._array("shell_coords")[offsets[i]:
+                                                     offsets[i + 1]])
+        else:
+            state["_shell_coords"] = None
+
+        if self._has("bubble_regions_data"):
+            state["_twoD_regions"] = self._table("bubble_regions", i)
+
+        bub = cls.__new__(cls)
+        bub.__setstate__(state)
+
+        return bub
+
+    @property
+    def num_region_groups(self):
+        return len(self._array("regions_offsets")) - 1
+
+    @property
+    def regions(self):
+        '''
+        The groups of 2D regions as a list of RegionTables.
+        '''
+        return [self._table("regions", i)
+                for i in xrange(self.num_region_groups)]
+
+    @property
+    def region_membership(self):
+        '''
+        Index of the bubble that each of the bubbles' 2D regions belongs to.
+        '''
+        if not self._has("bubble_regions_offsets"):
+            return np.empty(0, dtype=np.int)
+
+        offsets = self._array("bubble_regions_offsets")
+
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
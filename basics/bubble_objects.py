@@ -8,16 +8,20 @@ from astropy.wcs import WCS
 from astropy.coordinates import SkyCoord
 from spectral_cube.lower_dimensional_structures import LowerDimensionalObject
 from spectral_cube import SpectralCube
+from spectral_cube.spectral_axis import wcs_unit_scale
 from warnings import warn
 import cPickle as pickle
 from copy import deepcopy
 
 from log import overlap_metric
 from utils import (floor_int, ceil_int, wrap_to_pi, robust_skewed_std,
-                   check_give_beam)
+                   check_give_beam, masked_moments)
 from fan_pvslice import pv_wedge, warp_ellipse_to_circle
 from fit_models import fit_region
 from galaxy_utils import galactic_radius_pa, gal_props_checker
+from masking_utils import ChannelRangeMask
+from bubble_physics import (kinetic_age, shell_volume_density, hole_volume,
+                            hole_mass, formation_energy)
 
 
 def no_wcs_warning():
@@ -28,11 +32,203 @@ def no_distance_warning():
     warn("No distance was provided.")
 
 
+_unit_scales = {}
+
+
+def _unit_scale(from_unit, to_unit):
+    '''
+    Conversion factor between two units. Cached since the same conversions
+    are repeated for every bubble when making a catalog.
+    '''
+    try:
+        return _unit_scales[(from_unit, to_unit)]
+    except KeyError:
+        scale = from_unit.to(to_unit)
+        _unit_scales[(from_unit, to_unit)] = scale
+        return scale
+
+
+_column_density_unit = u.cm ** -2
+
+
+class CubeCoordinates(object):
+    """
+    World coordinate information for a cube. This is computed once and shared
+    between all of the bubbles found in the cube, so the spectral axis is
+    not recomputed and the WCS transform is only applied to the pixels
+    that are needed.
+
+    Parameters
+    ----------
+    cube : SpectralCube
+        Cube to take the WCS from.
+    """
+    def __init__(self, cube):
+        super(CubeCoordinates, self).__init__()
+
+        if not isinstance(cube, SpectralCube):
+            raise TypeError("cube must be a SpectralCube.")
+
+        self.wcs = cube.wcs
+        self.spatial_shape = cube.shape[1:]
+        self.spectral_axis = cube.spectral_axis
+
+        # Get the spatial pixel scales. Should be either of the first 2
+        # Also must be positive values, so no need for abs
+        self.spatial_pixel_scale = \
+            proj_plane_pixel_scales(self.wcs)[0] * u.deg
+
+        self._world_units = [u.Unit(unit) for unit in self.wcs.wcs.cunit]
+
+    def spatial_coordinates(self, yy, xx):
+        '''
+        Return the latitude and longitude of the given pixels. Matches
+        indexing `SpectralCube.spatial_coordinate_map` with yy, xx, so
+        negative indices count back from the end of the axis.
+        '''
+
+        yy, xx = np.broadcast_arrays(yy, xx)
+        yy = np.where(yy < 0, yy + self.spatial_shape[0], yy)
+        xx = np.where(xx < 0, xx + self.spatial_shape[1], xx)
+
+        pix = np.column_stack([xx.ravel(), yy.ravel(), np.zeros(xx.size)])
+        world = self.wcs.all_pix2world(pix, 0)
+
+        lon = world[:, 0].reshape(xx.shape) * self._world_units[0]
+        lat = world[:, 1].reshape(xx.shape) * self._world_units[1]
+
+        return lat, lon
+
+
 class BubbleNDBase(object):
     """
     Common properties between all cubes
+
+    Physical properties are stored as floats with their units kept in
+    `_units`. The Quantities are created when a property is first accessed
+    and are then cached.
     """
 
+    __slots__ = ("_y", "_x", "_major", "_minor", "_pa", "_channel_center",
+                 "_shell_coords", "_shell_fraction", "_hole_contrast",
+                 "_distance", "_ra", "_dec", "_ra_extents", "_dec_extents",
+                 "_major_angular", "_minor_angular", "_major_physical",
+                 "_minor_physical", "_velocity_start", "_velocity_end",
+                 "_velocity_center", "_vel_width", "_avg_shell_flux_density",
+                 "_total_shell_flux_density", "_shell_velocity_mean",
+                 "_shell_velocity_disp", "_galactic_radius", "_galactic_pa",
+                 "_units", "_quantity_cache", "_mask_cache")
+
+    # Properties computed from the stored values. Each returns the value and
+    # the unit.
+    _derived = \
+        {"pa": lambda self: (self._pa, u.rad),
+         "shell_fraction":
+         lambda self: (self._shell_fraction, u.dimensionless_unscaled),
+         "hole_contrast":
+         lambda self: (self._hole_contrast, u.dimensionless_unscaled),
+         "eccentricity":
+         lambda self: (self.major / float(self.minor),
+                       u.dimensionless_unscaled),
+         "diameter_physical":
+         lambda self: (2 * np.sqrt(self._major_physical *
+                                   self._minor_physical),
+                       self._units["major_physical"]),
+         "diameter_angular":
+         lambda self: (2 * np.sqrt(self._major_angular *
+                                   self._minor_angular),
+                       self._units["major_angular"]),
+         "shell_column_density":
+         lambda self: (1.823e18 * self._avg_shell_flux_density,
+                       _column_density_unit)}
+
+    def __init__(self):
+        super(BubbleNDBase, self).__init__()
+
+        self._units = {}
+        self._quantity_cache = {}
+        self._mask_cache = {}
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if name in ("_quantity_cache", "_mask_cache") or \
+                        not hasattr(self, name):
+                    continue
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        self._units = {}
+        self._quantity_cache = {}
+        self._mask_cache = {}
+
+        for name, value in state.items():
+            if name == "_units":
+                self._units.update(value)
+            # Older pickles stored the physical properties as Quantities.
+            elif isinstance(value, u.Quantity) and value.isscalar:
+                self._set_quantity(name[1:], value)
+            else:
+                setattr(self, name, value)
+
+    def _set_quantity(self, name, value):
+        '''
+        Store a scalar Quantity as a float and its unit.
+        '''
+        value = u.Quantity(value)
+        setattr(self, "_" + name, float(value.value))
+        self._units[name] = value.unit
+
+    def _raw(self, name):
+        if name in self._derived:
+            return self._derived[name](self)
+        return getattr(self, "_" + name), self._units[name]
+
+    def _quantity(self, name):
+        '''
+        Return the property as a Quantity. The Quantity is reused until the
+        stored value changes. It is read-only so the cached value cannot be
+        altered in-place.
+        '''
+        value, unit = self._raw(name)
+
+        cached = self._quantity_cache.get(name)
+        if cached is not None and cached[1] is unit and cached[0] == value:
+            return cached[2]
+
+        quant = u.Quantity(value, unit)
+        quant.flags.writeable = False
+        self._quantity_cache[name] = (value, unit, quant)
+
+        return quant
+
+    def raw_value(self, name, unit=None):
+        '''
+        Return the value of a property in the given unit without creating a
+        Quantity. Used for building catalogs of many bubbles.
+
+        Parameters
+        ----------
+        name : str
+            Name of the property.
+        unit : astropy.units.Unit, optional
+            Unit to return the value in. Defaults to the stored unit.
+        '''
+        if name not in self._derived and name not in self._units:
+            value = u.Quantity(getattr(self, name), dtype=np.float64)
+            if unit is None:
+                return value.value
+            return value.to(unit).value
+
+        value, from_unit = self._raw(name)
+
+        if unit is None or unit is from_unit:
+            return value
+
+        return value * _unit_scale(from_unit, unit)
+
     @property
     def params(self):
         return np.array([self._y, self._x, self._major,
@@ -52,7 +248,7 @@ class BubbleNDBase(object):
 
     @property
     def pa(self):
-        return self._pa * u.rad
+        return self._quantity("pa")
 
     @property
     def major(self):
@@ -61,13 +257,13 @@ class BubbleNDBase(object):
     @property
     def major_physical(self):
         if hasattr(self, "_major_physical"):
-            return self._major_physical
+            return self._quantity("major_physical")
         no_distance_warning()
 
     @property
     def major_angular(self):
         if self._major_angular is not None:
-            return self._major_angular
+            return self._quantity("major_angular")
         no_wcs_warning()
 
     @property
@@ -77,13 +273,13 @@ class BubbleNDBase(object):
     @property
     def minor_physical(self):
         if hasattr(self, "_minor_physical"):
-            return self._minor_physical
+            return self._quantity("minor_physical")
         no_distance_warning()
 
     @property
     def minor_angular(self):
         if self._minor_angular is not None:
-            return self._minor_angular
+            return self._quantity("minor_angular")
         no_wcs_warning()
 
     @property
@@ -92,25 +288,23 @@ class BubbleNDBase(object):
 
     @property
     def diameter_physical(self):
-        try:
-            return 2 * np.sqrt(self.major_physical * self.minor_physical)
-        except TypeError:
-            no_distance_warning()
+        if hasattr(self, "_major_physical"):
+            return self._quantity("diameter_physical")
+        no_distance_warning()
 
     @property
     def diameter_angular(self):
-        try:
-            return 2 * np.sqrt(self.major_angular * self.minor_angular)
-        except TypeError:
-            no_wcs_warning()
+        if hasattr(self, "_major_angular"):
+            return self._quantity("diameter_angular")
+        no_wcs_warning()
 
     @property
     def eccentricity(self):
-        return (self.major / float(self.minor)) * u.dimensionless_unscaled
+        return self._quantity("eccentricity")
 
     @property
     def distance(self):
-        return self._distance
+        return self._quantity("distance")
 
     @distance.setter
     def distance(self, value):
@@ -123,7 +317,7 @@ class BubbleNDBase(object):
             raise ValueError("distance must be given with an appropriate unit"
                              " of distance.")
 
-        self._distance = value.to(u.kpc)
+        self._set_quantity("distance", value.to(u.kpc))
 
     def set_galactic_properties(self, galaxy_props):
         '''
@@ -136,22 +330,23 @@ class BubbleNDBase(object):
 
         gal_props_checker(galaxy_props)
 
-        self._galactic_radius, self._galactic_pa = \
+        galactic_radius, galactic_pa = \
             galactic_radius_pa(self.center_coordinate,
                                galaxy_props["center_coord"],
                                self.distance,
                                galaxy_props["position_angle"],
                                galaxy_props["inclination"])
 
-        self._galactic_radius = self._galactic_radius.to(u.kpc)
+        self._set_quantity("galactic_radius", galactic_radius.to(u.kpc))
+        self._set_quantity("galactic_pa", galactic_pa)
 
     @property
     def galactic_radius(self):
-        return self._galactic_radius
+        return self._quantity("galactic_radius")
 
     @property
     def galactic_pa(self):
-        return self._galactic_pa
+        return self._quantity("galactic_pa")
 
     @property
     def center_coordinate(self):
@@ -160,7 +355,7 @@ class BubbleNDBase(object):
     @property
     def ra(self):
         if self._ra is not None:
-            return self._ra
+            return self._quantity("ra")
         no_wcs_warning()
 
     @property
@@ -172,7 +367,7 @@ class BubbleNDBase(object):
     @property
     def dec(self):
         if self._dec is not None:
-            return self._dec
+            return self._quantity("dec")
         no_wcs_warning()
 
     @property
@@ -205,7 +400,7 @@ class BubbleNDBase(object):
         '''
         Fraction of the region surrounded by a shell.
         '''
-        return self._shell_fraction * u.dimensionless_unscaled
+        return self._quantity("shell_fraction")
 
     @property
     def is_closed(self):
@@ -327,13 +522,18 @@ class BubbleNDBase(object):
 
     @property
     def hole_contrast(self):
-        return self._hole_contrast * u.dimensionless_unscaled
+        return self._quantity("hole_contrast")
 
     def set_wcs_props(self, data, spectral_unit=u.km / u.s,
-                      spatial_unit=u.deg):
+                      spatial_unit=u.deg, coordinates=None):
         '''
         Set the spatial and/or spectral extents of the bubble.
 
+        Parameters
+        ----------
+        coordinates : CubeCoordinates, optional
+            Pre-computed coordinate information for `data`. Pass this when
+            setting the properties of many bubbles from the same cube.
         '''
         if not spectral_unit.is_equivalent(u.m / u.s):
             raise u.UnitsError("spectral_unit must be in velocity units.")
@@ -343,40 +543,48 @@ class BubbleNDBase(object):
 
         if isinstance(data, SpectralCube):
 
-            self._ra = data.spatial_coordinate_map[1][self.center_pixel]
-            self._dec = data.spatial_coordinate_map[0][self.center_pixel]
+            if coordinates is None:
+                coordinates = CubeCoordinates(data)
+
+            dec, ra = coordinates.spatial_coordinates(*self.center_pixel)
+            self._set_quantity("ra", ra)
+            self._set_quantity("dec", dec)
 
             y_extents, x_extents = self.find_spatial_extents()
-            self._ra_extents = data.spatial_coordinate_map[1][np.c_[y_extents],
-                                                              np.c_[x_extents]]
-            self._dec_extents = \
-                data.spatial_coordinate_map[0][np.c_[y_extents],
-                                               np.c_[x_extents]]
-
-            self._velocity_start = \
-                data.spectral_axis[self.channel_start].to(spectral_unit)
-            self._velocity_end = \
-                data.spectral_axis[self.channel_end].to(spectral_unit)
-            self._velocity_center = \
-                data.spectral_axis[self.channel_center].to(spectral_unit)
-            self._vel_width = np.abs(data.spectral_axis[1] -
-                                     data.spectral_axis[0]).to(spectral_unit)
-
-            # Get the spatial pixel scales. Should be either of the first 2
-            # Also must be positive values, so no need for abs
-            spat_pix_scale = proj_plane_pixel_scales(data.wcs)[0] * u.deg
-
-            self._major_angular = \
-                (self.major * spat_pix_scale).to(spatial_unit)
-            self._minor_angular = \
-                (self.minor * spat_pix_scale).to(spatial_unit)
+            self._dec_extents, self._ra_extents = \
+                coordinates.spatial_coordinates(np.c_[y_extents],
+                                                np.c_[x_extents])
+
+            spectral_axis = coordinates.spectral_axis
+
+            self._set_quantity("velocity_start",
+                               spectral_axis[self.channel_start].
+                               to(spectral_unit))
+            self._set_quantity("velocity_end",
+                               spectral_axis[self.channel_end].
+                               to(spectral_unit))
+            self._set_quantity("velocity_center",
+                               spectral_axis[self.channel_center].
+                               to(spectral_unit))
+            self._set_quantity("vel_width",
+                               np.abs(spectral_axis[1] -
+                                      spectral_axis[0]).to(spectral_unit))
+
+            spat_pix_scale = coordinates.spatial_pixel_scale
+
+            self._set_quantity("major_angular",
+                               (self.major * spat_pix_scale).to(spatial_unit))
+            self._set_quantity("minor_angular",
+                               (self.minor * spat_pix_scale).to(spatial_unit))
 
             # Now set the physical distances, if there distance has been given
             if hasattr(self, "_distance"):
                 phys_pix_scale = spat_pix_scale.value * (np.pi / 180.) * \
                     self.distance.to(u.pc)
-                self._major_physical = self.major * phys_pix_scale
-                self._minor_physical = self.minor * phys_pix_scale
+                self._set_quantity("major_physical",
+                                   self.major * phys_pix_scale)
+                self._set_quantity("minor_physical",
+                                   self.minor * phys_pix_scale)
 
         elif isinstance(data, LowerDimensionalObject):
             # At some point, the 2D LDO will also have a
@@ -388,7 +596,7 @@ class BubbleNDBase(object):
 
     def set_shell_properties(self, data, mask, flux_unit=u.K * u.km / u.s,
                              rest_freq=1.141 * u.GHz, linewidth=None,
-                             **shell_kwargs):
+                             use_spectral_cube=False, **shell_kwargs):
         '''
         Get the properties of the shell
 
@@ -400,6 +608,10 @@ class BubbleNDBase(object):
             shell mask, but for coarse velocity resolution this is **NOT A
             GOOD APPROXIMATION** and will lead to sever underestimations.
             Assumed to be in m/s.
+        use_spectral_cube : bool, optional
+            Compute the moments with SpectralCube. By default, the moments
+            are computed directly from the shell data with
+            `~basics.utils.masked_moments`, which gives identical results.
 
         '''
 
@@ -427,17 +639,36 @@ class BubbleNDBase(object):
                                minimal_shape=minimal_shape,
                                **shell_kwargs)
 
-        # Apply the mask, then cut to its extents
-        shell_cube = data[slices].with_mask(shell_mask).minimal_subcube()
-        # Once 2D is supported, need extra if/else for minimal_sub-something
+        if use_spectral_cube:
+            # Apply the mask, then cut to its extents
+            shell_cube = data[slices].with_mask(shell_mask).minimal_subcube()
+            # Once 2D is supported, need extra if/else for
+            # minimal_sub-something
+
+            # Can't just use mom0.mean() right now until this issue is dealt
+            # with:
+            # https://github.com/radio-astro-tools/spectral-cube/issues/279
+            # Actually it's even worse than that: nanmean won't work with
+            # Projections... Lazy work around it to convert to a Quantity
+            mom0 = u.Quantity(shell_cube.moment0())
+            if linewidth is None:
+                half_lwidth = u.Quantity(0.5 * shell_cube.linewidth_fwhm())
+            mom1 = u.Quantity(shell_cube.moment1())
+        else:
+            spectral_axis = data.spectral_axis
+            channel_width = np.abs(data.wcs.pixel_scale_matrix[2, 2]) * \
+                wcs_unit_scale(spectral_axis.unit)
+
+            mom0, mom1, lwidth = \
+                masked_moments(data.filled_data[slices].value, shell_mask,
+                               spectral_axis[slices[0]].value, channel_width)
 
-        # Can't just use mom0.mean() right now until this issue is dealt with:
-        # https://github.com/radio-astro-tools/spectral-cube/issues/279
-        # Actually it's even worse than that: nanmean won't work with
-        # Projections... Lazy work around it to convert to a Quantity
-        mom0 = u.Quantity(shell_cube.moment0())
-        self._avg_shell_flux_density = np.nanmean(mom0)
-        self._total_shell_flux_density = np.nansum(mom0)
+            mom0 = mom0 * data.unit * spectral_axis.unit
+            mom1 = mom1 * spectral_axis.unit
+            half_lwidth = 0.5 * (lwidth * spectral_axis.unit)
+
+        avg_shell_flux_density = np.nanmean(mom0)
+        total_shell_flux_density = np.nansum(mom0)
 
         if not flux_unit.is_equivalent(mom0.unit):
             # I'm going to assume that this case should only arise when
@@ -455,24 +686,24 @@ class BubbleNDBase(object):
 
             # Only supporting units equivalent to K km/s
             if flux_unit.is_equivalent(u.K * u.m / u.s):
-                self._avg_shell_flux_density = \
-                    (self._avg_shell_flux_density * jtok / u.Jy).to(flux_unit)
-                self._total_shell_flux_density = \
-                    (self._total_shell_flux_density * jtok /
-                     u.Jy).to(flux_unit)
+                avg_shell_flux_density = \
+                    (avg_shell_flux_density * jtok / u.Jy).to(flux_unit)
+                total_shell_flux_density = \
+                    (total_shell_flux_density * jtok / u.Jy).to(flux_unit)
             else:
                 raise TypeError("Only support conversion to units equivalent"
                                 " to K km/s.")
         else:
-            self._avg_shell_flux_density = \
-                self._avg_shell_flux_density.to(flux_unit)
-            self._total_shell_flux_density = \
-                self._total_shell_flux_density.to(flux_unit)
+            avg_shell_flux_density = avg_shell_flux_density.to(flux_unit)
+            total_shell_flux_density = total_shell_flux_density.to(flux_unit)
+
+        self._set_quantity("avg_shell_flux_density", avg_shell_flux_density)
+        self._set_quantity("total_shell_flux_density",
+                           total_shell_flux_density)
 
         # In 3D, set the velocity properties
         if isinstance(self, Bubble3D):
-            self._shell_velocity_mean = \
-                np.nanmean(u.Quantity(shell_cube.moment1()))
+            self._set_quantity("shell_velocity_mean", np.nanmean(mom1))
             # Define the dispersion as half the FWHM linewidth
             if linewidth is not None:
                 # It is assumed that an appropriate mask was already applied
@@ -486,24 +717,24 @@ class BubbleNDBase(object):
                                        include_center=False,
                                        shape=linewidth.shape,
                                        **shell_kwargs)
-                self._shell_velocity_disp = \
-                    np.nanmean(u.Quantity(linewidth[slices]))
+                self._set_quantity("shell_velocity_disp",
+                                   np.nanmean(u.Quantity(linewidth[slices])))
 
             else:
-                self._shell_velocity_disp = \
-                    np.nanmean(u.Quantity(0.5 * shell_cube.linewidth_fwhm()))
+                self._set_quantity("shell_velocity_disp",
+                                   np.nanmean(half_lwidth))
 
     @property
     def avg_shell_flux_density(self):
-        return self._avg_shell_flux_density
+        return self._quantity("avg_shell_flux_density")
 
     @property
     def total_shell_flux_density(self):
-        return self._total_shell_flux_density
+        return self._quantity("total_shell_flux_density")
 
     @property
     def shell_column_density(self):
-        return 1.823e18 * self.avg_shell_flux_density.value / u.cm**2
+        return self._quantity("shell_column_density")
 
     def as_ellipse(self, zero_center=True, extend_factor=1):
         '''
@@ -525,12 +756,66 @@ class BubbleNDBase(object):
         return Ellipse2D(True, self.x, self.y, major, minor,
                          self.pa)
 
+    def _cached_footprint(self, key, model, extent_model, shape,
+                          minimal_shape):
+        '''
+        Rasterize a 2D model, either within the bounding box of extent_model
+        or over the given shape. The result is cached on the bubble until
+        its parameters change.
+
+        Returns
+        -------
+        twoD_mask : np.ndarray
+            Read-only boolean footprint.
+        yextents, xextents : tuples
+            Extents of the footprint.
+        '''
+
+        params = (self._y, self._x, self._major, self._minor, self._pa)
+        if self._mask_cache.get("params") != params:
+            self._mask_cache = {"params": params}
+
+        if key in self._mask_cache:
+            return self._mask_cache[key]
+
+        if minimal_shape or shape is None:
+            bbox = extent_model.bounding_box
+            yextents = (floor_int(bbox[0][0]), ceil_int(bbox[0][1]) + 1)
+            xextents = (floor_int(bbox[1][0]), ceil_int(bbox[1][1]) + 1)
+
+            yy, xx = np.ogrid[yextents[0]: yextents[1],
+                              xextents[0]: xextents[1]]
+        else:
+            if len(shape) == 2:
+                yshape, xshape = shape
+            elif len(shape) == 3:
+                yshape, xshape = shape[1:]
+            else:
+                raise TypeError("shape must be for 2D or 3D.")
+            yextents = (0, yshape)
+            xextents = (0, xshape)
+
+            yy, xx = np.ogrid[:yshape, :xshape]
+
+        # The models do not broadcast open grids, but views are enough
+        yy, xx = np.broadcast_arrays(yy, xx)
+
+        twoD_mask = model(xx, yy).astype(np.bool)
+        twoD_mask.flags.writeable = False
+
+        self._mask_cache[key] = (twoD_mask, yextents, xextents)
+
+        return self._mask_cache[key]
+
     def as_mask(self, mask=None, shape=None, zero_center=False,
                 spectral_extent=False, use_twoD_regions=False,
                 minimal_shape=False):
         '''
         Return a boolean mask of the 2D region.
 
+        When no mask is given, the 2D mask is a read-only array and a 3D
+        mask is returned as a `~basics.masking_utils.ChannelRangeMask`.
+
         Parameters
         ----------
         shape : tuple, optional
@@ -552,31 +837,14 @@ class BubbleNDBase(object):
 
         model_ellipse = self.as_ellipse(zero_center=False)
 
-        if minimal_shape or shape is None:
-            bbox = model_ellipse.bounding_box
-            yextents = (floor_int(bbox[0][0]), ceil_int(bbox[0][1]) + 1)
-            xextents = (floor_int(bbox[1][0]), ceil_int(bbox[1][1]) + 1)
-        else:
-            if len(shape) == 2:
-                yshape, xshape = shape
-            elif len(shape) == 3:
-                yshape, xshape = shape[1:]
-            else:
-                raise TypeError("shape must be for 2D or 3D.")
-            yextents = (0, yshape)
-            xextents = (0, xshape)
+        key = ("hole", shape if not minimal_shape else None,
+               minimal_shape or shape is None)
 
-        # Returns the bbox shape. Forces zero_center to be True
-        if shape is None or minimal_shape:
-            yy, xx = np.mgrid[yextents[0]: yextents[1],
-                              xextents[0]: xextents[1]]
-        else:
-            yy, xx = np.mgrid[:yshape, :xshape]
+        twoD_mask, yextents, xextents = \
+            self._cached_footprint(key, model_ellipse, model_ellipse, shape,
+                                   minimal_shape)
 
-        yshape = yy.shape[0]
-        xshape = yy.shape[1]
-
-        twoD_mask = model_ellipse(xx, yy).astype(np.bool)
+        yshape, xshape = twoD_mask.shape
 
         # Just return the 2D footprint
         if mask is not None:
@@ -620,14 +888,8 @@ class BubbleNDBase(object):
                                        zero_center=zero_center,
                                        minimal_shape=False)
             else:
-                region_mask = np.tile(twoD_mask, (nchans, 1, 1))
-
-                # Now blank the channels where the mask isn't there
-                region_mask[:start] = \
-                    np.zeros((start, yshape, xshape), dtype=bool)
-                region_mask[end:] = \
-                    np.zeros((nchans - end, yshape, xshape),
-                             dtype=bool)
+                region_mask = ChannelRangeMask(twoD_mask, nchans, start=start,
+                                               end=end)
 
             if minimal_shape:
                 slices = (slice(self.channel_start, self.channel_end + 1), ) \
@@ -639,7 +901,7 @@ class BubbleNDBase(object):
         # The hole masks are defined where there isn't signal, so multiple by
         # not mask
         if mask is not None:
-            region_mask *= mask[slices]
+            region_mask = region_mask & mask[slices]
 
         if minimal_shape:
             return region_mask, slices
@@ -676,6 +938,9 @@ class BubbleNDBase(object):
         '''
         Realize the shell region as a boolean mask.
 
+        When no mask is given, the 2D mask is a read-only array and a 3D
+        mask is returned as a `~basics.masking_utils.ChannelRangeMask`.
+
         Parameters
         ----------
         include_center : bool, optional
@@ -695,7 +960,9 @@ class BubbleNDBase(object):
             raise NotImplementedError("Issues with defining a single grid for"
                                       " each local region.")
 
-        if include_center and mask is not None:
+        with_center = include_center and mask is not None
+
+        if with_center:
             model_shell = \
                 self.as_ellipse(zero_center=zero_center,
                                 extend_factor=np.sqrt(area_factor))
@@ -706,33 +973,18 @@ class BubbleNDBase(object):
                 self.as_shell_annulus(zero_center=zero_center,
                                       area_factor=area_factor)
 
-        if minimal_shape or shape is None:
-            bbox = self.as_ellipse(zero_center=False,
-                                   extend_factor=np.sqrt(area_factor)).\
-                bounding_box
-            yextents = (floor_int(bbox[0][0]), ceil_int(bbox[0][1]) + 1)
-            xextents = (floor_int(bbox[1][0]), ceil_int(bbox[1][1]) + 1)
-        else:
-            if len(shape) == 2:
-                yshape, xshape = shape
-            elif len(shape) == 3:
-                yshape, xshape = shape[1:]
-            else:
-                raise TypeError("shape must be for 2D or 3D.")
-            yextents = (0, yshape)
-            xextents = (0, xshape)
-
-        # Returns the bbox shape. Forces zero_center to be True
-        if shape is None or minimal_shape:
-            yy, xx = np.mgrid[yextents[0]: yextents[1],
-                              xextents[0]: xextents[1]]
-        else:
-            yy, xx = np.mgrid[:yshape, :xshape]
+        key = ("shell", shape if not minimal_shape else None,
+               minimal_shape or shape is None, area_factor, with_center,
+               zero_center)
 
-        yshape = yy.shape[0]
-        xshape = yy.shape[1]
+        twoD_mask, yextents, xextents = \
+            self._cached_footprint(key, model_shell,
+                                   self.as_ellipse(zero_center=False,
+                                                   extend_factor=np.sqrt(
+                                                       area_factor)),
+                                   shape, minimal_shape)
 
-        twoD_mask = model_shell(xx, yy).astype(np.bool)
+        yshape, xshape = twoD_mask.shape
 
         # Just return the 2D footprint
         if mask is not None:
@@ -776,14 +1028,8 @@ class BubbleNDBase(object):
                                        zero_center=zero_center,
                                        minimal_shape=False)
             else:
-                shell_mask = np.tile(twoD_mask, (nchans, 1, 1))
-
-                # Now blank the channels where the mask isn't there
-                shell_mask[:start] = \
-                    np.zeros((start, yshape, xshape), dtype=bool)
-                shell_mask[end:] = \
-                    np.zeros((nchans - end, yshape, xshape),
-                             dtype=bool)
+                shell_mask = ChannelRangeMask(twoD_mask, nchans, start=start,
+                                              end=end)
 
             if minimal_shape:
                 slices = (slice(self.channel_start, self.channel_end + 1), ) \
@@ -795,7 +1041,7 @@ class BubbleNDBase(object):
         # The hole masks are defined where there isn't signal, so multiple by
         # not mask
         if mask is not None:
-            shell_mask *= ~mask[slices]
+            shell_mask = shell_mask & ~mask[slices]
 
         if minimal_shape:
             return shell_mask, slices
@@ -846,6 +1092,9 @@ class Bubble2D(BubbleNDBase):
     """
     Class for candidate bubble portions from 2D planes.
     """
+
+    __slots__ = ("_peak_response", "_angular_std", "_model_residual")
+
     def __init__(self, props, shell_coords=None, channel=None, data=None,
                  distance=None):
         super(Bubble2D, self).__init__()
@@ -878,6 +1127,19 @@ class Bubble2D(BubbleNDBase):
         else:
             self._channel_center = 0
 
+    def shift(self, yoffset, xoffset):
+        '''
+        Translate the region by the given pixel offsets. Used to map regions
+        found in a cut-out back onto the full image.
+        '''
+
+        self._y += yoffset
+        self._x += xoffset
+
+        if self._shell_coords is not None:
+            self._shell_coords = \
+                self._shell_coords + np.array([yoffset, xoffset])
+
     def profile_lines(self, array, **kwargs):
         '''
         Calculate radial profile lines of the 2D bubbles.
@@ -933,6 +1195,321 @@ class Bubble2D(BubbleNDBase):
         return s
 
 
+class RegionTable(object):
+    """
+    Columnar store for a collection of 2D regions.
+
+    The region properties are kept in a structured array, and the shell
+    coordinates of all regions are concatenated into a single array that is
+    indexed by offsets. Bubble2D objects are only created when a region is
+    accessed by its index or when iterating through the table.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Structured array with the fields in `RegionTable.columns`.
+    shell_coords : np.ndarray, optional
+        (N, 2) array of the y, x shell coordinates for all regions.
+    offsets : np.ndarray, optional
+        Position where each region's coordinates start in `shell_coords`.
+        Has one more element than the number of regions.
+    distance : Quantity, optional
+        Distance passed to the Bubble2D objects.
+    """
+
+    columns = ("y", "x", "major", "minor", "pa", "channel", "peak_response",
+               "shell_fraction", "angular_std", "model_residual")
+
+    dtype = np.dtype([(name, np.float64) for name in columns])
+
+    def __init__(self, data, shell_coords=None, offsets=None, distance=None):
+        super(RegionTable, self).__init__()
+
+        if data.dtype != self.dtype:
+            raise TypeError("data must be a structured array with "
+                            "RegionTable.dtype.")
+
+        if shell_coords is None:
+            shell_coords = np.empty((0, 2), dtype=np.float64)
+            offsets = np.zeros(len(data) + 1, dtype=np.int)
+
+        if len(offsets) != len(data) + 1:
+            raise IndexError("offsets must have one more element than the "
+                             "number of regions.")
+
+        self._data = data
+        self._shell_coords = shell_coords
+        self._offsets = offsets
+        self.distance = distance
+
+    @staticmethod
+    def from_arrays(props, coords=None, channel=None, distance=None):
+        '''
+        Create a table from an array of region properties.
+
+        Parameters
+        ----------
+        props : np.ndarray
+            (n, 5) or (n, 9) array of properties, ordered the same as the
+            `props` given to Bubble2D.
+        coords : list of np.ndarray, optional
+            The shell coordinates of each region.
+        channel : int, optional
+            Channel of the regions.
+        '''
+
+        props = np.atleast_2d(np.asarray(props, dtype=np.float64))
+        if props.size == 0:
+            props = props.reshape((0, 9))
+
+        data = np.empty(props.shape[0], dtype=RegionTable.dtype)
+        data.fill(np.NaN)
+
+        for i, name in enumerate(RegionTable.columns[:5]):
+            data[name] = props[:, i]
+
+        # > 5, some shell properties were included
+        if props.shape[1] > 5:
+            for i, name in enumerate(RegionTable.columns[6:]):
+                data[name] = props[:, i + 5]
+
+        data["channel"] = 0 if channel is None else channel
+
+        if coords is None:
+            return RegionTable(data, distance=distance)
+
+        counts = np.array([len(coord) for coord in coords], dtype=np.int)
+        offsets = np.append(0, np.cumsum(counts))
+
+        if offsets[-1] == 0:
+            shell_coords = np.empty((0, 2), dtype=np.float64)
+        else:
+            shell_coords = \
+                np.vstack([np.asarray(coord, dtype=np.float64).reshape(-1, 2)
+                           for coord in coords if len(coord) > 0])
+
+        return RegionTable(data, shell_coords=shell_coords, offsets=offsets,
+                           distance=distance)
+
+    @staticmethod
+    def from_regions(regions):
+        '''
+        Create a table from a list of Bubble2D objects.
+        '''
+
+        if isinstance(regions, RegionTable):
+            return regions
+
+        for reg in regions:
+            if not isinstance(reg, Bubble2D):
+                raise TypeError("regions must all be Bubble2D objects.")
+
+        data = np.empty(len(regions), dtype=RegionTable.dtype)
+        data.fill(np.NaN)
+
+        attrs = ("_y", "_x", "_major", "_minor", "_pa", "_channel_center",
+                 "_peak_response", "_shell_fraction", "_angular_std",
+                 "_model_residual")
+
+        for name, attr in zip(RegionTable.columns, attrs):
+            data[name] = [getattr(reg, attr, np.NaN) for reg in regions]
+
+        coords = [reg.shell_coords if reg.shell_coords is not None else []
+                  for reg in regions]
+
+        distance = None
+        if len(regions) > 0 and hasattr(regions[0], "_distance"):
+            distance = regions[0].distance
+
+        table = RegionTable.from_arrays(np.empty((len(regions), 5)), coords,
+                                        distance=distance)
+        table._data = data
+
+        return table
+
+    @staticmethod
+    def concatenate(tables):
+        '''
+        Join a list of tables into one.
+        '''
+
+        tables = [RegionTable.from_regions(table) for table in tables]
+
+        if len(tables) == 0:
+            return RegionTable(np.empty(0, dtype=RegionTable.dtype))
+
+        data = np.concatenate([table._data for table in tables])
+        shell_coords = np.vstack([table._shell_coords for table in tables])
+
+        counts = np.concatenate([np.diff(table._offsets) for table in tables])
+        offsets = np.append(0, np.cumsum(counts))
+
+        distance = None
+        for table in tables:
+            if table.distance is not None:
+                distance = table.distance
+                break
+
+        return RegionTable(data, shell_coords=shell_coords, offsets=offsets,
+                           distance=distance)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self._region(i)
+
+    def __getitem__(self, key):
+        '''
+        Return a column for a string, a Bubble2D for an integer and a new
+        RegionTable for slices and index or boolean arrays.
+        '''
+
+        if isinstance(key, basestring):
+            return self._data[key]
+
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if key < 0 or key >= len(self):
+                raise IndexError("Index out of range.")
+            return self._region(key)
+
+        if isinstance(key, slice):
+            idx = np.arange(len(self))[key]
+        else:
+            idx = np.asarray(key)
+            if idx.dtype == np.bool:
+                idx = np.where(idx)[0]
+            idx = idx.astype(np.int)
+
+        counts = np.diff(self._offsets)[idx]
+        starts = self._offsets[:-1][idx]
+        offsets = np.append(0, np.cumsum(counts))
+
+        posns = np.repeat(starts - offsets[:-1], counts) + \
+            np.arange(offsets[-1])
+
+        return RegionTable(self._data[idx],
+                           shell_coords=self._shell_coords[posns],
+                           offsets=offsets, distance=self.distance)
+
+    def _region(self, i):
+        '''
+        Create the Bubble2D object for one row.
+        '''
+
+        row = self._data[i]
+
+        props = [row[name] for name in self.columns[:5]]
+        if np.isfinite(row["shell_fraction"]):
+            props.extend([row[name] for name in self.columns[6:]])
+
+        return Bubble2D(props, shell_coords=self.shell_coords(i),
+                        channel=int(row["channel"]), distance=self.distance)
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def params(self):
+        '''
+        Same as stacking the `params` of each region.
+        '''
+        return np.column_stack([self._data[name] for name in
+                                self.columns[:6]]).reshape((len(self), 6))
+
+    def shell_coords(self, i):
+        '''
+        Shell coordinates of the ith region.
+        '''
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        if start == stop:
+            return None
+        return self._shell_coords[start:stop]
+
+    def all_shell_coords(self, include_channel=False):
+        '''
+        The shell coordinates of all regions. With include_channel, the
+        channel of each region is added as the first column.
+        '''
+        if not include_channel:
+            return self._shell_coords
+
+        chans = np.repeat(self._data["channel"], np.diff(self._offsets))
+
+        return np.column_stack([chans, self._shell_coords])
+
+    def shift(self, yoffset, xoffset):
+        '''
+        Translate all regions by the given pixel offsets.
+        '''
+
+        self._data["y"] += yoffset
+        self._data["x"] += xoffset
+
+        self._shell_coords = \
+            self._shell_coords + np.array([yoffset, xoffset])
+
+    def profile_lines(self, array, chunk_size=100, **kwargs):
+        '''
+        Radial profiles of all of the regions from one image (i.e., the
+        channel the regions were found in). See
+        `~basics.profile.radial_profile_array` for the keywords and the
+        returned arrays.
+
+        The regions are grouped by major radius into chunks of
+        `chunk_size`, so the profiles are only padded to the longest ray
+        within each chunk while they are computed. Set to None to compute
+        all of the regions at once. Samples beyond the end of a ray are NaN
+        and not valid.
+        '''
+
+        from basics.profile import radial_profile_array
+
+        params = self.params[:, :5]
+        num = len(params)
+
+        if chunk_size is None or num <= chunk_size:
+            return radial_profile_array(array, params, **kwargs)
+
+        order = np.argsort(params[:, 2], kind='mergesort')
+        starts = range(0, num, chunk_size)
+
+        chunks = [radial_profile_array(array,
+                                       params[order[start:start + chunk_size]],
+                                       **kwargs)
+                  for start in starts]
+
+        ntheta = chunks[0][0].shape[1]
+        nr = max([chunk[0].shape[2] for chunk in chunks])
+
+        profiles = np.empty((num, ntheta, nr)) * np.NaN
+        dists = np.empty((num, ntheta, nr)) * np.NaN
+        valid = np.zeros((num, ntheta, nr), dtype=bool)
+        end_pts = np.empty((num, ntheta, 2))
+
+        for start, chunk in zip(starts, chunks):
+            idx = order[start:start + chunk_size]
+            chunk_nr = chunk[0].shape[2]
+
+            profiles[idx, :, :chunk_nr] = chunk[0]
+            dists[idx, :, :chunk_nr] = chunk[1]
+            valid[idx, :, :chunk_nr] = chunk[2]
+            end_pts[idx] = chunk[3]
+
+        # The thetas are the same for all chunks
+        return (profiles, dists, valid, end_pts) + chunks[0][4:]
+
+    def to_regions(self):
+        '''
+        Return a list of Bubble2D objects.
+        '''
+        return list(self)
+
+
 class Bubble3D(BubbleNDBase):
     """
     3D Bubbles.
@@ -941,10 +1518,25 @@ class Bubble3D(BubbleNDBase):
     ----------
     cube : SpectralCube
         Uses the cube to find the spatial and spectral extents of the bubble.
+    coordinates : CubeCoordinates, optional
+        Pre-computed coordinate information for the cube. See
+        `~BubbleNDBase.set_wcs_props`.
     """
+
+    __slots__ = ("_channel_start", "_channel_end", "_twoD_regions",
+                 "_bubble_type", "_expansion_velocity")
+
+    _derived = \
+        dict(BubbleNDBase._derived,
+             velocity_width=lambda self: (self.channel_width *
+                                          self._vel_width,
+                                          self._units["vel_width"]),
+             bubble_type=lambda self: (self._bubble_type,
+                                       u.dimensionless_unscaled))
+
     def __init__(self, props, cube=None, twoD_regions=None, mask=None,
                  distance=None, sigma=None, linewidth=None,
-                 galaxy_kwargs={}, bubble_kwargs={}):
+                 galaxy_kwargs={}, bubble_kwargs={}, coordinates=None):
         super(Bubble3D, self).__init__()
 
         self._y = props[0]
@@ -964,44 +1556,39 @@ class Bubble3D(BubbleNDBase):
         if twoD_regions is not None:
             # Define the shell fraction as the maximum from the 2D regions.
             # There is some cool stuff to be done with
-            fracs = np.array([reg.shell_fraction for reg in self.twoD_regions])
-            self._shell_fraction = np.max(fracs)
+            self._shell_fraction = \
+                np.max(self.twoD_regions["shell_fraction"])
 
         if cube is not None:
-            self.set_wcs_props(cube)
+            self.set_wcs_props(cube, coordinates=coordinates)
 
         # Set the bubble type
         if cube is not None and mask is not None:
-            self.find_bubble_type(cube, mask, **bubble_kwargs)
-            self.set_shell_properties(cube, mask, linewidth=linewidth)
+            self.set_cube_properties(cube, mask, sigma=sigma,
+                                     linewidth=linewidth,
+                                     bubble_kwargs=bubble_kwargs)
             self.find_expansion_velocity()
-            self.find_hole_contrast(cube, mask=mask, noise_std=sigma)
             self.set_galactic_properties(galaxy_kwargs)
 
     @staticmethod
     def from_2D_regions(twod_region_list, refit=True,
                         cube=None, mask=None, distance=None, sigma=None,
-                        linewidth=None, galaxy_kwargs={},
+                        linewidth=None, galaxy_kwargs={}, coordinates=None,
                         **fit_kwargs):
         '''
         Create a 3D regions from a collection of 2D regions.
         '''
 
-        # Extract the 2D properties
-        twoD_properties = \
-            np.array([bub2D.params for bub2D in twod_region_list])
+        twod_region_list = RegionTable.from_regions(twod_region_list)
 
         # Sort by channel
         twod_region_list = \
-            [twod_region_list[i] for i in twoD_properties[:, -1].argsort()]
+            twod_region_list[twod_region_list["channel"].argsort()]
 
-        all_coords = []
-        for reg in twod_region_list:
-            chan_coord = reg.channel_center * \
-                np.ones((reg.shell_coords.shape[0], 1))
-            all_coords.append(np.hstack([chan_coord, reg.shell_coords]))
+        # Extract the 2D properties
+        twoD_properties = twod_region_list.params
 
-        all_coords = np.vstack(all_coords)
+        all_coords = twod_region_list.all_shell_coords(include_channel=True)
 
         if refit:
             props, resid = fit_region(all_coords[:, 1:], **fit_kwargs)
@@ -1032,19 +1619,91 @@ class Bubble3D(BubbleNDBase):
                         twoD_regions=twod_region_list,
                         distance=distance, sigma=sigma,
                         linewidth=linewidth,
-                        galaxy_kwargs=galaxy_kwargs)
+                        galaxy_kwargs=galaxy_kwargs,
+                        coordinates=coordinates)
 
         self._shell_coords = all_coords
 
         return self
 
+    def set_cube_properties(self, cube, mask, sigma=None, linewidth=None,
+                            bubble_kwargs={}):
+        '''
+        Find the properties that depend on the cube values: the bubble type,
+        the shell properties and the hole contrast. None of these depend on
+        the WCS, so a spatial cut-out of the cube can be given when the
+        bubble has been shifted into the cut-out's frame (see
+        `~Bubble3D.cutout_slices`).
+        '''
+
+        self.find_bubble_type(cube, mask, **bubble_kwargs)
+        self.set_shell_properties(cube, mask, linewidth=linewidth)
+        self.find_hole_contrast(cube, mask=mask, noise_std=sigma)
+
+    def cutout_slices(self, shape, area_factor=2):
+        '''
+        Spatial slices containing all of the pixels used in
+        `~Bubble3D.set_cube_properties`, which is the bounding box of the
+        shell region.
+
+        Where the bounding box extends below zero, the whole axis is kept.
+        Slicing with a negative start counts from the end of the axis, which
+        would give a different result in a cut-out.
+
+        Parameters
+        ----------
+        shape : tuple
+            Spatial shape of the cube.
+        area_factor : float, optional
+            Area factor of the shell region. Must match the area factor used
+            for the shell masks.
+
+        Returns
+        -------
+        slices : tuple of slices
+            The y and x slices.
+        '''
+
+        bbox = self.as_ellipse(zero_center=False,
+                               extend_factor=np.sqrt(area_factor)).bounding_box
+
+        slices = []
+        for (low, high), size in zip(bbox, shape):
+            low = floor_int(low)
+            high = ceil_int(high) + 1
+            if low < 0:
+                slices.append(slice(0, size))
+            else:
+                slices.append(slice(min(low, size), min(high, size)))
+
+        return tuple(slices)
+
+    def shift(self, yoffset, xoffset):
+        '''
+        Translate the bubble, its shell coordinates and its 2D regions by the
+        given pixel offsets.
+        '''
+
+        self._y += yoffset
+        self._x += xoffset
+
+        if getattr(self, "_shell_coords", None) is not None:
+            self._shell_coords = \
+                self._shell_coords + np.array([0, yoffset, xoffset])
+
+        if self.twoD_regions is not None:
+            self.twoD_regions.shift(yoffset, xoffset)
+
     @property
     def twoD_regions(self):
+        # Bubbles saved before the regions were stored in a table
+        if isinstance(self._twoD_regions, list):
+            self._twoD_regions = RegionTable.from_regions(self._twoD_regions)
         return self._twoD_regions
 
     @twoD_regions.setter
     def twoD_regions(self, input_list):
-        if input_list is not None:
+        if input_list is not None and not isinstance(input_list, RegionTable):
             for reg in input_list:
                 if isinstance(reg, Bubble2D):
                     continue
@@ -1052,6 +1711,8 @@ class Bubble3D(BubbleNDBase):
                 raise TypeError("twoD_regions must be a list of Bubble2D"
                                 " objects")
 
+            input_list = RegionTable.from_regions(input_list)
+
         self._twoD_regions = input_list
 
     @property
@@ -1061,25 +1722,25 @@ class Bubble3D(BubbleNDBase):
     @property
     def velocity_start(self):
         if self._velocity_start is not None:
-            return self._velocity_start
+            return self._quantity("velocity_start")
         no_wcs_warning()
 
     @property
     def velocity_end(self):
         if self._velocity_end is not None:
-            return self._velocity_end
+            return self._quantity("velocity_end")
         no_wcs_warning()
 
     @property
     def velocity_center(self):
         if self._velocity_center is not None:
-            return self._velocity_center
+            return self._quantity("velocity_center")
         no_wcs_warning()
 
     @property
     def velocity_width(self):
         if self._vel_width is not None:
-            return self.channel_width * self._vel_width
+            return self._quantity("velocity_width")
         no_wcs_warning()
 
     @property
@@ -1096,15 +1757,15 @@ class Bubble3D(BubbleNDBase):
 
     @property
     def shell_velocity_mean(self):
-        return self._shell_velocity_mean
+        return self._quantity("shell_velocity_mean")
 
     @property
     def shell_velocity_disp(self):
-        return self._shell_velocity_disp
+        return self._quantity("shell_velocity_disp")
 
     @property
     def expansion_velocity(self):
-        return self._expansion_velocity
+        return self._quantity("expansion_velocity")
 
     def tkin(self, prefactor=0.978, age_unit=u.Myr):
         '''
@@ -1113,9 +1774,8 @@ class Bubble3D(BubbleNDBase):
         expansion. 0.978 is given in Bagetakos et al. (2011).
         '''
 
-        tkin = prefactor * 0.5 * self.diameter_physical.to(u.km) / \
-            self.expansion_velocity.to(u.km / u.s)
-        return tkin.to(age_unit)
+        return kinetic_age(self.diameter_physical, self.expansion_velocity,
+                           prefactor=prefactor, age_unit=age_unit)
 
     def shell_volume_density(self, scale_height=100 * u.pc,
                              inclination=55 * u.deg):
@@ -1127,12 +1787,9 @@ class Bubble3D(BubbleNDBase):
         is appropriate.
         '''
 
-        # Effective thckness of the HI layer (1-sigma) of the scale height
-        # assuming a Gaussian profile
-        l_thick = np.sqrt(8 * np.log(2)) * scale_height.to(u.cm) / \
-            np.cos(inclination)
-
-        return self.shell_column_density / l_thick
+        return shell_volume_density(self.shell_column_density,
+                                    scale_height=scale_height,
+                                    inclination=inclination)
 
     def volume(self, scale_height=None):
         '''
@@ -1142,15 +1799,8 @@ class Bubble3D(BubbleNDBase):
         For complete blowouts, you need the scale height.
         '''
 
-        if self.bubble_type == 1:
-            if scale_height is None:
-                raise ValueError("Blowouts require the scale height to"
-                                 " compute the volume.")
-            l_thick = np.sqrt(8 * np.log(2)) * scale_height.to(u.pc)
-
-            return np.pi * (0.5 * self.diameter_physical) ** 2 * l_thick
-        else:
-            return (4 * np.pi / 3.) * (0.5 * self.diameter_physical) ** 3
+        return hole_volume(self.diameter_physical, self.bubble_type,
+                           scale_height=scale_height)
 
     def hole_mass(self, scale_height=100. * u.pc, inclination=55 * u.deg):
         '''
@@ -1163,11 +1813,8 @@ class Bubble3D(BubbleNDBase):
         # I can't reproduce the Bagetakos mass values using eq. 12 using their
         # values of the diameter (for volume) and nHI. Since nHI * V gives the
         # number of hydrogen atoms, just convert straight to the mass
-        mass_factor = (1.67e-27 * u.kg).to(u.Msun)
-
-        return mass_factor * \
-            self.shell_volume_density(scale_height, inclination) * \
-            self.volume(scale_height).to(u.cm**3)
+        return hole_mass(self.shell_volume_density(scale_height, inclination),
+                         self.volume(scale_height))
 
     def formation_energy(self, scale_height=100. * u.pc,
                          inclination=55 * u.deg):
@@ -1177,17 +1824,14 @@ class Bubble3D(BubbleNDBase):
 
         '''
 
-        vol_dens = np.power(self.shell_volume_density(scale_height,
-                                                      inclination).value,
-                            1.12)
-        size = np.power(0.5 * self.diameter_physical.value, 3.12)
-        exp_vel = np.power(self.expansion_velocity.to(u.km / u.s).value, 1.4)
-
-        return 5.3e43 * vol_dens * size * exp_vel * u.erg
+        return formation_energy(self.shell_volume_density(scale_height,
+                                                          inclination),
+                                self.diameter_physical,
+                                self.expansion_velocity)
 
     @property
     def bubble_type(self):
-        return self._bubble_type * u.dimensionless_unscaled
+        return self._quantity("bubble_type")
 
     @bubble_type.setter
     def bubble_type(self, input_type):
@@ -1301,7 +1945,7 @@ class Bubble3D(BubbleNDBase):
         # equal to the velocity dispersion in the gas. Use the dispersion
         # within the shell.
         if self.bubble_type == 1:
-            self._expansion_velocity = self.shell_velocity_disp
+            expansion_velocity = self.shell_velocity_disp
         # Half blowouts use the difference between the mean gas velocity in
         # the shell and the channel velocity of the bounded side.
         # NOTE: the Bagetakos Vexp definition for half blow-outs is giving
@@ -1317,10 +1961,11 @@ class Bubble3D(BubbleNDBase):
         #         np.abs(self.shell_velocity_mean - self.velocity_start)
         # And bounded bubbles use half of the difference between their extents
         else:
-            self._expansion_velocity =  \
+            expansion_velocity =  \
                 0.5 * np.abs(self.velocity_start - self.velocity_end)
 
-        self._expansion_velocity = self._expansion_velocity.to(u.km / u.s)
+        self._set_quantity("expansion_velocity",
+                           expansion_velocity.to(u.km / u.s))
 
     def _chan_iter(self):
         return xrange(int(self.channel_start), int(self.channel_end) + 1)
@@ -1330,7 +1975,7 @@ class Bubble3D(BubbleNDBase):
             yield region
 
     def twoD_region_params(self):
-        return np.array([region.params for region in self._twoD_region_iter()])
+        return self.twoD_regions.params
 
     def find_spatial_extents(self, zero_center=True):
         '''
@@ -1354,6 +1999,11 @@ class Bubble3D(BubbleNDBase):
                          warp_to_circle=False, **kwargs):
         '''
         Return a PV Slice. Defaults to across the entire bubble.
+
+        The slice is averaged over paths at all angles through the centre
+        with `~basics.fan_pvslice.pv_wedge`. With the default width of 1
+        pixel, the values approximate pvextractor's area-weighted average
+        to ~1% of the spread in the slice.
         '''
 
         try:
@@ -1407,7 +2057,7 @@ class Bubble3D(BubbleNDBase):
             # Define end points along the major axis
             max_dist = 2 * float(self.major + spatial_pad)
 
-            return pv_wedge(cube, self.center, max_dist, 0.0, np.pi,
+            return pv_wedge(cube, (self.y, self.x), max_dist, 0.0, np.pi,
                             width=width)
 
     def as_pv_patch(self, x_cent=None, chan_cent=None, **kwargs):
@@ -0,0 +1,105 @@
+
+'''
+Physical properties of holes from Bagetakos et al. (2011). These work on
+scalars or on arrays of properties for many bubbles at once.
+'''
+
+import numpy as np
+import astropy.units as u
+
+
+def kinetic_age(diameter, expansion_velocity, prefactor=0.978,
+                age_unit=u.Myr):
+    '''
+    Kinetic age, prefactor * (D / 2) / v_exp. See `Bubble3D.tkin`.
+
+    Parameters
+    ----------
+    diameter : Quantity
+        Physical diameter of the hole.
+    expansion_velocity : Quantity
+        Expansion velocity of the shell.
+    '''
+
+    tkin = prefactor * 0.5 * diameter.to(u.km) / \
+        expansion_velocity.to(u.km / u.s)
+    return tkin.to(age_unit)
+
+
+def shell_volume_density(column_density, scale_height=100 * u.pc,
+                         inclination=55 * u.deg):
+    '''
+    Shell volume density from the column density and the thickness of the
+    HI layer along the line of sight (Bagetakos+11 eqs. 8 & 9).
+
+    Parameters
+    ----------
+    column_density : Quantity
+        Average column density of the shell.
+    '''
+
+    # FWHM thickness of a Gaussian layer with a 1-sigma scale height
+    l_thick = np.sqrt(8 * np.log(2)) * scale_height.to(u.cm) / \
+        np.cos(inclination)
+
+    return column_density / l_thick
+
+
+def hole_volume(diameter, bubble_type, scale_height=None):
+    '''
+    Volume of the hole: a sphere, or a cylinder through the HI layer for
+    blowouts (type 1), which needs the scale height (Bagetakos+11 eqs.
+    10/11).
+
+    Parameters
+    ----------
+    diameter : Quantity
+        Physical diameter of the hole.
+    bubble_type : int or np.ndarray
+        Type of the bubble.
+    '''
+
+    blowout = np.asarray(bubble_type) == 1
+
+    sphere = (4 * np.pi / 3.) * (0.5 * diameter) ** 3
+
+    if not blowout.any():
+        return sphere
+
+    if scale_height is None:
+        raise ValueError("Blowouts require the scale height to"
+                         " compute the volume.")
+
+    l_thick = np.sqrt(8 * np.log(2)) * scale_height.to(u.pc)
+
+    cylinder = np.pi * (0.5 * diameter) ** 2 * l_thick
+
+    if blowout.ndim == 0:
+        return cylinder
+
+    return np.where(blowout, cylinder.value,
+                    sphere.to(cylinder.unit).value) * cylinder.unit
+
+
+def hole_mass(volume_density, volume):
+    '''
+    HI mass evacuated from the hole, taken as n_HI * V hydrogen atoms. See
+    `Bubble3D.hole_mass`.
+    '''
+
+    mass_factor = (1.67e-27 * u.kg).to(u.Msun)
+
+    return mass_factor * volume_density * volume.to(u.cm**3)
+
+
+def formation_energy(volume_density, diameter, expansion_velocity):
+    '''
+    Energy to drive the expanding shell from Chevalier's equation
+    (Bagetakos+11 eq. 18).
+    '''
+
+    vol_dens = np.power(volume_density.to(u.cm ** -3).value, 1.12)
+    size = np.power(0.5 * diameter.to(u.pc).value, 3.12)
+    exp_vel = np.power(expansion_velocity.to(u.km / u.s).value, 1.4)
+
+    return 5.3e43 * vol_dens * size * exp_vel * u.erg
@@ -13,7 +13,9 @@ from skimage.morphology import convex_hull_image
 from spectral_cube.lower_dimensional_structures import LowerDimensionalObject
 
 from utils import sig_clip
-from bubble_objects import Bubble2D
+from bubble_objects import RegionTable
+from bubble_io import write_bubble_file
+from profiling import StageProfiler
 from log import blob_log, _prune_blobs, overlap_metric
 from bubble_edge import find_bubble_edges
 from fit_models import fit_region
@@ -347,39 +349,55 @@ class BubbleFinder2D(object):
                               max_rad=2.0, min_shell_frac=0.3, verbose=False,
                               use_ransac=False, ransac_trials=50,
                               fit_iterations=3, min_in_mask=0.75,
-                              distance=None):
+                              distance=None, profiler=None):
         '''
         Run find_bubbles on the specified scales.
+
+        Parameters
+        ----------
+        profiler : `~basics.profiling.StageProfiler`, optional
+            Record the time spent in the LoG, edge finding, fitting and
+            pruning stages.
         '''
 
         if scales is not None:
             self.scales = scales
 
+        if profiler is None:
+            profiler = StageProfiler(enabled=False)
+        chan = self.channel
+
         # Make the convex hull once.
-        conv_hull = \
-            nd.binary_fill_holes(
-                nd.binary_dilation(~self.mask, mo.disk(10 * self.beam_pix)))
+        with profiler.stage("convex_hull", channel=chan):
+            conv_hull = \
+                nd.binary_fill_holes(
+                    nd.binary_dilation(~self.mask,
+                                       mo.disk(10 * self.beam_pix)))
         # conv_hull = convex_hull_image(~self.mask)
 
         all_props = []
         all_coords = []
-        for i, props in enumerate(blob_log(self.array,
-                                  sigma_list=self.scales,
-                                  overlap=None,
-                                  threshold=nsig * self.sigma,
-                                  weighting=self.weightings)):
+        token = profiler.start("log", channel=chan)
+        blobs = blob_log(self.array, sigma_list=self.scales, overlap=None,
+                         threshold=nsig * self.sigma,
+                         weighting=self.weightings)
+        profiler.stop(token, count=len(blobs))
+        for i, props in enumerate(blobs):
             response_value = props[-1]
 
             # Adjust the region properties based on where the bubble edges are
             if edge_find:
                 # Edges are defined here by the mask. value_thresh is used
                 # in the case where the mask is given
-                coords, shell_frac, angular_std, value_thresh = \
-                    find_bubble_edges(self.array, props, max_extent=1.35,
-                                      value_thresh=(nsig + 1) * self.sigma,
-                                      nsig_thresh=edge_loc_bkg_nsig,
-                                      return_mask=False,
-                                      edge_mask=self.mask)
+                with profiler.stage("edges", channel=chan, count=1,
+                                    accumulate=True):
+                    coords, shell_frac, angular_std, value_thresh = \
+                        find_bubble_edges(self.array, props, max_extent=1.35,
+                                          value_thresh=(nsig + 1) *
+                                          self.sigma,
+                                          nsig_thresh=edge_loc_bkg_nsig,
+                                          return_mask=False,
+                                          edge_mask=self.mask)
                 # find_bubble_edges calculates the shell fraction
                 # If it is below the given fraction, we skip the region.
                 if len(coords) < 4:
@@ -401,19 +419,22 @@ class BubbleFinder2D(object):
                     else:
                         iter_min_in_mask = min_in_mask
 
-                    props, resid = \
-                        fit_region(coords, initial_props=props,
-                                   try_fit_ellipse=try_fit_ellipse,
-                                   use_ransac=use_ransac,
-                                   ransac_trials=ransac_trials,
-                                   beam_pix=self.beam_pix, max_rad=max_rad,
-                                   max_eccent=max_eccent,
-                                   min_in_mask=iter_min_in_mask,
-                                   mask=self.mask,
-                                   image_shape=self.array.shape,
-                                   max_resid=2 * self.beam_pix,
-                                   conv_hull=conv_hull,
-                                   verbose=verbose)
+                    with profiler.stage("fitting", channel=chan, count=1,
+                                        accumulate=True):
+                        props, resid = \
+                            fit_region(coords, initial_props=props,
+                                       try_fit_ellipse=try_fit_ellipse,
+                                       use_ransac=use_ransac,
+                                       ransac_trials=ransac_trials,
+                                       beam_pix=self.beam_pix,
+                                       max_rad=max_rad,
+                                       max_eccent=max_eccent,
+                                       min_in_mask=iter_min_in_mask,
+                                       mask=self.mask,
+                                       image_shape=self.array.shape,
+                                       max_resid=2 * self.beam_pix,
+                                       conv_hull=conv_hull,
+                                       verbose=verbose)
 
                     # Check if the fitting failed. If it did, continue on
                     if props is None:
@@ -422,12 +443,15 @@ class BubbleFinder2D(object):
 
                     # Now re-run the shell finding to update the coordinates
                     # with the new model.
-                    coords, shell_frac, angular_std = \
-                        find_bubble_edges(self.array, props, max_extent=1.05,
-                                          value_thresh=value_thresh,
-                                          nsig_thresh=edge_loc_bkg_nsig,
-                                          try_local_bkg=False,
-                                          edge_mask=self.mask)[:-1]
+                    with profiler.stage("edges", channel=chan, count=1,
+                                        accumulate=True):
+                        coords, shell_frac, angular_std = \
+                            find_bubble_edges(self.array, props,
+                                              max_extent=1.05,
+                                              value_thresh=value_thresh,
+                                              nsig_thresh=edge_loc_bkg_nsig,
+                                              try_local_bkg=False,
+                                              edge_mask=self.mask)[:-1]
 
                     if len(coords) < 4:
                         fail_fit = True
@@ -472,11 +496,13 @@ class BubbleFinder2D(object):
             else:
                 value_thresh = (nsig + 1) * self.sigma
 
-                coords, shell_frac, angular_std = \
-                    find_bubble_edges(self.array, props, max_extent=1.35,
-                                      value_thresh=value_thresh,
-                                      nsig_thresh=edge_loc_bkg_nsig,
-                                      edge_mask=self.mask)[:-1]
+                with profiler.stage("edges", channel=chan, count=1,
+                                    accumulate=True):
+                    coords, shell_frac, angular_std = \
+                        find_bubble_edges(self.array, props, max_extent=1.35,
+                                          value_thresh=value_thresh,
+                                          nsig_thresh=edge_loc_bkg_nsig,
+                                          edge_mask=self.mask)[:-1]
                 # No model, so no residual
                 resid = np.NaN
 
@@ -512,64 +538,73 @@ class BubbleFinder2D(object):
         all_props = np.array(all_props)
 
         if not len(all_props) == 0:
-
-            # First remove nearly duplicated regions. This stops much
-            # smaller regions (corr <= 0.75) from dominating larger ones,
-            # when they may only be a portion of the correct shape
-            all_props, all_coords = \
-                _prune_blobs(all_props, all_coords,
-                             method="shell fraction",
-                             min_corr=0.8, blob_merge=False)
-
-            # Only keep pruning if region_pruning is enabled. If you're
-            # stacking between channels, it is recommended that this be
-            # disabled.
-            if region_pruning:
-                # Now look on smaller scales, and enable matching between
-                # smaller regions embedded in a larger one. About 0.5 is
-                # appropriate since a completely embedded smaller region will
-                # have 1/sqrt(3) for the maximally eccentric shape allowed
-                # (e~3). This does make it possible that a much larger region
-                # could be lost when it shouldn't be. So long as the minimum
-                # cut used in the clustering is ~0.5, these can still be
-                # clustered appropriately.
+            with profiler.stage("pruning", channel=chan,
+                                count=len(all_props)):
+                # First remove nearly duplicated regions. This stops much
+                # smaller regions (corr <= 0.75) from dominating larger ones,
+                # when they may only be a portion of the correct shape
                 all_props, all_coords = \
                     _prune_blobs(all_props, all_coords,
                                  method="shell fraction",
-                                 min_corr=overlap_frac)
-
-                # Any highly overlapping regions should now be small regions
-                # inside much larger ones. We're going to assume that the
-                # remaining large regions are more important (good based on
-                # by-eye evaluation). Keeping this at 0.75, since we only want
-                # to remove very highly overlapping small regions. Note that
-                # this does set an upper limit on how overlapped region may
-                # be. This is fairly necessary though due to the shape
-                # ambiguities present in assuming an elliptical shape.
-                all_props, all_coords = \
-                    _prune_blobs(all_props, all_coords, overlap=0.75,
-                                 method='size')
-
-            self._regions = \
-                [Bubble2D(prop, shell_coords=coord, channel=self.channel,
-                          distance=distance)
-                 for prop, coord in zip(all_props, all_coords)]
+                                 min_corr=0.8, blob_merge=False)
+
+                # Only keep pruning if region_pruning is enabled. If you're
+                # stacking between channels, it is recommended that this be
+                # disabled.
+                if region_pruning:
+                    # Now look on smaller scales, and enable matching between
+                    # smaller regions embedded in a larger one. About 0.5 is
+                    # appropriate since a completely embedded smaller region
+                    # will have 1/sqrt(3) for the maximally eccentric shape
+                    # allowed (e~3). This does make it possible that a much
+                    # larger region could be lost when it shouldn't be. So long
+                    # as the minimum cut used in the clustering is ~0.5, these
+                    # can still be clustered appropriately.
+                    all_props, all_coords = \
+                        _prune_blobs(all_props, all_coords,
+                                     method="shell fraction",
+                                     min_corr=overlap_frac)
+
+                    # Any highly overlapping regions should now be small
+                    # regions inside much larger ones. We're going to assume
+                    # that the remaining large regions are more important (good
+                    # based on by-eye evaluation). Keeping this at 0.75, since
+                    # we only want to remove very highly overlapping small
+                    # regions. Note that this does set an upper limit on how
+                    # overlapped region may be. This is fairly necessary though
+                    # due to the shape ambiguities present in assuming an
+                    # elliptical shape.
+                    all_props, all_coords = \
+                        _prune_blobs(all_props, all_coords, overlap=0.75,
+                                     method='size')
+
+            self._region_table = \
+                RegionTable.from_arrays(all_props, all_coords,
+                                        channel=self.channel,
+                                        distance=distance)
         else:
-            self._regions = []
+            self._region_table = RegionTable.from_arrays([], [])
 
         return self
 
+    @property
+    def region_table(self):
+        '''
+        The regions stored in a RegionTable.
+        '''
+        return self._region_table
+
     @property
     def regions(self):
-        return self._regions
+        return self.region_table.to_regions()
 
     @property
     def region_params(self):
-        return np.array([bub2D.params for bub2D in self.regions])
+        return self.region_table.params
 
     @property
     def num_regions(self):
-        return len(self.regions)
+        return len(self.region_table)
 
     def visualize_regions(self, show=True, edges=False, ax=None, array=None,
                           region_col='b', edge_col='g', log_scale=False,
@@ -578,7 +613,7 @@ class BubbleFinder2D(object):
         Show the regions optionally overlaid with the edges.
         '''
 
-        if len(self.regions) == 0:
+        if self.num_regions == 0:
             warn("No regions were found. Nothing to show.")
             return
 
@@ -620,17 +655,23 @@ class BubbleFinder2D(object):
 
     def save_regions(self, folder=None, name=None):
         '''
-        Save regions as pickled objects.
+        Save the regions to a single .npz file. They can be loaded with
+        `~basics.bubble_io.BubbleFile`.
 
         Parameters
         ----------
         folder : str, optional
-            Path to where objects will be saved.
+            Path to where the file will be saved.
         name : str, optional
-            Prefix for the save names.
+            Prefix for the file name.
+
+        Returns
+        -------
+        save_name : str
+            Name of the saved file.
         '''
 
-        if len(self.regions) == 0:
+        if self.num_regions == 0:
             warn("There are no regions. Returning.")
             return
 
@@ -639,15 +680,15 @@ class BubbleFinder2D(object):
         if folder is None:
             folder = ""
 
-        if name is None:
-            name = ""
+        if name is None or len(name) == 0:
+            save_name = "regions.npz"
+        else:
+            save_name = "{}_regions.npz".format(name)
 
-        file_prefix = os.path.join(folder, name)
+        save_name = os.path.join(folder, save_name)
 
-        for i, reg in enumerate(self.bubbles):
-            if len(file_prefix) == 0:
-                save_name = "region_{}.pkl".format(i)
-            else:
-                save_name = "{0}_region_{1}.pkl".format(file_prefix, i)
+        write_bubble_file(save_name, regions=[self.region_table],
+                          metadata=dict(channel=self.channel,
+                                        sigma=self.sigma))
 
-            reg.save_bubble(save_name)
+        return save_name
@@ -4,14 +4,19 @@ import astropy.units as u
 from spectral_cube import SpectralCube
 # from astropy.utils.console import ProgressBar
 import sys
+import scipy.ndimage as nd
 from warnings import warn
 from copy import copy
 
 from bubble_segment2D import BubbleFinder2D
-from bubble_objects import Bubble3D, Bubble2D
+from bubble_objects import Bubble3D, RegionTable, CubeCoordinates
+from bubble_io import write_bubble_file, BubbleFile
 from bubble_catalog import PPV_Catalog
 from clustering import cluster_brute_force, threeD_overlaps
-from utils import sig_clip
+from utils import sig_clip, check_give_beam
+from masking_utils import PackedMask
+from noise import NoiseModel
+from profiling import StageProfiler
 from galaxy_utils import gal_props_checker
 from progressbar import ProgressBar
 
@@ -19,7 +24,8 @@ from progressbar import ProgressBar
 class BubbleFinder(object):
     """docstring for BubbleFinder"""
     def __init__(self, cube, wcs=None, mask=None, sigma=None, empty_channel=0,
-                 keep_threshold_mask=True, distance=None, galaxy_props={}):
+                 keep_threshold_mask=True, distance=None, galaxy_props={},
+                 noise_model=None):
         super(BubbleFinder, self).__init__()
 
         if not isinstance(cube, SpectralCube):
@@ -34,8 +40,13 @@ class BubbleFinder(object):
 
         self.empty_channel = empty_channel
 
+        self.noise_model = noise_model
+
         if sigma is None:
-            self.estimate_sigma()
+            if self.noise_model is None:
+                self.estimate_sigma()
+            else:
+                self.sigma = self.noise_model.sigma
         else:
             self.sigma = sigma
 
@@ -43,6 +54,8 @@ class BubbleFinder(object):
         self._mask = None
         self.distance = distance
         self.galaxy_props = galaxy_props
+        self._run_params = {}
+        self.profile = StageProfiler(enabled=False)
 
     @property
     def cube(self):
@@ -57,18 +70,76 @@ class BubbleFinder(object):
 
     @property
     def mask(self):
+        '''
+        The threshold mask from the 2D segmentation, as a
+        `~basics.masking_utils.PackedMask`. Indexing it decodes only the
+        requested part of the mask.
+        '''
         if not self.keep_threshold_mask:
             warn("Enable keep_threshold_mask to access the entire mask.")
 
         return self._mask
 
-    def estimate_sigma(self, nsig=10):
+    def estimate_sigma(self, nsig=10, per_channel=False, noise_map=False,
+                       cache_file=None):
         '''
         Use empty channels to estimate sigma. Uses iterative sigma clipping
         to obtain a robust estimate.
+
+        Parameters
+        ----------
+        per_channel : bool, optional
+            Estimate the noise in every channel with a
+            `~basics.noise.NoiseModel`. Each channel is then segmented with
+            its own noise level, and sigma is set to the median.
+        noise_map : bool, optional
+            Also make a map of the noise in each pixel. Only used when
+            per_channel is enabled.
+        cache_file : str, optional
+            Load or save the noise model to this file. See
+            `~basics.noise.NoiseModel.from_cube`.
         '''
 
-        self.sigma = sig_clip(self.cube[self.empty_channel], nsig=nsig)
+        if not per_channel:
+            self.noise_model = None
+            self.sigma = sig_clip(self.cube[self.empty_channel], nsig=nsig)
+            return
+
+        self.noise_model = NoiseModel.from_cube(self.cube, nsig=nsig,
+                                                noise_map=noise_map,
+                                                cache_file=cache_file)
+        self.sigma = self.noise_model.sigma
+
+    @property
+    def noise_model(self):
+        '''
+        The per-channel noise levels as a `~basics.noise.NoiseModel`. None
+        when a single noise level is used for all channels.
+        '''
+        return self._noise_model
+
+    @noise_model.setter
+    def noise_model(self, model):
+        if isinstance(model, basestring):
+            model = NoiseModel.load(model)
+        elif model is not None and not isinstance(model, NoiseModel):
+            model = NoiseModel(model)
+
+        if model is not None and len(model) != self.cube.shape[0]:
+            raise ValueError("The noise model must have a noise level for "
+                             "each channel.")
+
+        self._noise_model = model
+
+    def channel_sigma(self, chans):
+        '''
+        Noise level of the given channel(s). This is sigma unless there is a
+        per-channel noise model.
+        '''
+        if self.noise_model is None:
+            return self.sigma
+
+        return self.noise_model[chans]
 
     @property
     def sigma(self):
@@ -81,6 +152,70 @@ class BubbleFinder(object):
 
         self._sigma = val
 
+    def emission_footprint(self, bkg_nsig=3, region_min_nsig=6, scales=None):
+        '''
+        Find the spatial extents of all significant emission in the cube from
+        the peak intensity map. The extents are padded by the same amount
+        BubbleFinder2D uses with auto_cut, so cropping the cube to the
+        footprint does not change what each channel sees.
+
+        Parameters
+        ----------
+        bkg_nsig : float, optional
+            Peak intensities above bkg_nsig * sigma define the footprint.
+            Should match the background threshold used in
+            BubbleFinder2D.create_mask.
+        region_min_nsig : float, optional
+            Connected regions in the footprint are only kept when they contain
+            a peak above region_min_nsig * sigma. This removes noise spikes,
+            which would otherwise make the footprint the entire image.
+        scales : np.ndarray, optional
+            Scales passed to BubbleFinder2D. The default scales are computed
+            from the beam otherwise.
+
+        Returns
+        -------
+        spatial_slices : tuple of slices or None
+            The y and x slices of the footprint. None is returned when there
+            is no significant emission or no beam is attached to the cube.
+        '''
+
+        if scales is None:
+            beam = check_give_beam(self.cube)
+            if beam is None:
+                return None
+
+            pixscale = np.abs(self.cube.wcs.celestial.pixel_scale_matrix[0, 0])
+            fwhm_beam_pix = beam.major.to(u.deg).value / pixscale
+            beam_pix = np.ceil(fwhm_beam_pix / np.sqrt(8 * np.log(2)))
+
+            scales = beam_pix * np.arange(1., 8 + np.sqrt(2), np.sqrt(2))
+
+        pad_size = 3 * np.floor(np.max(scales)).astype(int)
+
+        peak_intensity = np.nan_to_num(self.cube.max(axis=0).value)
+
+        labels, num = nd.label(peak_intensity > bkg_nsig * self.sigma,
+                               np.ones((3, 3)))
+
+        if num == 0:
+            return None
+
+        maxes = nd.maximum(peak_intensity, labels, range(1, num + 1))
+        signal = np.in1d(labels, np.where(maxes >= region_min_nsig *
+                                          self.sigma)[0] + 1)
+        signal = signal.reshape(labels.shape)
+
+        if not signal.any():
+            return None
+
+        yslice, xslice = nd.find_objects(signal.astype(int))[0]
+
+        return (slice(max(0, yslice.start - pad_size),
+                      min(self.cube.shape[1], yslice.stop + pad_size)),
+                slice(max(0, xslice.start - pad_size),
+                      min(self.cube.shape[2], xslice.stop + pad_size)))
+
     @property
     def galaxy_props(self):
         return self._galaxy_props
@@ -98,10 +233,26 @@ class BubbleFinder(object):
                     cube_linewidth=None, multiprocess=True, nprocesses=None,
                     twod_regions=None, mask=None, min_shell_fraction=0.4,
                     save_regions=False, save_region_path=None,
-                    overlap_kwargs={}, **kwargs):
+                    overlap_kwargs={}, crop_to_emission=True, profile=False,
+                    profile_log=None, **kwargs):
         '''
         Perform segmentation on each channel, then cluster the results to find
         bubbles.
+
+        Parameters
+        ----------
+        crop_to_emission : bool, optional
+            Cut the cube down to the spatial footprint of significant emission
+            (see `~BubbleFinder.emission_footprint`) before segmenting each
+            channel. The regions are returned in the full cube's pixel frame.
+        profile : bool, optional
+            Record the wall time, CPU time, peak memory and number of items
+            for each stage, and for each channel in the segmentation. The
+            results are kept in `BubbleFinder.profile`, a
+            `~basics.profiling.StageProfiler`.
+        profile_log : str, optional
+            Append the profiling records to this JSON-lines file. Enables
+            profile.
         '''
 
         if verbose:
@@ -109,21 +260,46 @@ class BubbleFinder(object):
         else:
             output = None
 
+        # Keep the settings for the run to save with the bubbles
+        self._run_params = dict(overlap_frac=overlap_frac,
+                                min_channels=min_channels,
+                                use_cube_mask=use_cube_mask, nsig=nsig,
+                                refit=refit,
+                                min_shell_fraction=min_shell_fraction,
+                                crop_to_emission=crop_to_emission, **kwargs)
+
         if cube_linewidth is not None:
             if not cube_linewidth.unit.is_equivalent(u.m / u.s):
                 raise u.UnitsError("cube_linewidth must have velocity units.")
 
+        profile = profile or profile_log is not None
+        profiler = StageProfiler(enabled=profile, log_file=profile_log)
+        self.profile = profiler
+        run_token = profiler.start("get_bubbles")
+
         if twod_regions is None:
+            spatial_slices = None
+            if crop_to_emission:
+                with profiler.stage("emission_footprint"):
+                    spatial_slices = self.emission_footprint(scales=scales)
+            if spatial_slices is None:
+                spatial_slices = (slice(0, self.cube.shape[1]),
+                                  slice(0, self.cube.shape[2]))
+            offset = (spatial_slices[0].start, spatial_slices[1].start)
+
             if verbose:
                 print("Running bubble finding plane-by-plane.")
+            seg_token = profiler.start("segmentation")
             twod_results = \
                 ProgressBar.map(_region_return,
-                                ((self.cube[i],
-                                  self.cube.mask.include(view=(i, ))
+                                ((self.cube[(i, ) + spatial_slices],
+                                  self.cube.mask.include(view=(i, ) +
+                                                         spatial_slices)
                                   if use_cube_mask else None,
-                                  i, self.sigma, nsig, overlap_frac,
+                                  i, self.channel_sigma(i), nsig,
+                                  overlap_frac,
                                   self.keep_threshold_mask, self.distance,
-                                  scales)
+                                  scales, offset, profile)
                                  for i in xrange(self.cube.shape[0])),
                                 multiprocess=multiprocess,
                                 nprocesses=nprocesses,
@@ -131,27 +307,33 @@ class BubbleFinder(object):
                                 step=self.cube.shape[0],
                                 item_len=self.cube.shape[0])
 
-            twod_regions = []
+            twod_tables = []
             if self.keep_threshold_mask:
-                self._mask = np.zeros(self.cube.shape, dtype=np.bool)
+                # Outside of the footprint, there is no signal.
+                self._mask = PackedMask(self.cube.shape, fill_value=True)
 
             for out in twod_results:
+                # The last item has the profiling records from the worker
+                profiler.extend(out[-1])
+                out = out[:-1]
+
                 if self.keep_threshold_mask:
                     chan, regions, mask_slice = out
 
-                    self._mask[chan] = mask_slice
+                    self._mask[(chan, ) + spatial_slices] = mask_slice
                 else:
                     chan, regions = out
 
-                twod_regions.extend(regions)
+                twod_tables.append(regions)
+
+            twod_regions = RegionTable.concatenate(twod_tables)
+            profiler.stop(seg_token, count=self.cube.shape[0])
         else:
-            for reg in twod_regions:
-                if not isinstance(reg, Bubble2D):
-                    raise TypeError("twod_regions must all be Bubble2D"
-                                    " objects.")
+            # Raises a TypeError if any are not Bubble2D objects.
+            twod_regions = RegionTable.from_regions(twod_regions)
             if mask is not None:
                 assert mask.shape == self.cube.shape
-                self._mask = mask
+                self._mask = PackedMask.from_array(mask)
 
         if save_regions:
             import os
@@ -159,39 +341,39 @@ class BubbleFinder(object):
             if save_region_path is None:
                 save_region_path = ""
 
-            for i, reg in enumerate(twod_regions):
-                reg.save_bubble(os.path.join(save_region_path,
-                                             "twod_region_{}.pkl".format(i)))
+            write_bubble_file(os.path.join(save_region_path,
+                                           "twod_regions.npz"),
+                              regions=[twod_regions],
+                              metadata=self._metadata())
 
         self._bubbles = []
         self._unclustered_regions = []
 
         if len(twod_regions) == 0:
             warn("No bubbles found in the given cube.")
-            return self
+            return self._finish_profile(run_token)
 
-        bubble_props = np.vstack([bub.params for bub in twod_regions])
+        bubble_props = twod_regions.params
 
         if verbose:
             print("Clustering 2D regions across channels.")
         # cluster_idx = cluster_and_clean(bubble_props, **kwargs)
-        cluster_idx = cluster_brute_force(bubble_props, **kwargs)
+        with profiler.stage("clustering", count=len(twod_regions)):
+            cluster_idx = cluster_brute_force(bubble_props, **kwargs)
 
         # Add the unclustered ones first
-        unclusts = [twod_regions[idx] for idx in np.where(cluster_idx == 0)[0]]
-        for reg in unclusts:
-            self._unclustered_regions.append([reg])
+        for idx in np.where(cluster_idx == 0)[0]:
+            self._unclustered_regions.append(twod_regions[idx:idx + 1])
 
         good_clusters = []
         for idx in np.unique(cluster_idx[cluster_idx > 0]):
-            regions = [twod_regions[idx] for idx in
-                       np.where(cluster_idx == idx)[0]]
+            regions = twod_regions[cluster_idx == idx]
 
             if len(regions) < min_channels:
                 self._unclustered_regions.append(regions)
                 continue
 
-            chans = np.array([reg.channel_center for reg in regions])
+            chans = regions["channel"]
             if chans.max() + 1 - chans.min() >= min_channels:
                 good_clusters.append(regions)
             else:
@@ -206,24 +388,22 @@ class BubbleFinder(object):
             # cube_linewidth = self.cube.with_mask(self.mask).linewidth_fwhm()
             # Just mask with a sigma cut
             sigma_w_unit = self.sigma * self.cube.unit
-            cube_linewidth = \
-                self.cube.with_mask(self.cube >= 3 *
-                                    sigma_w_unit).linewidth_fwhm()
+            with profiler.stage("linewidth"):
+                cube_linewidth = \
+                    self.cube.with_mask(self.cube >= 3 *
+                                        sigma_w_unit).linewidth_fwhm()
+        # The WCS information is shared by all of the bubbles
+        coordinates = CubeCoordinates(self.cube)
         # Now create the bubble objects and find their respective properties
-        self._bubbles = ProgressBar.map(_make_bubble,
-                                        ((regions, refit, self.cube, self.mask,
-                                          self.distance, self.sigma,
-                                          cube_linewidth, self.galaxy_props)
-                                         for regions in good_clusters),
-                                        multiprocess=False,
-                                        nprocesses=nprocesses,
-                                        file=output,
-                                        step=1,
-                                        item_len=len(good_clusters))
+        self._bubbles = \
+            self._make_bubbles(good_clusters, refit, cube_linewidth,
+                               coordinates, multiprocess=multiprocess,
+                               nprocesses=nprocesses, output=output)
 
         # Now we prune off overlapping bubbles
-        self._bubbles, removed_bubbles, new_twoD_clusters = \
-            threeD_overlaps(self.bubbles, **overlap_kwargs)
+        with profiler.stage("threeD_overlaps", count=len(self.bubbles)):
+            self._bubbles, removed_bubbles, new_twoD_clusters = \
+                threeD_overlaps(self.bubbles, **overlap_kwargs)
 
         # Add the 2D regions in the removed bubbles to the unclustered list
         for bub in removed_bubbles:
@@ -231,21 +411,14 @@ class BubbleFinder(object):
 
         # If there is nothing to join, return here
         if len(new_twoD_clusters) == 0:
-            return self
+            return self._finish_profile(run_token)
 
         print("Found bubbles to join together.")
 
         new_bubbles = \
-            ProgressBar.map(_make_bubble,
-                            ((regions, refit, self.cube, self.mask,
-                              self.distance, self.sigma,
-                              cube_linewidth, self.galaxy_props)
-                             for regions in new_twoD_clusters),
-                            multiprocess=False,
-                            nprocesses=nprocesses,
-                            file=output,
-                            step=1,
-                            item_len=len(new_twoD_clusters))
+            self._make_bubbles(new_twoD_clusters, refit, cube_linewidth,
+                               coordinates, multiprocess=multiprocess,
+                               nprocesses=nprocesses, output=output)
 
         self._bubbles.extend(new_bubbles)
 
@@ -257,22 +430,110 @@ class BubbleFinder(object):
         self._bubbles = [bub for bub in all_bubbles if
                          bub.shell_fraction >= min_shell_fraction]
 
+        return self._finish_profile(run_token)
+
+    def _finish_profile(self, run_token):
+        '''
+        Record the time for the whole run, and write the log if one was
+        given.
+        '''
+
+        self.profile.stop(run_token, count=len(self._bubbles))
+
+        if self.profile.enabled and self.profile.log_file is not None:
+            self.profile.write_log()
+
         return self
 
+    def _make_bubbles(self, clusters, refit, linewidth, coordinates,
+                      multiprocess=True, nprocesses=None, output=None):
+        '''
+        Create the bubbles from clusters of 2D regions.
+
+        The properties that need the cube values are found in parallel. Each
+        worker only receives the spatial cut-out of the cube, mask and
+        linewidth map around its bubble. The WCS and galactic properties are
+        then set here using the shared coordinate information.
+        '''
+
+        profiler = self.profile
+
+        with profiler.stage("bubble_creation", count=len(clusters),
+                            accumulate=True):
+            bubbles = [Bubble3D.from_2D_regions(regions, refit=refit,
+                                                distance=self.distance)
+                       for regions in clusters]
+
+        mask = self.mask
+
+        if mask is not None:
+            results = \
+                ProgressBar.map(_bubble_properties,
+                                _bubble_cutouts(bubbles, self.cube, mask,
+                                                linewidth,
+                                                self.channel_sigma,
+                                                profiler.enabled),
+                                multiprocess=multiprocess,
+                                nprocesses=nprocesses,
+                                file=output,
+                                step=1,
+                                item_len=len(bubbles))
+
+            # The multiprocessing results are not ordered
+            for i, bub, records in results:
+                bubbles[i] = bub
+                profiler.extend(records)
+
+        with profiler.stage("bubble_wcs_properties", count=len(bubbles),
+                            accumulate=True):
+            for bub in bubbles:
+                bub.set_wcs_props(self.cube, coordinates=coordinates)
+
+                if mask is not None:
+                    bub.find_expansion_velocity()
+                    bub.set_galactic_properties(self.galaxy_props)
+
+        return bubbles
+
     @staticmethod
     def reload(cube, bubbles, mask=None, distance=None, galaxy_props=None):
         '''
-        Reload from a cube and a list of bubbles.
+        Reload from a cube and a list of bubbles, or the name of a file
+        written by `~BubbleFinder.save_bubbles`. When loading from a file,
+        the unclustered regions are also restored, and the saved distance,
+        galaxy properties and noise level are used if they are not given.
         '''
 
         if mask is not None:
             assert cube.shape == mask.shape
 
-        self = BubbleFinder(cube, mask=mask, distance=distance,
-                            galaxy_props=galaxy_props)
+        sigma = None
+        channel_sigma = None
+        unclustered_regions = []
+        run_params = {}
+
+        if isinstance(bubbles, basestring):
+            with BubbleFile(bubbles) as bubble_file:
+                metadata = bubble_file.metadata
+
+                if distance is None:
+                    distance = metadata.get("distance")
+                if galaxy_props is None:
+                    galaxy_props = metadata.get("galaxy_props")
+                sigma = metadata.get("sigma")
+                channel_sigma = metadata.get("channel_sigma")
+                run_params = metadata.get("run_params", {})
+
+                unclustered_regions = bubble_file.regions
+                bubbles = bubble_file.bubbles
+
+        self = BubbleFinder(cube, mask=mask, sigma=sigma, distance=distance,
+                            galaxy_props=galaxy_props,
+                            noise_model=channel_sigma)
 
         self._bubbles = bubbles
-        self._unclustered_regions = []
+        self._unclustered_regions = unclustered_regions
+        self._run_params = run_params
 
         return self
 
@@ -462,16 +723,36 @@ class BubbleFinder(object):
                 else:
                     p.show()
 
+    def _metadata(self):
+        '''
+        Information about the run that is saved with the bubbles.
+        '''
+
+        channel_sigma = None
+        if self.noise_model is not None:
+            channel_sigma = self.noise_model.channel_sigma
+
+        return dict(cube_shape=self.cube.shape, sigma=self.sigma,
+                    channel_sigma=channel_sigma,
+                    distance=self.distance, galaxy_props=self.galaxy_props,
+                    run_params=self._run_params)
+
     def save_bubbles(self, folder=None, name=None):
         '''
-        Save bubbles as pickled objects.
+        Save the bubbles, the unclustered regions and the run settings to a
+        single .npz file. Use `~BubbleFinder.reload` to load it back in.
 
         Parameters
         ----------
         folder : str, optional
-            Path to where objects will be saved.
+            Path to where the file will be saved.
         name : str, optional
-            Prefix for the save names.
+            Prefix for the file name.
+
+        Returns
+        -------
+        save_name : str
+            Name of the saved file.
         '''
 
         if len(self.bubbles) == 0:
@@ -483,41 +764,73 @@ class BubbleFinder(object):
         if folder is None:
             folder = ""
 
-        if name is None:
-            name = ""
+        if name is None or len(name) == 0:
+            save_name = "bubbles.npz"
+        else:
+            save_name = "{}_bubbles.npz".format(name)
 
-        file_prefix = os.path.join(folder, name)
+        save_name = os.path.join(folder, save_name)
 
-        for i, bub in enumerate(self.bubbles):
-            if len(file_prefix) == 0:
-                save_name = "bubble_{}.pkl".format(i)
-            else:
-                save_name = "{0}_bubble_{1}.pkl".format(file_prefix, i)
+        write_bubble_file(save_name, bubbles=self.bubbles,
+                          regions=self.unclustered_regions,
+                          metadata=self._metadata())
 
-            bub.save_bubble(save_name)
+        return save_name
 
 
 def _region_return(imps):
-    arr, mask, i, sigma, nsig, overlap_frac, return_mask, distance, scales = \
-        imps
-    bubs = BubbleFinder2D(arr, channel=i,
-                          mask=mask, sigma=sigma, auto_cut=True,
-                          scales=scales).\
-        multiscale_bubblefind(nsig=nsig,
-                              overlap_frac=overlap_frac,
-                              distance=distance)
+    arr, mask, i, sigma, nsig, overlap_frac, return_mask, distance, scales, \
+        offset, profile = imps
+
+    profiler = StageProfiler(enabled=profile)
+
+    with profiler.stage("mask", channel=i):
+        bubs = BubbleFinder2D(arr, channel=i,
+                              mask=mask, sigma=sigma, auto_cut=True,
+                              scales=scales)
+    bubs.multiscale_bubblefind(nsig=nsig, overlap_frac=overlap_frac,
+                               distance=distance, profiler=profiler)
+
+    # Move the regions from the cropped frame back into the full cube frame
+    if offset[0] != 0 or offset[1] != 0:
+        bubs.region_table.shift(*offset)
     if return_mask:
-        return i, bubs.regions, \
+        return i, bubs.region_table, \
             bubs.insert_in_shape(bubs.mask, bubs._orig_shape, fill_value=True,
-                                 dtype=bool)
+                                 dtype=bool), profiler.records
+
+    return i, bubs.region_table, profiler.records
+
+
+def _bubble_cutouts(bubbles, cube, mask, linewidth, channel_sigma,
+                    profile=False):
+    '''
+    Yield the inputs for `_bubble_properties`, with the cube, mask and
+    linewidth map cut to the region around each bubble. The noise level
+    is the median over the bubble's channels.
+    '''
+
+    for i, bub in enumerate(bubbles):
+        yslice, xslice = bub.cutout_slices(cube.shape[1:])
+
+        sigma = np.nanmedian(channel_sigma(slice(bub.channel_start,
+                                                 bub.channel_end + 1)))
+
+        yield (i, bub, cube[:, yslice, xslice], mask[:, yslice, xslice],
+               linewidth[yslice, xslice], sigma,
+               (yslice.start, xslice.start), profile)
+
+
+def _bubble_properties(imps):
+    i, bubble, cube, mask, linewidth, sigma, offset, profile = imps
 
-    return i, bubs.regions
+    profiler = StageProfiler(enabled=profile)
 
+    # Move into the cut-out's frame, then back again.
+    with profiler.stage("bubble_cube_properties"):
+        bubble.shift(-offset[0], -offset[1])
+        bubble.set_cube_properties(cube, mask, sigma=sigma,
+                                   linewidth=linewidth)
+        bubble.shift(*offset)
 
-def _make_bubble(imps):
-    regions, refit, cube, mask, distance, sigma, lwidth, galaxy_props = imps
-    return Bubble3D.from_2D_regions(regions, refit=refit,
-                                    cube=cube, mask=mask,
-                                    distance=distance,
-                                    sigma=sigma, linewidth=lwidth,
-                                    galaxy_kwargs=galaxy_props)
+    return i, bubble, profiler.records
@@ -15,6 +15,7 @@ except ImportError:
     _sklearn_flag = False
 
 from log import overlap_metric
+from bubble_objects import RegionTable
 from utils import mode
 from progressbar import ProgressBar
 
@@ -454,38 +455,30 @@ def join_bubbles(join_bubbles):
         A list of the  bubbles to join.
     '''
 
-    # Create a list of the twoD regions in each
+    # Create a table of the twoD regions in each
     new_twoD_clusters = []
 
     for join in join_bubbles:
-        new_cluster = []
-        for bub in join:
-            new_cluster.extend(bub.twoD_regions)
+        new_cluster = \
+            RegionTable.concatenate([bub.twoD_regions for bub in join])
         # Check for multiple regions within the same channel and keep whichever
         # has the higher shell_fraction.
-        channel_cents = np.array([reg.channel_center for reg in new_cluster])
+        channel_cents = new_cluster["channel"]
+        shell_fracs = new_cluster["shell_fraction"]
+        keep = np.ones(len(new_cluster), dtype=bool)
         # Count how many in each
         counts = Counter(channel_cents)
-        removals = []
         for val in counts:
             if counts[val] == 1:
                 continue
             # There's multiple, so one must die.
-            chan_regs = [new_cluster[i] for i in
-                         np.where(channel_cents == val)[0]]
-            shell_fracs = np.array([reg.shell_fraction for reg in chan_regs])
+            chan_idx = np.where(channel_cents == val)[0]
 
-            keeper = np.argmax(shell_fracs)
+            keeper = chan_idx[np.argmax(shell_fracs[chan_idx])]
 
-            chan_regs.pop(keeper)
+            keep[chan_idx] = False
+            keep[keeper] = True
 
-            # Now remove all others from the cluster
-            for reg in chan_regs:
-                removals.append(reg)
-
-        for reg in removals:
-            new_cluster.remove(reg)
-
-        new_twoD_clusters.append(new_cluster)
+        new_twoD_clusters.append(new_cluster[keep])
 
     return new_twoD_clusters
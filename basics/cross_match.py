@@ -0,0 +1,201 @@
+
+'''
+Cross-match sets of bubbles, or a set of bubbles against an external
+catalog. Candidate pairs come from a KD-tree on the centres, so only
+bubbles whose extents can intersect are scored with the overlap metric.
+'''
+
+import numpy as np
+from astropy.wcs.utils import skycoord_to_pixel
+from scipy.spatial import cKDTree
+
+from log import overlap_metric, _circle_overlaps, _radius_bins
+
+
+def _as_params(bubbles):
+    '''
+    Array of [y, x, major, minor, pa] from a list of bubble objects or an
+    array of parameters.
+    '''
+
+    if isinstance(bubbles, np.ndarray):
+        params = bubbles
+    else:
+        params = np.array([bub.params[:5] for bub in bubbles], dtype=float)
+
+    if params.size == 0:
+        return np.empty((0, 5))
+
+    if params.ndim != 2 or params.shape[1] < 5:
+        raise ValueError("bubbles must have [y, x, major, minor, pa] "
+                         "parameters.")
+
+    return params
+
+
+def pixel_positions(coords, wcs):
+    '''
+    Convert sky positions into (y, x) pixel positions all at once, rather
+    than searching the spatial coordinate map of a cube for each position.
+
+    Parameters
+    ----------
+    coords : SkyCoord
+        Positions to convert.
+    wcs : astropy.wcs.WCS
+        WCS of the image or cube. Only the celestial axes are used.
+
+    Returns
+    -------
+    y, x : np.ndarray
+        Pixel positions.
+    '''
+
+    x, y = skycoord_to_pixel(coords, wcs.celestial)
+
+    return np.asarray(y), np.asarray(x)
+
+
+def candidate_pairs(params1, params2):
+    '''
+    Pairs of ellipses whose centres are closer than the sum of their major
+    radii, so their extents may intersect.
+
+    Parameters
+    ----------
+    params1, params2 : np.ndarray
+        Ellipse parameters [y, x, major, minor, pa] in pixels.
+
+    Returns
+    -------
+    idx1, idx2 : np.ndarray
+        Indices of the candidate pairs in each set, sorted by idx1 and then
+        idx2.
+    '''
+
+    params1 = _as_params(params1)
+    params2 = _as_params(params2)
+
+    if len(params1) == 0 or len(params2) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # Search each pair of radius bins out to the sum of their largest radii,
+    # so a few large bubbles do not widen the search for all of the others.
+    bins1 = _radius_bins(params1[:, 2])
+    bins2 = _radius_bins(params2[:, 2])
+
+    idx1 = []
+    idx2 = []
+    for sel2 in bins2:
+        tree = cKDTree(params2[sel2, :2])
+        max_radius2 = params2[sel2, 2].max()
+
+        for sel1 in bins1:
+            neighbours = \
+                tree.query_ball_point(params1[sel1, :2],
+                                      r=params1[sel1, 2].max() + max_radius2)
+
+            lengths = [len(neigh) for neigh in neighbours]
+            if sum(lengths) == 0:
+                continue
+            idx1.append(np.repeat(sel1, lengths))
+            idx2.append(sel2[np.concatenate(neighbours).astype(int)])
+
+    if len(idx1) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    idx1 = np.concatenate(idx1)
+    idx2 = np.concatenate(idx2)
+
+    order = np.lexsort((idx2, idx1))
+    idx1 = idx1[order]
+    idx2 = idx2[order]
+
+    dists = np.hypot(params1[idx1, 0] - params2[idx2, 0],
+                     params1[idx1, 1] - params2[idx2, 1])
+    close = dists < params1[idx1, 2] + params2[idx2, 2]
+
+    return idx1[close], idx2[close]
+
+
+def cross_match(bubbles1, bubbles2, return_corr=False):
+    '''
+    Overlap of each pair of bubbles that intersect. Both sets must be in
+    the same pixel frame.
+
+    Parameters
+    ----------
+    bubbles1, bubbles2 : list of bubble objects or np.ndarray
+        Bubbles, or their [y, x, major, minor, pa] parameters.
+    return_corr : bool, optional
+        Return the area correlation instead of the fractional overlap. See
+        `~basics.log.overlap_metric`.
+
+    Returns
+    -------
+    idx1, idx2 : np.ndarray
+        Indices of the overlapping pairs in each set.
+    overlaps : np.ndarray
+        Overlap of each pair.
+    '''
+
+    params1 = _as_params(bubbles1)
+    params2 = _as_params(bubbles2)
+
+    idx1, idx2 = candidate_pairs(params1, params2)
+
+    blobs1 = params1[idx1]
+    blobs2 = params2[idx2]
+
+    is_circle = np.logical_and(blobs1[:, 2] == blobs1[:, 3],
+                               blobs2[:, 2] == blobs2[:, 3])
+
+    overlaps = np.empty(len(idx1))
+
+    # All of the circle pairs are scored at once
+    overlaps[is_circle] = \
+        _circle_overlaps(blobs1[is_circle],
+                         blobs2[is_circle])[1 if return_corr else 0]
+
+    for i in np.where(~is_circle)[0]:
+        overlaps[i] = overlap_metric(blobs1[i], blobs2[i],
+                                     return_corr=return_corr)
+
+    keep = overlaps > 0
+    return idx1[keep], idx2[keep], overlaps[keep]
+
+
+def best_matches(num, idx1, idx2, overlaps):
+    '''
+    Best match in the second set for each of the first set of bubbles from
+    the output of `cross_match`.
+
+    Parameters
+    ----------
+    num : int
+        Number of bubbles in the first set.
+
+    Returns
+    -------
+    best_overlap : np.ndarray
+        Largest overlap for each bubble. Zero when there is no match.
+    best_idx : np.ndarray
+        Index of the best match in the second set. -1 when there is no
+        match.
+    '''
+
+    best_overlap = np.zeros(num)
+    best_idx = -np.ones(num, dtype=int)
+
+    if len(overlaps) == 0:
+        return best_overlap, best_idx
+
+    # Sort by bubble, then overlap, and keep the last of each bubble
+    order = np.lexsort((overlaps, idx1))
+    sorted_idx1 = idx1[order]
+    last = np.append(sorted_idx1[1:] != sorted_idx1[:-1], True)
+
+    best_overlap[sorted_idx1[last]] = overlaps[order][last]
+    best_idx[sorted_idx1[last]] = idx2[order][last]
+
+    return best_overlap, best_idx
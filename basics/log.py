@@ -7,14 +7,13 @@ from numpy import arccos
 from skimage.util import img_as_float
 from skimage.feature import peak_local_max
 from astropy.modeling.models import Ellipse2D
-from skimage.measure import regionprops
-from scipy.spatial.distance import pdist, cdist
-from functools import partial
+from scipy.spatial import cKDTree
+from scipy.sparse import csr_matrix
+from scipy.optimize import linear_sum_assignment
 
 # from .._shared.utils import assert_nD
 
-from utils import (dist_uppertri, wrap_to_pi, find_row, eight_conn,
-                   in_box)
+from utils import wrap_to_pi, eight_conn, in_box
 
 '''
 Copyright (C) 2011, the scikit-image team
@@ -137,37 +136,42 @@ def _prune_blobs(blobs_array, coords=None, overlap=0.75, method='size',
         `array` with overlapping blobs removed and merged nearby blobs.
     """
 
-    remove_blobs = []
-
     # First sort all of the blobs by their area
-    areas = np.pi * blobs_array[:, 2] * blobs_array[:, 3]
+    order = np.argsort(np.pi * blobs_array[:, 2] * blobs_array[:, 3])[::-1]
 
-    blobs_array = blobs_array[np.argsort(areas)[::-1]]
+    blobs_array = blobs_array[order]
     if coords is not None:
-        coords = [coords[i] for i in np.argsort(areas)[::-1]]
-    areas = [areas[i] for i in np.argsort(areas)[::-1]]
+        coords = [coords[i] for i in order]
+    areas = np.pi * blobs_array[:, 2] * blobs_array[:, 3]
+
+    # Overlaps between the neighbouring blobs are only computed once
+    fracs, corrs = pairwise_overlaps(blobs_array)
+
+    if method == 'shell fraction':
+        overlap = min_corr
+
+    remove_blobs = np.zeros(len(blobs_array), dtype=bool)
 
     # Now go through column-by-column, where the largest region is th first
     for large_pos, large_blob in enumerate(blobs_array):
 
-        # Find overlapping smaller regions
+        # Both matrices store the same neighbours in the same order
+        neighbours, neigh_fracs = _sparse_row(fracs, large_pos)
+        neigh_corrs = _sparse_row(corrs, large_pos)[1]
+
+        # Candidates are smaller in area and overlap enough
         if method == 'shell fraction':
-            return_corr = True
-            overlap = min_corr
+            neigh_overlaps = neigh_corrs
         else:
-            return_corr = False
+            neigh_overlaps = neigh_fracs
+
+        is_candidate = np.logical_and(neigh_overlaps > overlap,
+                                      areas[large_pos] > areas[neighbours])
 
-        small_posns = \
-            np.array([i for i, blob in enumerate(blobs_array) if
-                      overlap_metric(large_blob, blob,
-                                     return_corr=return_corr) >
-                      overlap and i != large_pos and
-                      areas[large_pos] > areas[i]])
+        small_posns = neighbours[is_candidate]
 
-        # Look in the overlap array for associated smaller regions
-        # small_posns = np.where(overlaps[large_pos])[0]
         # Skip if there are no overlapping regions
-        if not small_posns.any():
+        if small_posns.size == 0:
             continue
 
         # Before comparing large to small, see if any pairs can create the
@@ -177,10 +181,16 @@ def _prune_blobs(blobs_array, coords=None, overlap=0.75, method='size',
             smaller_blob_remove = \
                 merge_pair_to_larger(large_blob, blobs_array[small_posns],
                                      small_posns=small_posns,
-                                     min_union_corr=0.7)
-            smaller_blob_remove = list(smaller_blob_remove)
+                                     min_union_corr=0.7,
+                                     fracs_with_larger=neigh_fracs[
+                                         is_candidate],
+                                     corrs_with_larger=neigh_corrs[
+                                         is_candidate],
+                                     pair_corrs=corrs[small_posns][:,
+                                                                   small_posns])
+            smaller_blob_remove = set(smaller_blob_remove)
         else:
-            smaller_blob_remove = []
+            smaller_blob_remove = set()
 
         remove_large_flag = False
 
@@ -198,7 +208,7 @@ def _prune_blobs(blobs_array, coords=None, overlap=0.75, method='size',
 
                 # If the bigger one is more complete, discard the smaller
                 if shell_cond:
-                    smaller_blob_remove.append(small_pos)
+                    smaller_blob_remove.add(small_pos)
                 else:
                     remove_large_flag = True
                     break
@@ -217,18 +227,18 @@ def _prune_blobs(blobs_array, coords=None, overlap=0.75, method='size',
                                               coords[small_pos]) > min_corr
                 # Discard the smaller one if it is too similar
                 if shell_cond:
-                    smaller_blob_remove.append(small_pos)
+                    smaller_blob_remove.add(small_pos)
                 else:
                     remove_large_flag = True
                     break
 
             elif method == "size":
-                smaller_blob_remove.append(small_pos)
+                smaller_blob_remove.add(small_pos)
 
             elif method == "response":
                 cond = large_blob[5] > small_blob[5]
                 if cond:
-                    smaller_blob_remove.append(small_pos)
+                    smaller_blob_remove.add(small_pos)
                 else:
                     remove_large_flag = True
                     break
@@ -237,84 +247,121 @@ def _prune_blobs(blobs_array, coords=None, overlap=0.75, method='size',
                                 " 'response' or 'shell coords'.")
 
         if remove_large_flag:
-            remove_blobs.append(large_pos)
+            remove_blobs[large_pos] = True
         else:
             # Only remove the small regions if the large region isn't removed
-            remove_blobs.extend(smaller_blob_remove)
-
-    # Remove duplicates
-    remove_blobs = list(set(remove_blobs))
+            remove_blobs[list(smaller_blob_remove)] = True
 
-    blobs_array = np.delete(blobs_array, remove_blobs, axis=0)
+    blobs_array = blobs_array[~remove_blobs]
     if coords is not None:
-        coords = [coord for i, coord in enumerate(coords)
-                  if i not in remove_blobs]
+        coords = [coord for coord, remove in zip(coords, remove_blobs)
+                  if not remove]
         return blobs_array, coords
 
     return blobs_array
 
 
 def merge_pair_to_larger(large_blob, small_blobs, min_union_corr=0.8,
-                         small_posns=None, min_overlap_frac=0.9):
+                         small_posns=None, min_overlap_frac=0.9,
+                         fracs_with_larger=None, corrs_with_larger=None,
+                         pair_corrs=None):
     '''
     Look for pairs of small blobs that, when combined, are a close match to
     the larger region.
+
+    Parameters
+    ----------
+    large_blob : np.ndarray
+        The larger blob.
+    small_blobs : np.ndarray
+        Smaller blobs that overlap with the larger one.
+    min_union_corr : float, optional
+        Minimum area correlation between a union of two of the smaller blobs
+        and the larger blob.
+    small_posns : np.ndarray, optional
+        Positions of the smaller blobs in another array. When given, these
+        positions are returned instead of the indices in small_blobs.
+    min_overlap_frac : float, optional
+        Only consider smaller blobs with at least this fraction of their area
+        within the larger blob.
+    fracs_with_larger : np.ndarray, optional
+        Overlap fraction of each smaller blob with the larger.
+    corrs_with_larger : np.ndarray, optional
+        Area correlation of each smaller blob with the larger.
+    pair_corrs : np.ndarray or scipy.sparse matrix, optional
+        Matrix of the area correlations between the smaller blobs (see
+        `pairwise_overlaps`).
+
+    Returns
+    -------
+    removals : np.ndarray or list
+        The smaller blobs that are part of a pair matching the larger blob.
     '''
 
-    fracs_with_larger = \
-        np.array([overlap_metric(large_blob, blob,
-                                 return_corr=False) for blob in small_blobs])
+    small_blobs = np.asarray(small_blobs)
 
-    small_blobs = small_blobs[fracs_with_larger >= min_overlap_frac]
+    if fracs_with_larger is None or corrs_with_larger is None or \
+            pair_corrs is None:
+        fracs, corrs = \
+            pairwise_overlaps(np.vstack([np.asarray(large_blob)[:5],
+                                         small_blobs[:, :5]]))
 
-    # Calculate correlation with larger
-    corrs_with_larger = \
-        np.array([overlap_metric(large_blob, blob,
-                                 return_corr=True) for blob in small_blobs])
-    area_large = np.pi * large_blob[2] * large_blob[3]
+        if fracs_with_larger is None:
+            fracs_with_larger = fracs[0, 1:].toarray().ravel()
+        if corrs_with_larger is None:
+            corrs_with_larger = corrs[0, 1:].toarray().ravel()
+        if pair_corrs is None:
+            pair_corrs = corrs[1:, 1:]
+
+    corrs_with_larger = np.asarray(corrs_with_larger)
+    keep = np.where(np.asarray(fracs_with_larger) >= min_overlap_frac)[0]
+
+    # All pairs of the remaining smaller blobs
+    first, second = np.triu_indices(len(keep), k=1)
+    idx1 = keep[first]
+    idx2 = keep[second]
+
+    # Sparse matrices return a 1 x n matrix
+    if idx1.size > 0:
+        corr = np.asarray(pair_corrs[idx1, idx2]).ravel()
+    else:
+        corr = np.empty(0)
+    one_corr = corrs_with_larger[idx1]
+    two_corr = corrs_with_larger[idx2]
 
     # Define a pair as any two smaller regions whose area correlation with
     # the larger blob is larger than between themselves.
-    from itertools import combinations
-    removals = []
-    for one, two in combinations(small_blobs, 2):
-        corr = overlap_metric(one, two, return_corr=True)
+    is_pair = np.logical_and(one_corr >= corr, two_corr >= corr)
 
-        row1 = find_row(small_blobs, one)
-        row2 = find_row(small_blobs, two)
-        one_corr = corrs_with_larger[row1]
-        two_corr = corrs_with_larger[row2]
+    # Now combine the regions and calculate the correlation with the
+    # larger. Since we know the correlation and the areas, we don't
+    # need to explicitly solve for the resulting union correlation
+    # (which is great b/c the union won't have a nice analytical form)
+    # Derivation is in my thesis (XXX LINK XXX)
+    area_large = np.pi * large_blob[2] * large_blob[3]
+    area1 = np.pi * small_blobs[idx1, 2] * small_blobs[idx1, 3]
+    area2 = np.pi * small_blobs[idx2, 2] * small_blobs[idx2, 3]
 
-        if one_corr >= corr and two_corr >= corr:
-            # Now combine the regions and calculate the correlation with the
-            # larger. Since we know the correlation and the areas, we don't
-            # need to explicitly solve for the resulting union correlation
-            # (which is great b/c the union won't have a nice analytical form)
-            # Derivation is in my thesis (XXX LINK XXX)
+    union_area = area1 + area2 - corr * np.sqrt(area1 * area2)
 
-            area1 = np.pi * one[2] * one[3]
-            area2 = np.pi * two[2] * two[3]
+    term1 = (one_corr * np.sqrt(area1) + two_corr * np.sqrt(area2)) / \
+        np.sqrt(union_area)
 
-            term1 = (one_corr * np.sqrt(area1) + two_corr * np.sqrt(area2)) / \
-                np.sqrt(area1 + area2 - corr * np.sqrt(area1 * area2))
+    term2 = (corr * np.sqrt(area1 * area2)) / \
+        np.sqrt(area_large * union_area)
 
-            term2 = (corr * np.sqrt(area1 * area2)) / \
-                np.sqrt(area_large *
-                        (area1 + area2 - corr * np.sqrt(area1 * area2)))
+    union_corr = term1 - term2
 
-            union_corr = term1 - term2
+    # If these two, when combined, are close to matching the larger
+    # region, mark them for removal
+    matches = np.logical_and(is_pair, union_corr >= min_union_corr)
 
-            # If these two, when combined, are close to matching the larger
-            # region, mark them for removal
-            if (union_corr >= min_union_corr):
-                removals.append(row1)
-                removals.append(row2)
+    removals = np.union1d(idx1[matches], idx2[matches])
 
     if small_posns is not None:
-        # print(small_posns[removals])
-        return small_posns[removals]
+        return np.asarray(small_posns)[removals]
     else:
-        return removals
+        return list(removals)
 
 
 def _merge_blobs(blobs_array, min_distance_merge=1.0):
@@ -340,37 +387,46 @@ def _merge_blobs(blobs_array, min_distance_merge=1.0):
     # Distance between centres equal to the radius
     max_merge_overlap = 1.0
 
-    merged_blobs = np.empty((0, 6), dtype=np.float64)
-
-    # Create a distance matrix to catch all overlap cases.
-    cond_arr = pdist(blobs_array, metric=partial(overlap_metric))
-    dist_arr = dist_uppertri(cond_arr, blobs_array.shape[0])
-
-    overlaps = np.where(np.logical_and(dist_arr > min_merge_overlap,
-                                       dist_arr <= max_merge_overlap))
-
-    for posn1, posn2 in zip(*overlaps):
-
-        blob1 = blobs_array[posn1]
-        blob2 = blobs_array[posn2]
-
-        if blob1[2] != blob1[3] or blob2[2] != blob2[3]:
-            is_ellipse = True
-        else:
-            is_ellipse = False
+    # Overlaps between neighbouring pairs, in the lower triangle as returned
+    # by dist_uppertri. The rows have sorted columns, so the pairs are in
+    # row-major order.
+    fracs = pairwise_overlaps(blobs_array)[0]
+
+    posns1 = np.repeat(np.arange(len(blobs_array)), np.diff(fracs.indptr))
+    posns2 = fracs.indices
+
+    merge_pair = np.logical_and(posns2 < posns1,
+                                np.logical_and(fracs.data > min_merge_overlap,
+                                               fracs.data <=
+                                               max_merge_overlap))
+    posns1 = posns1[merge_pair]
+    posns2 = posns2[merge_pair]
+
+    radii = blobs_array[:, 2]
+    is_circle = blobs_array[:, 2] == blobs_array[:, 3]
+
+    # Only circles of the same size are merged into an ellipse
+    same_circles = np.logical_and(radii[posns1] == radii[posns2],
+                                  np.logical_and(is_circle[posns1],
+                                                 is_circle[posns2]))
+    posns1 = posns1[same_circles]
+    posns2 = posns2[same_circles]
+
+    # Each blob can only be merged once. Pairs are taken in order.
+    merged = np.zeros(len(blobs_array), dtype=bool)
+    keep_pairs = np.zeros(len(posns1), dtype=bool)
+    for i, (posn1, posn2) in enumerate(zip(posns1, posns2)):
+        if merged[posn1] or merged[posn2]:
+            continue
+        merged[posn1] = True
+        merged[posn2] = True
+        keep_pairs[i] = True
 
-        if np.logical_and(blob1[2] == blob2[2], ~is_ellipse):
-            # Merge into an ellipse
-            merged_blobs = \
-                np.vstack([merged_blobs, merge_to_ellipse(blob1, blob2)])
-            blob1[2] = -1
-            blob1[3] = -1
-            blob2[2] = -1
-            blob2[3] = -1
+    merged_blobs = _merge_to_ellipses(blobs_array[posns1[keep_pairs]],
+                                      blobs_array[posns2[keep_pairs]])
 
     # Remove blobs
-    blobs_array = np.array([b for b in blobs_array if b[2] > 0])
-    blobs_array = np.vstack([blobs_array, merged_blobs])
+    blobs_array = np.vstack([blobs_array[~merged], merged_blobs])
 
     return blobs_array
 
@@ -522,13 +578,14 @@ def blob_log(image, sigma_list=None, scale_choice='linear',
                                          threshold_rel=0.0,
                                          exclude_border=False)
 
-            new_scale_peaks = np.empty((len(scale_peaks), 5))
             if refine_shape:
-                for j, peak in enumerate(scale_peaks):
-                    new_peak = np.array([peak[0], peak[1], scale, scale, 0.0])
-                    new_scale_peaks[j] = \
-                        shape_from_blob_moments(new_peak, image_cube[:, :, i])
+                new_peaks = np.zeros((len(scale_peaks), 5))
+                new_peaks[:, :2] = scale_peaks
+                new_peaks[:, 2:4] = scale
+                new_scale_peaks = \
+                    shapes_from_blob_moments(new_peaks, image_cube[:, :, i])
             else:
+                new_scale_peaks = np.empty((len(scale_peaks), 5))
                 new_scale_peaks[:, :2] = scale_peaks
                 # sqrt(2) size correction
                 new_scale_peaks[:, 2:4] = np.sqrt(2) * scale
@@ -586,6 +643,30 @@ def merge_to_ellipse(blob1, blob2):
     return new_blob
 
 
+def _merge_to_ellipses(blobs1, blobs2):
+    '''
+    `merge_to_ellipse` for many pairs of circular blobs at once.
+    '''
+
+    new_blobs = np.empty((len(blobs1), 6))
+
+    d = np.hypot(blobs1[:, 0] - blobs2[:, 0], blobs1[:, 1] - blobs2[:, 1])
+
+    new_blobs[:, 0] = (blobs1[:, 0] + blobs2[:, 0]) / 2.
+    new_blobs[:, 1] = (blobs1[:, 1] + blobs2[:, 1]) / 2.
+    new_blobs[:, 2] = blobs1[:, 2] + d / 2.
+    new_blobs[:, 3] = blobs1[:, 2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pa = np.arctan((blobs1[:, 0] - blobs2[:, 0]) /
+                       (blobs1[:, 1] - blobs2[:, 1]))
+    new_blobs[:, 4] = np.where(pa < 0, pa + np.pi, pa)
+
+    new_blobs[:, 5] = np.maximum(blobs1[:, -1], blobs2[:, -1])
+
+    return new_blobs
+
+
 def _ellipse_overlap(blob1, blob2, grid_space=0.5, return_corr=False):
     '''
     Ellipse intersection are difficult. But counting common pixels is not!
@@ -693,47 +774,273 @@ def overlap_metric(ellip1, ellip2, return_corr=False):
         return blob_overlap
 
 
-def shell_similarity(coords1, coords2, max_dist=3, verbose=False):
+def _circle_overlaps(blobs1, blobs2):
+    '''
+    `_circle_overlap` for many pairs of circles at once. Returns the
+    overlap fraction and correlation of each pair.
+    '''
+
+    r1 = blobs1[:, 2].astype(float)
+    r2 = blobs2[:, 2].astype(float)
+
+    d = np.hypot(blobs1[:, 0] - blobs2[:, 0], blobs1[:, 1] - blobs2[:, 1])
+
+    r_min = np.minimum(r1, r2)
+    r_max = np.maximum(r1, r2)
+
+    fracs = np.zeros(len(d))
+    corrs = np.zeros(len(d))
+
+    # One blob is inside the other
+    inside = d <= np.abs(r1 - r2)
+    fracs[inside] = 1.0
+    corrs[inside] = r_min[inside] / r_max[inside]
+
+    part = np.logical_and(~inside, d <= r1 + r2)
+    if part.any():
+        d, r1, r2 = d[part], r1[part], r2[part]
+
+        acos1 = arccos(np.clip((d ** 2 + r1 ** 2 - r2 ** 2) / (2 * d * r1),
+                               -1, 1))
+        acos2 = arccos(np.clip((d ** 2 + r2 ** 2 - r1 ** 2) / (2 * d * r2),
+                               -1, 1))
+
+        prod = (-d + r2 + r1) * (d - r2 + r1) * (d + r2 - r1) * \
+            (d + r2 + r1)
+        area = r1 ** 2 * acos1 + r2 ** 2 * acos2 - 0.5 * np.sqrt(np.abs(prod))
+
+        fracs[part] = area / (math.pi * r_min[part] ** 2)
+        corrs[part] = area / (math.pi * r1 * r2)
+
+    return fracs, corrs
+
+
+def pairwise_overlaps(blobs_array):
+    '''
+    Overlap fraction and area correlation (see `overlap_metric`) between all
+    pairs of blobs. Only pairs whose centres are closer than the sum of
+    their major radii are computed; the overlap for all others is 0.
+    Overlaps between circles are computed together.
+
+    Parameters
+    ----------
+    blobs_array : np.ndarray
+        Array of blobs, whose first 5 columns are [y, x, major, minor, pa].
+
+    Returns
+    -------
+    fracs : scipy.sparse.csr_matrix
+        Symmetric sparse matrix of the overlap fractions.
+    corrs : scipy.sparse.csr_matrix
+        Symmetric sparse matrix of the area correlations.
+
+    Both matrices store the same candidate pairs (including those with no
+    overlap) with the column indices of each row sorted, so the neighbours
+    of a blob are read from the same slice of `indices` and `data`. See
+    `_sparse_row`.
+    '''
+
+    num = len(blobs_array)
+
+    if num < 2:
+        return _symmetric_csr(num, np.empty((0, 2), dtype=int),
+                              np.empty(0), np.empty(0))
+
+    # Search each pair of radius bins out to the sum of their largest radii,
+    # so a few large blobs do not widen the search for all of the others.
+    bins = _radius_bins(blobs_array[:, 2])
+    trees = [cKDTree(blobs_array[sel, :2]) for sel in bins]
+    max_radii = [blobs_array[sel, 2].max() for sel in bins]
+
+    pairs = []
+    for i, (sel1, tree1) in enumerate(zip(bins, trees)):
+        bin_pairs = tree1.query_pairs(2 * max_radii[i])
+        if len(bin_pairs) > 0:
+            pairs.append(sel1[np.array(list(bin_pairs))])
+
+        for j in xrange(i + 1, len(bins)):
+            neighbours = tree1.query_ball_tree(trees[j],
+                                               max_radii[i] + max_radii[j])
+            lengths = [len(neigh) for neigh in neighbours]
+            if sum(lengths) == 0:
+                continue
+            pairs.append(np.vstack([np.repeat(sel1, lengths),
+                                    bins[j][np.concatenate(neighbours)
+                                            .astype(int)]]).T)
+
+    if len(pairs) == 0:
+        return _symmetric_csr(num, np.empty((0, 2), dtype=int),
+                              np.empty(0), np.empty(0))
+
+    # The first blob of each pair is the first in the array, as is done in
+    # _prune_blobs when comparing a larger blob to the smaller ones.
+    pairs = np.sort(np.vstack(pairs), axis=1)
+
+    blobs1 = blobs_array[pairs[:, 0]]
+    blobs2 = blobs_array[pairs[:, 1]]
+
+    dists = np.hypot(blobs1[:, 0] - blobs2[:, 0], blobs1[:, 1] - blobs2[:, 1])
+    close = dists <= blobs1[:, 2] + blobs2[:, 2]
+    pairs, blobs1, blobs2 = pairs[close], blobs1[close], blobs2[close]
+
+    is_circle = np.logical_and(blobs1[:, 2] == blobs1[:, 3],
+                               blobs2[:, 2] == blobs2[:, 3])
+
+    pair_fracs = np.empty(len(pairs))
+    pair_corrs = np.empty(len(pairs))
+
+    pair_fracs[is_circle], pair_corrs[is_circle] = \
+        _circle_overlaps(blobs1[is_circle], blobs2[is_circle])
+
+    # The correlation is the overlap fraction scaled by the ratio of the
+    # smaller and larger areas, so only the fraction needs to be computed
+    for i in np.where(~is_circle)[0]:
+        pair_fracs[i] = _ellipse_overlap(blobs1[i], blobs2[i])
+
+    areas1 = blobs1[~is_circle, 2] * blobs1[~is_circle, 3]
+    areas2 = blobs2[~is_circle, 2] * blobs2[~is_circle, 3]
+    pair_corrs[~is_circle] = pair_fracs[~is_circle] * \
+        np.sqrt(np.minimum(areas1, areas2) / np.maximum(areas1, areas2))
+
+    return _symmetric_csr(num, pairs, pair_fracs, pair_corrs)
+
+
+def _radius_bins(radii, factor=2.):
+    '''
+    Split the indices of the radii into groups spanning at most `factor` in
+    radius. A neighbour search within each group only needs to reach as far
+    as the largest radius in the group.
+
+    Returns
+    -------
+    bins : list of np.ndarray
+        Indices in each group, from the smallest to largest radii.
+    '''
+
+    radii = np.asarray(radii, dtype=float)
+
+    if len(radii) == 0:
+        return []
+
+    positive = radii[radii > 0]
+    min_radius = positive.min() if len(positive) > 0 else 1.
+
+    keys = np.floor(np.log(np.maximum(radii, min_radius) / min_radius) /
+                    np.log(factor)).astype(int)
+
+    order = np.argsort(keys, kind='mergesort')
+    starts = np.unique(keys[order], return_index=True)[1]
+
+    return np.split(order, starts[1:])
+
+
+def _symmetric_csr(num, pairs, *pair_values):
+    '''
+    Symmetric num x num CSR matrices with values at each pair of indices,
+    all with the same sorted sparsity pattern. Explicit zeros are kept.
+    '''
+
+    rows = np.concatenate([pairs[:, 0], pairs[:, 1]]).astype(int)
+    cols = np.concatenate([pairs[:, 1], pairs[:, 0]]).astype(int)
+
+    order = np.lexsort((cols, rows))
+    rows, cols = rows[order], cols[order]
+    indptr = np.searchsorted(rows, np.arange(num + 1))
+
+    return tuple(csr_matrix((np.concatenate([values, values])[order], cols,
+                             indptr), shape=(num, num))
+                 for values in pair_values)
+
+
+def _sparse_row(matrix, row):
+    '''
+    Column indices and values stored in a row of a CSR matrix.
+    '''
+
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    return matrix.indices[start:end], matrix.data[start:end]
+
+
+def shell_similarity(coords1, coords2, max_dist=3, verbose=False,
+                     optimal=False, max_optimal_size=250000):
     '''
     Check how similar 2 sets of shell coordinates are. This is based off a
     distance threshold; if two points are within the threshold of each other,
     they are considered a match.
-    '''
 
-    # There shouldn't ever be huge number of coordinates for the shells, so
-    # the lazy O(n^2) solution is fine for now.
+    Each point in the smaller set is matched, in order, to the closest
+    unused point in the larger set within max_dist. Only pairs within
+    max_dist, found with a KD-tree, are considered.
+
+    Parameters
+    ----------
+    coords1, coords2 : np.ndarray
+        Shell coordinates.
+    max_dist : float, optional
+        Maximum distance between matched points.
+    verbose : bool, optional
+        Plot the matches.
+    optimal : bool, optional
+        Find the largest number of matches (with the smallest total
+        distance) using the Hungarian algorithm instead of the greedy
+        matching. Only used when the number of points with possible matches
+        in each set multiply to less than max_optimal_size; otherwise the
+        greedy matching is used.
+    max_optimal_size : int, optional
+        Largest size of the cost matrix for the optimal matching.
+
+    Returns
+    -------
+    overlap_frac : float
+        Fraction of the smaller set of points with a match.
+    '''
 
     num1 = len(coords1)
     num2 = len(coords2)
 
+    if num1 == 0 or num2 == 0:
+        return 0.0
+
+    # Smaller number of coords is the first dimension
     if num1 >= num2:
-        dist = cdist(coords2, coords1)
+        small_coords, large_coords = coords2, coords1
         ind1 = 1
         ind2 = 0
     else:
-        dist = cdist(coords1, coords2)
+        small_coords, large_coords = coords1, coords2
         ind1 = 0
         ind2 = 1
 
-    # Smaller number of coords is the first dimension
-    matches = np.empty((0, 2), dtype=np.int)
-    for i, row in enumerate(dist):
-        # Find the minimum, excluding points that have already been used.
-        candidates = row.copy()
-        # Set used ones to NaN
-        candidates[matches[:, 1]] = np.NaN
-        # Check if all possible matches have already been used
-        if np.isnan(candidates).all():
-            break
-        j = np.nanargmin(candidates)
-        if row[j] < max_dist:
-            matches = np.append(matches, np.array([[i, j]]), axis=0)
-
-    # Compute the overlap fraction
-    if num1 >= num2:
-        overlap_frac = matches.shape[0] / float(num2)
+    small_coords = np.asarray(small_coords, dtype=float)
+    large_coords = np.asarray(large_coords, dtype=float)
+
+    neighbours = \
+        cKDTree(large_coords).query_ball_point(small_coords, r=max_dist)
+
+    lengths = np.array([len(neigh) for neigh in neighbours])
+    if lengths.sum() == 0:
+        matches = np.empty((0, 2), dtype=np.int)
     else:
-        overlap_frac = matches.shape[0] / float(num1)
+        rows = np.repeat(np.arange(len(small_coords)), lengths)
+        cols = np.concatenate([neigh for neigh in neighbours
+                               if len(neigh) > 0]).astype(int)
+
+        dists = np.hypot(small_coords[rows, 0] - large_coords[cols, 0],
+                         small_coords[rows, 1] - large_coords[cols, 1])
+
+        close = dists < max_dist
+        rows, cols, dists = rows[close], cols[close], dists[close]
+
+        uniq_rows = np.unique(rows)
+        uniq_cols = np.unique(cols)
+
+        if optimal and uniq_rows.size * uniq_cols.size <= max_optimal_size:
+            matches = _optimal_matches(rows, cols, dists, uniq_rows,
+                                       uniq_cols)
+        else:
+            matches = _greedy_matches(rows, cols, dists)
+
+    overlap_frac = matches.shape[0] / float(min(num1, num2))
 
     if verbose:
         import matplotlib.pyplot as p
@@ -748,58 +1055,184 @@ def shell_similarity(coords1, coords2, max_dist=3, verbose=False):
     return overlap_frac
 
 
+def _greedy_matches(rows, cols, dists):
+    '''
+    Match each row, in order, to its closest unused column. Ties go to the
+    lowest column.
+    '''
+
+    order = np.lexsort((cols, dists, rows))
+
+    matched_rows = np.zeros(rows.max() + 1, dtype=bool)
+    used_cols = np.zeros(cols.max() + 1, dtype=bool)
+
+    matches = []
+    for row, col in zip(rows[order], cols[order]):
+        if matched_rows[row] or used_cols[col]:
+            continue
+        matched_rows[row] = True
+        used_cols[col] = True
+        matches.append((row, col))
+
+    return np.array(matches, dtype=np.int).reshape((-1, 2))
+
+
+def _optimal_matches(rows, cols, dists, uniq_rows, uniq_cols):
+    '''
+    Largest set of matches with the smallest total distance.
+    '''
+
+    # Pairs that are too far apart cost more than any set of matches
+    no_match = dists.sum() + 1.
+    cost = np.full((uniq_rows.size, uniq_cols.size), no_match)
+
+    row_posn = np.searchsorted(uniq_rows, rows)
+    col_posn = np.searchsorted(uniq_cols, cols)
+    cost[row_posn, col_posn] = dists
+
+    row_match, col_match = linear_sum_assignment(cost)
+    good = cost[row_match, col_match] < no_match
+
+    return np.column_stack([uniq_rows[row_match[good]],
+                            uniq_cols[col_match[good]]])
+
+
 def shape_from_blob_moments(blob, response, expand_factor=np.sqrt(2)):
     '''
     Use blob properties to define a region, then correct its shape by
     using the response surface
     '''
-    yy, xx = np.mgrid[:response.shape[0], :response.shape[1]]
 
-    mask = Ellipse2D.evaluate(yy, xx, True, blob[0],
-                              blob[1], expand_factor * blob[2],
-                              expand_factor * blob[3], blob[4]).astype(np.int)
+    return shapes_from_blob_moments(np.asarray(blob)[np.newaxis], response,
+                                    expand_factor=expand_factor)[0]
+
+
+def shapes_from_blob_moments(blobs, response, expand_factor=np.sqrt(2)):
+    '''
+    Refine the shapes of many blobs with the weighted moments of the response
+    surface within each blob (expanded by expand_factor). Only a window
+    around each blob is used, and the moments of all of the blobs are
+    computed together.
+
+    Parameters
+    ----------
+    blobs : np.ndarray
+        Blobs with [y, x, major, minor, pa] as the first 5 columns.
+    response : np.ndarray
+        The response surface (e.g., the LoG transform at the scale of the
+        blobs).
+    expand_factor : float, optional
+        Factor to expand the blob by when computing the moments.
+
+    Returns
+    -------
+    new_blobs : np.ndarray
+        Refined [y, x, major, minor, pa, max response] of each blob. The
+        maximum response is from within the refined shape.
+    '''
+
+    blobs = np.asarray(blobs, dtype=float)
+    num = len(blobs)
+
+    new_blobs = np.empty((num, 6))
+    if num == 0:
+        return new_blobs
 
-    resp = response.copy()
     # We don't care about the negative values here, so set to 0
-    resp[resp < 0.0] = 0.0
+    resp = np.clip(response, 0.0, None)
 
-    props = regionprops(mask, intensity_image=resp)[0]
+    # Windows covering each expanded blob, in a zero-padded copy so they
+    # are all the same size.
+    pad = int(np.ceil(expand_factor * blobs[:, 2].max())) + 1
+    padded = np.pad(resp, pad, mode='constant')
 
-    # Now use the moments to refine the shape
-    wprops = weighted_props(props)
-    y, x, major, minor, pa = wprops
+    offsets = np.arange(-pad, pad + 1)
+    centres = np.round(blobs[:, :2]).astype(int)
 
-    new_mask = Ellipse2D.evaluate(yy, xx, True, y,
-                                  x, major,
-                                  minor, pa).astype(bool)
+    rows = centres[:, 0, np.newaxis, np.newaxis] + \
+        offsets[np.newaxis, :, np.newaxis]
+    cols = centres[:, 1, np.newaxis, np.newaxis] + \
+        offsets[np.newaxis, np.newaxis, :]
 
-    # Find the maximum value in the response
-    max_resp = np.max(response[new_mask])
+    weights = padded[rows + pad, cols + pad]
 
-    # print(blob)
-    # print((y, x, major, minor, pa, max_resp))
-    # import matplotlib.pyplot as p
-    # p.imshow(response, origin='lower', cmap='afmhot')
-    # p.contour(mask, colors='r')
-    # p.contour(new_mask, colors='g')
-    # p.draw()
-    # import time; time.sleep(0.1)
-    # raw_input("?")
-    # p.clf()
+    def bcast(col):
+        return blobs[:, col, np.newaxis, np.newaxis]
 
-    return np.array([y, x, major, minor, pa, max_resp])
+    # Same ellipse as the full image mask used previously
+    mask = Ellipse2D.evaluate(rows, cols, True, bcast(0), bcast(1),
+                              expand_factor * bcast(2),
+                              expand_factor * bcast(3),
+                              bcast(4)).astype(bool)
+    weights = weights * mask
 
+    # Weighted central moments
+    m00 = weights.sum(axis=(1, 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row_cent = (weights * rows).sum(axis=(1, 2)) / m00
+        col_cent = (weights * cols).sum(axis=(1, 2)) / m00
 
-def weighted_props(regprops):
+    drows = rows - row_cent[:, np.newaxis, np.newaxis]
+    dcols = cols - col_cent[:, np.newaxis, np.newaxis]
+
+    mu_rr = (weights * drows ** 2).sum(axis=(1, 2))
+    mu_rc = (weights * drows * dcols).sum(axis=(1, 2))
+    mu_cc = (weights * dcols ** 2).sum(axis=(1, 2))
+
+    for i in range(num):
+        wprops = _shape_from_moments(m00[i], mu_rr[i], mu_rc[i], mu_cc[i])
+
+        new_blobs[i, :2] = row_cent[i], col_cent[i]
+        new_blobs[i, 2:5] = wprops
+
+        new_blobs[i, 5] = _max_in_ellipse(response, new_blobs[i, :5])
+
+    return new_blobs
+
+
+def _max_in_ellipse(array, blob):
     '''
-    Return the shape properties based on the weighted moments.
+    Maximum of the array within the ellipse [y, x, major, minor, pa]. NaN
+    when the ellipse contains no pixels.
+    '''
+
+    y, x, major, minor, pa = blob
+
+    if not np.isfinite(blob).all():
+        return np.NaN
+
+    rad = int(np.ceil(major)) + 1
+
+    ymin = max(int(np.floor(y)) - rad, 0)
+    ymax = min(int(np.ceil(y)) + rad + 1, array.shape[0])
+    xmin = max(int(np.floor(x)) - rad, 0)
+    xmax = min(int(np.ceil(x)) + rad + 1, array.shape[1])
+
+    if ymin >= ymax or xmin >= xmax:
+        return np.NaN
+
+    yy, xx = np.mgrid[ymin:ymax, xmin:xmax]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mask = Ellipse2D.evaluate(yy, xx, True, y, x, major, minor,
+                                  pa).astype(bool)
+
+    if not mask.any():
+        return np.NaN
+
+    return np.max(array[ymin:ymax, xmin:xmax][mask])
+
+
+def _shape_from_moments(m00, mu_rr, mu_rc, mu_cc):
+    '''
+    Major and minor radii, and position angle from the weighted central
+    moments of a region.
     '''
 
-    wmu = regprops.weighted_moments_central
     # Create the inertia tensor from the moments
-    a = wmu[2, 0] / wmu[0, 0]
-    b = -wmu[1, 1] / wmu[0, 0]
-    c = wmu[0, 2] / wmu[0, 0]
+    a = mu_rr / m00
+    b = -mu_rc / m00
+    c = mu_cc / m00
     # inertia_tensor = np.array([[a, b], [b, c]])
 
     # The eigenvalues give the axes lengths
@@ -822,6 +1255,19 @@ def weighted_props(regprops):
 
     pa = wrap_to_pi(pa + 0.5 * np.pi)
 
+    return major, minor, pa
+
+
+def weighted_props(regprops):
+    '''
+    Return the shape properties based on the weighted moments.
+    '''
+
+    wmu = regprops.weighted_moments_central
+
+    major, minor, pa = _shape_from_moments(wmu[0, 0], wmu[2, 0], wmu[1, 1],
+                                           wmu[0, 2])
+
     centroid = regprops.weighted_centroid
 
     return np.array([centroid[0], centroid[1], major, minor, pa])
@@ -4,6 +4,7 @@ import scipy.ndimage as nd
 import warnings
 from astropy.modeling.models import Ellipse2D
 import numpy as np
+from spectral_cube.masks import MaskBase
 
 try:
     import cv2
@@ -99,3 +100,364 @@ def fill_nans_with_noise(array, sigma, nsig=2, pad_size=0):
     array[nans] = array[all_noise][samps]
 
     return array
+
+
+class ChannelRangeMask(MaskBase):
+    '''
+    A 3D boolean mask made of a 2D footprint repeated over a range of
+    channels. The cube-sized array is never created; only the parts that are
+    indexed or combined with another array are made.
+
+    This can be passed directly to `SpectralCube.with_mask`.
+
+    Parameters
+    ----------
+    twoD_mask : np.ndarray
+        2D boolean footprint.
+    nchans : int
+        Number of spectral channels in the mask.
+    start : int, optional
+        First channel where the footprint is included.
+    end : int, optional
+        Channel after the last one where the footprint is included. Defaults
+        to nchans.
+    '''
+
+    # Ensure numpy defers to __rand__ for ndarray & ChannelRangeMask
+    __array_priority__ = 20
+
+    def __init__(self, twoD_mask, nchans, start=0, end=None):
+        twoD_mask = np.asarray(twoD_mask, dtype=bool)
+
+        if twoD_mask.ndim != 2:
+            raise TypeError("twoD_mask must be a 2D array.")
+
+        if end is None:
+            end = nchans
+
+        self._twoD_mask = twoD_mask
+        self._nchans = int(nchans)
+        self._start = min(max(int(start), 0), self._nchans)
+        self._end = max(min(int(end), self._nchans), self._start)
+
+    @property
+    def twoD_mask(self):
+        return self._twoD_mask
+
+    @property
+    def channel_range(self):
+        '''
+        The included channels, as (start, end).
+        '''
+        return self._start, self._end
+
+    @property
+    def shape(self):
+        return (self._nchans, ) + self._twoD_mask.shape
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def size(self):
+        return self._nchans * self._twoD_mask.size
+
+    @property
+    def dtype(self):
+        return np.dtype(bool)
+
+    def __len__(self):
+        return self._nchans
+
+    def _channels(self):
+        chans = np.zeros((self._nchans, 1, 1), dtype=bool)
+        chans[self._start:self._end] = True
+        return chans
+
+    def _view_array(self, view=()):
+        '''
+        Create the array for the given view only.
+        '''
+
+        if self._start == 0 and self._end == self._nchans:
+            return np.broadcast_to(self._twoD_mask, self.shape)[view].copy()
+
+        footprint = np.broadcast_to(self._twoD_mask, self.shape)[view]
+        chans = np.broadcast_to(self._channels(), self.shape)[view]
+
+        return footprint & chans
+
+    def __array__(self, dtype=None):
+        arr = self._view_array()
+        if dtype is not None:
+            return arr.astype(dtype)
+        return arr
+
+    def __getitem__(self, view):
+        '''
+        Slices return a new ChannelRangeMask. Any other indexing returns the
+        boolean array for the indexed elements.
+        '''
+
+        if not isinstance(view, tuple):
+            view = (view, )
+
+        if len(view) > 3 or \
+                not all(isinstance(sl, slice) for sl in view):
+            return self._view_array(view)
+
+        view = view + (slice(None), ) * (3 - len(view))
+
+        chan_idx = np.arange(self._nchans)[view[0]]
+        inside = (chan_idx >= self._start) & (chan_idx < self._end)
+
+        if inside.any():
+            start = np.flatnonzero(inside)[0]
+            end = start + inside.sum()
+        else:
+            start = end = 0
+
+        return ChannelRangeMask(self._twoD_mask[view[1:]], chan_idx.size,
+                                start=start, end=end)
+
+    def __and__(self, other):
+        if isinstance(other, ChannelRangeMask):
+            if other.shape != self.shape:
+                raise ValueError("Shapes do not match: {0} vs. {1}"
+                                 .format(self.shape, other.shape))
+            return ChannelRangeMask(self._twoD_mask & other._twoD_mask,
+                                    self._nchans,
+                                    start=max(self._start, other._start),
+                                    end=min(self._end, other._end))
+        elif isinstance(other, MaskBase):
+            return super(ChannelRangeMask, self).__and__(other)
+
+        other = np.asarray(other)
+
+        if other.shape != self.shape:
+            return self._view_array() & other
+
+        # Only the output array needs to be allocated
+        out = other & self._twoD_mask
+        out[:self._start] = False
+        out[self._end:] = False
+
+        return out
+
+    __rand__ = __and__
+
+    def sum(self, axis=None):
+        '''
+        Number of included elements, computed from the footprint.
+        '''
+
+        nincluded = self._end - self._start
+
+        if axis is None:
+            return self._twoD_mask.sum() * nincluded
+        elif axis == 0:
+            return self._twoD_mask.astype(int) * nincluded
+        elif axis in [(1, 2), (2, 1)]:
+            return self._channels().ravel() * self._twoD_mask.sum()
+
+        return self._view_array().sum(axis=axis)
+
+    def any(self):
+        return self._end > self._start and self._twoD_mask.any()
+
+    def _validate_wcs(self, new_data=None, new_wcs=None, **kwargs):
+        '''
+        The mask is defined on the pixel grid, so only the shape is checked.
+        '''
+        if new_data is not None and new_data.shape != self.shape:
+            raise ValueError("data shape does not match the mask shape.")
+
+    def _include(self, data=None, wcs=None, view=()):
+        return self._view_array(view)
+
+    def with_spectral_unit(self, unit, velocity_convention=None,
+                           rest_value=None):
+        '''
+        The mask does not depend on the WCS, so this returns the same mask.
+        '''
+        return self
+
+
+# Number of set bits in each possible byte
+_BIT_COUNTS = np.array([bin(i).count("1") for i in range(256)],
+                       dtype=np.int64)
+
+
+class PackedMask(object):
+    '''
+    A 3D boolean mask stored with 8 pixels per byte. The bits are packed
+    along the last (x) axis, so single channels, rows and spatial cut-outs
+    are decoded without unpacking the rest of the mask.
+
+    Indexing returns a new boolean array, so changes must be made by
+    assigning to the mask. Assigning to a slab only decodes and re-encodes
+    the rows that it covers.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the mask.
+    fill_value : bool, optional
+        Initial value of every element.
+    '''
+
+    def __init__(self, shape, fill_value=False):
+        super(PackedMask, self).__init__()
+
+        if len(shape) != 3:
+            raise TypeError("shape must be 3D.")
+
+        self._shape = tuple(int(size) for size in shape)
+
+        row = np.packbits(np.ones(self._shape[2], dtype=bool) * fill_value)
+        self._packed = np.empty(self._shape[:2] + row.shape, dtype=np.uint8)
+        self._packed[:] = row
+
+    @staticmethod
+    def from_array(mask):
+        '''
+        Pack a boolean array.
+        '''
+
+        if isinstance(mask, PackedMask):
+            return mask
+
+        mask = np.asarray(mask, dtype=bool)
+
+        self = PackedMask(mask.shape)
+        self._packed = np.packbits(mask, axis=-1)
+
+        return self
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def size(self):
+        return int(np.prod(self._shape))
+
+    @property
+    def dtype(self):
+        return np.dtype(bool)
+
+    @property
+    def nbytes(self):
+        return self._packed.nbytes
+
+    def __len__(self):
+        return self._shape[0]
+
+    def _normalize(self, view):
+        '''
+        Return a 3-element view, or None if the view uses anything other than
+        integers and slices.
+        '''
+
+        if not isinstance(view, tuple):
+            view = (view, )
+
+        if len(view) > 3 or \
+                not all(isinstance(sl, (slice, int, np.integer))
+                        for sl in view):
+            return None
+
+        return view + (slice(None), ) * (3 - len(view))
+
+    def _unpack(self, packed):
+        return np.unpackbits(packed, axis=-1)[..., :self._shape[2]].view(bool)
+
+    def __getitem__(self, view):
+        norm_view = self._normalize(view)
+
+        if norm_view is None:
+            return np.asarray(self)[view]
+
+        chans, rows, cols = norm_view
+
+        if isinstance(cols, slice) and cols.step in (None, 1):
+            start, stop = cols.indices(self._shape[2])[:2]
+            stop = max(start, stop)
+
+            # Only unpack the bytes covering the columns
+            bstart, bstop = start // 8, -(-stop // 8)
+            bits = np.unpackbits(self._packed[chans, rows, bstart:bstop],
+                                 axis=-1)
+
+            return bits[..., start - 8 * bstart:stop - 8 * bstart].view(bool)
+
+        return self._unpack(self._packed[chans, rows])[..., cols]
+
+    def __setitem__(self, view, value):
+        norm_view = self._normalize(view)
+
+        if norm_view is None:
+            mask = np.asarray(self)
+            mask[view] = value
+            self._packed = np.packbits(mask, axis=-1)
+            return
+
+        chans, rows, cols = norm_view
+
+        # Decode the affected rows, update and pack them again
+        slab = self._unpack(self._packed[chans, rows]).copy()
+        slab[..., cols] = value
+        self._packed[chans, rows] = np.packbits(slab, axis=-1)
+
+    def __array__(self, dtype=None):
+        arr = self._unpack(self._packed)
+        if dtype is not None:
+            return arr.astype(dtype)
+        return arr
+
+    def channel(self, i):
+        '''
+        Decode a single channel.
+        '''
+        return self[i]
+
+    def sum(self):
+        '''
+        Number of True elements, counted without decoding the mask.
+        '''
+        counts = np.bincount(self._packed.ravel(), minlength=256)
+        return int(counts.dot(_BIT_COUNTS))
+
+    def save(self, filename):
+        '''
+        Save to a compressed .npz file.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the output file.
+        '''
+        np.savez_compressed(filename, packed=self._packed,
+                            shape=np.array(self._shape))
+
+    @staticmethod
+    def load(filename):
+        '''
+        Load a mask saved with `PackedMask.save`.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the .npz file.
+        '''
+
+        with np.load(filename) as data:
+            self = PackedMask(tuple(data["shape"]))
+            self._packed = data["packed"]
+
+        return self
@@ -0,0 +1,231 @@
+
+import numpy as np
+import os
+import hashlib
+from scipy.stats import norm
+from spectral_cube import SpectralCube
+
+from utils import sig_clip, _iter_chunks
+
+
+def _truncation_factor(nsig):
+    '''
+    Ratio of the standard deviation of a normal distribution truncated at
+    +/- nsig to the untruncated standard deviation.
+    '''
+
+    nsig = float(nsig)
+    var = 1 - 2 * nsig * norm.pdf(nsig) / (2 * norm.cdf(nsig) - 1)
+    return np.sqrt(var)
+
+
+def _cube_fingerprint(cube, num_chans=5):
+    '''
+    Checksum of the shape and a few evenly spaced channels, used to check
+    that a cached noise model was made from the same data. Masking,
+    regridding or a different cube of the same shape all change it.
+    '''
+
+    checksum = hashlib.sha1(str(tuple(cube.shape)).encode())
+
+    chans = np.unique(np.linspace(0, cube.shape[0] - 1,
+                                  num_chans).astype(int))
+    for chan in chans:
+        if isinstance(cube, SpectralCube):
+            plane = cube.filled_data[chan].value
+        elif hasattr(cube, "unit"):
+            plane = cube[chan].value
+        else:
+            plane = cube[chan]
+
+        plane = np.ascontiguousarray(plane, dtype=np.float64)
+        checksum.update(plane.tobytes())
+
+    return checksum.hexdigest()
+
+
+class NoiseModel(object):
+    '''
+    Noise level in each channel of a cube, and optionally a map of the noise
+    in each spatial pixel.
+
+    Parameters
+    ----------
+    channel_sigma : np.ndarray
+        Noise level of each channel. NaN for channels without an estimate
+        (e.g., fully masked channels), which use the median instead.
+    noise_map : np.ndarray, optional
+        Noise level of each spatial pixel.
+    nsig : float, optional
+        Clipping level used to estimate channel_sigma.
+    map_nsig : float, optional
+        Clipping level used to make the noise map.
+    cube_shape : tuple, optional
+        Shape of the cube the model was made from.
+    fingerprint : str, optional
+        Checksum of the cube the model was made from. See
+        `_cube_fingerprint`.
+    '''
+    def __init__(self, channel_sigma, noise_map=None, nsig=10,
+                 map_nsig=None, cube_shape=None, fingerprint=None):
+        super(NoiseModel, self).__init__()
+
+        channel_sigma = np.asarray(channel_sigma, dtype=np.float64)
+
+        if channel_sigma.ndim != 1:
+            raise TypeError("channel_sigma must be a 1D array.")
+
+        if np.isnan(channel_sigma).all():
+            raise ValueError("No channel has a noise estimate.")
+
+        if np.nanmin(channel_sigma) < 0 or np.isinf(channel_sigma).any():
+            raise ValueError("channel_sigma must be positive and finite.")
+
+        self.channel_sigma = channel_sigma
+        self.noise_map = noise_map
+        self.nsig = nsig
+        self.map_nsig = map_nsig
+        self.cube_shape = cube_shape
+        self.fingerprint = fingerprint
+
+    @staticmethod
+    def from_cube(cube, nsig=10, chunk_size=1, noise_map=False, map_nsig=3,
+                  cache_file=None):
+        '''
+        Estimate the noise in each channel with `~basics.utils.sig_clip` in a
+        single pass through the cube. Channels without any finite, non-zero
+        values have no estimate and are set to NaN.
+
+        Parameters
+        ----------
+        cube : SpectralCube or np.ndarray
+            Cube to estimate the noise from.
+        nsig : float, optional
+            Clipping level for the channel noise.
+        chunk_size : int, optional
+            Number of channels to read at once.
+        noise_map : bool, optional
+            Also make a map of the noise in each pixel from the values within
+            map_nsig of each channel's noise level.
+        map_nsig : float, optional
+            Clipping level used for the noise map.
+        cache_file : str, optional
+            Load the noise model from this file if it exists and was made
+            from the same data, checked from the shape and a checksum of a
+            few channels (see `_cube_fingerprint`). Otherwise, the model is
+            saved to it.
+        '''
+
+        fingerprint = None
+
+        if cache_file is not None:
+            fingerprint = _cube_fingerprint(cube)
+
+        if cache_file is not None and os.path.exists(cache_file):
+            self = NoiseModel.load(cache_file)
+
+            same_shape = self.cube_shape is not None and \
+                tuple(self.cube_shape) == tuple(cube.shape)
+            same_data = self.fingerprint == fingerprint
+            has_map = not noise_map or \
+                (self.noise_map is not None and self.map_nsig == map_nsig)
+
+            if same_shape and same_data and has_map and self.nsig == nsig:
+                return self
+
+        channel_sigma = np.empty(cube.shape[0])
+
+        if noise_map:
+            counts = np.zeros(cube.shape[1:])
+            sums = np.zeros(cube.shape[1:])
+            sums_sq = np.zeros(cube.shape[1:])
+
+        chan = 0
+        for chunk in _iter_chunks(cube, chunk_size=chunk_size):
+            for plane in chunk:
+                # Fully masked or blank channels have no estimate
+                if not (np.isfinite(plane) & (plane != 0)).any():
+                    channel_sigma[chan] = np.NaN
+                    chan += 1
+                    continue
+
+                channel_sigma[chan] = sig_clip(plane, nsig=nsig)
+
+                if noise_map:
+                    noise = np.abs(plane) <= map_nsig * channel_sigma[chan]
+                    vals = np.where(noise, plane, 0.)
+                    counts += noise
+                    sums += vals
+                    sums_sq += vals ** 2
+
+                chan += 1
+
+        if noise_map:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = sums / counts
+                std_map = np.sqrt(np.maximum(sums_sq / counts - mean ** 2,
+                                             0.))
+            std_map /= _truncation_factor(map_nsig)
+            std_map[counts < 2] = np.NaN
+        else:
+            std_map = None
+            map_nsig = None
+
+        self = NoiseModel(channel_sigma, noise_map=std_map, nsig=nsig,
+                          map_nsig=map_nsig, cube_shape=cube.shape,
+                          fingerprint=fingerprint)
+
+        if cache_file is not None:
+            self.save(cache_file)
+
+        return self
+
+    @property
+    def sigma(self):
+        '''
+        Median of the channel noise levels.
+        '''
+        return np.nanmedian(self.channel_sigma)
+
+    def __getitem__(self, chan):
+        # Channels without an estimate fall back to the median
+        sigma = self.channel_sigma[chan]
+        return np.where(np.isnan(sigma), self.sigma, sigma)[()]
+
+    def __len__(self):
+        return len(self.channel_sigma)
+
+    def save(self, filename):
+        '''
+        Save to a .npz file.
+        '''
+
+        arrays = dict(channel_sigma=self.channel_sigma,
+                      nsig=np.array(self.nsig))
+        if self.noise_map is not None:
+            arrays["noise_map"] = self.noise_map
+        if self.map_nsig is not None:
+            arrays["map_nsig"] = np.array(self.map_nsig)
+        if self.cube_shape is not None:
+            arrays["cube_shape"] = np.array(self.cube_shape)
+        if self.fingerprint is not None:
+            arrays["fingerprint"] = np.array(self.fingerprint)
+
+        np.savez(filename, **arrays)
+
+    @staticmethod
+    def load(filename):
+
+        with np.load(filename) as data:
+            noise_map = data["noise_map"] if "noise_map" in data else None
+            map_nsig = float(data["map_nsig"]) if "map_nsig" in data \
+                else None
+            cube_shape = tuple(data["cube_shape"]) if "cube_shape" in data \
+                else None
+            fingerprint = str(data["fingerprint"]) if "fingerprint" in data \
+                else None
+            self = NoiseModel(data["channel_sigma"], noise_map=noise_map,
+                              nsig=float(data["nsig"]), map_nsig=map_nsig,
+                              cube_shape=cube_shape, fingerprint=fingerprint)
+
+        return self
@@ -1,4 +1,5 @@
 import numpy as np
+import warnings
 from scipy import ndimage as ndi
 
 '''
@@ -152,6 +153,160 @@ def _line_profile_coordinates(src, dst, linewidth=1):
     return np.array([perp_rows, perp_cols])
 
 
+def _radial_profile_coordinates(blobs, thetas, extend_factor=1.5,
+                                linewidth=1):
+    """Coordinates of radial profiles from the centre of each blob to its
+    extended edge at each theta.
+
+    Each ray is sampled as in `_line_profile_coordinates`, so rays have
+    different numbers of samples. The samples are padded to the longest ray.
+
+    Returns
+    -------
+    coords : array, shape (2, nblobs * ntheta, nr, linewidth), float
+        The coordinates of each sample.
+    line_coords : array, shape (2, nblobs * ntheta, nr), float
+        The coordinates along the centre of each ray.
+    valid : array, shape (nblobs * ntheta, nr), bool
+        Whether each sample is part of the ray.
+    end_pts : array, shape (nblobs * ntheta, 2), float
+        The end point of each ray.
+    """
+
+    blobs = np.atleast_2d(np.asarray(blobs, dtype=float))
+
+    y0 = blobs[:, 0, np.newaxis]
+    x0 = blobs[:, 1, np.newaxis]
+    a = extend_factor * blobs[:, 2, np.newaxis]
+    b = extend_factor * blobs[:, 3, np.newaxis]
+    pa = blobs[:, 4, np.newaxis]
+
+    cost = np.cos(thetas)[np.newaxis]
+    sint = np.sin(thetas)[np.newaxis]
+
+    end_rows = y0 + a * cost * np.sin(pa) + b * sint * np.cos(pa)
+    end_cols = x0 + a * cost * np.cos(pa) - b * sint * np.sin(pa)
+
+    src_rows = np.repeat(y0, len(thetas), axis=1).ravel()
+    src_cols = np.repeat(x0, len(thetas), axis=1).ravel()
+    d_rows = end_rows.ravel() - src_rows
+    d_cols = end_cols.ravel() - src_cols
+
+    # we add one because we include the last point in the profile
+    lengths = np.ceil(np.hypot(d_rows, d_cols) + 1).astype(int)
+    nr = lengths.max()
+
+    steps = np.arange(nr)[np.newaxis]
+    valid = steps < lengths[:, np.newaxis]
+
+    # Fraction along each ray, as from np.linspace
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fracs = np.where(lengths[:, np.newaxis] > 1,
+                         steps / (lengths[:, np.newaxis] - 1.), 0.)
+
+    line_rows = src_rows[:, np.newaxis] + fracs * d_rows[:, np.newaxis]
+    line_cols = src_cols[:, np.newaxis] + fracs * d_cols[:, np.newaxis]
+
+    # we subtract 1 from linewidth to change from pixel-counting
+    # (make this line 3 pixels wide) to point distances (the
+    # distance between pixel centers)
+    ray_thetas = np.arctan2(d_rows, d_cols)
+    col_width = (linewidth - 1) * np.sin(-ray_thetas) / 2
+    row_width = (linewidth - 1) * np.cos(ray_thetas) / 2
+
+    perp = np.linspace(-1, 1, linewidth) if linewidth > 1 else np.zeros(1)
+
+    perp_rows = line_rows[..., np.newaxis] + \
+        row_width[:, np.newaxis, np.newaxis] * perp
+    perp_cols = line_cols[..., np.newaxis] + \
+        col_width[:, np.newaxis, np.newaxis] * perp
+
+    end_pts = np.column_stack([end_rows.ravel(), end_cols.ravel()])
+
+    return np.array([perp_rows, perp_cols]), \
+        np.array([line_rows, line_cols]), valid, end_pts
+
+
+def radial_profile_array(image, blobs, ntheta=360, extend_factor=1.5,
+                         linewidth=1, order=1, mode='constant', cval=0.0,
+                         return_thetas=False):
+    '''
+    Radial profiles from the centres of many bubbles to their edges, with
+    the image interpolated once for all of the profiles.
+
+    Parameters
+    ----------
+    image : 2D np.ndarray
+        Image to calculate the profiles from.
+    blobs : np.ndarray
+        The y, x, major radius, minor radius, and position angle of each
+        blob.
+    ntheta : int, optional
+        Number of angles to compute the profile at.
+    extend_factor : float, optional
+        Number of times past the major radius to compute the profile to.
+    linewidth : int, optional
+        Width of the profiles, perpendicular to the line.
+    order : int, optional
+        Order of the spline interpolation.
+    mode : {'constant', 'nearest', 'reflect', 'mirror', 'wrap'}, optional
+        How to compute any values falling outside of the image.
+    cval : float, optional
+        If `mode` is 'constant', what constant value to use outside the image.
+    return_thetas : bool, optional
+        Return the array of theta values.
+
+    Returns
+    -------
+    profiles : np.ndarray
+        Profile of each blob at each theta, with shape (nblobs, ntheta, nr).
+        nr is the number of samples in the longest profile.
+    dists : np.ndarray
+        Distance of each sample from the centre of the blob.
+    valid : np.ndarray
+        Boolean array of the samples that are part of each profile and are
+        finite.
+    end_pts : np.ndarray
+        End point of each profile, with shape (nblobs, ntheta, 2).
+    thetas : np.ndarray, optional
+        Returned when return_thetas is enabled.
+    '''
+
+    blobs = np.atleast_2d(np.asarray(blobs, dtype=float))
+    nblobs = len(blobs)
+
+    thetas = np.linspace(0.0, 2 * np.pi, ntheta)
+
+    coords, line_coords, valid, end_pts = \
+        _radial_profile_coordinates(blobs, thetas,
+                                    extend_factor=extend_factor,
+                                    linewidth=linewidth)
+
+    pixels = ndi.map_coordinates(image, coords.reshape((2, -1)),
+                                 order=order, mode=mode, cval=cval)
+    pixels = pixels.reshape(coords.shape[1:])
+
+    with warnings.catch_warnings():
+        # All-NaN slices are marked invalid below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        profiles = np.nanmean(pixels, axis=-1)
+
+    valid = np.logical_and(valid, np.isfinite(profiles))
+
+    src = np.repeat(blobs[:, :2], ntheta, axis=0)
+    dists = np.sqrt((line_coords[0] - src[:, :1]) ** 2 +
+                    (line_coords[1] - src[:, 1:]) ** 2)
+
+    shape = (nblobs, ntheta, -1)
+    out = (profiles.reshape(shape), dists.reshape(shape),
+           valid.reshape(shape), end_pts.reshape((nblobs, ntheta, 2)))
+
+    if return_thetas:
+        return out + (thetas, )
+
+    return out
+
+
 def radial_profiles(image, blob, ntheta=360, verbose=False,
                     extend_factor=1.5, append_end=False, return_thetas=False,
                     **kwargs):
@@ -175,6 +330,7 @@ def radial_profiles(image, blob, ntheta=360, verbose=False,
         Append the end point onto the returned list.
     return_thetas : bool, optional
         Return the array of theta values.
+    kwargs : passed to `radial_profile_array`.
 
     Returns
     -------
@@ -185,21 +341,20 @@ def radial_profiles(image, blob, ntheta=360, verbose=False,
         Returned when return_thetas is enabled.
     '''
 
-    y0, x0, a, b, pa = blob.copy()[:5]
-
-    a *= extend_factor
-    b *= extend_factor
+    all_profiles, all_dists, valid, end_pts, thetas = \
+        radial_profile_array(image, np.asarray(blob)[:5], ntheta=ntheta,
+                             extend_factor=extend_factor, return_thetas=True,
+                             **kwargs)
 
-    thetas = np.linspace(0.0, 2*np.pi, ntheta)
+    y0, x0 = blob[:2]
 
     profiles = []
 
     for i, theta in enumerate(thetas):
 
-        end_pt = (y0 + a*np.cos(theta)*np.sin(pa) + b*np.sin(theta)*np.cos(pa),
-                  x0 + a*np.cos(theta)*np.cos(pa) - b*np.sin(theta)*np.sin(pa))
-
-        profile, dists = profile_line(image, (y0, x0), end_pt, **kwargs)
+        end_pt = tuple(end_pts[0, i])
+        profile = all_profiles[0, i][valid[0, i]]
+        dists = all_dists[0, i][valid[0, i]]
 
         if append_end:
             profiles.append((dists, profile, end_pt))
@@ -0,0 +1,261 @@
+
+import os
+import sys
+import time
+import json
+from contextlib import contextmanager
+
+try:
+    import resource
+    _resource_flag = True
+except ImportError:
+    # Not available on Windows
+    _resource_flag = False
+
+try:
+    import psutil
+    _psutil_flag = True
+except ImportError:
+    _psutil_flag = False
+
+
+def peak_rss():
+    '''
+    Peak resident set size of this process in MB, over the lifetime of the
+    process. NaN when it cannot be determined.
+    '''
+
+    if not _resource_flag:
+        return float('nan')
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Bytes on OSX, kB elsewhere
+    if sys.platform == "darwin":
+        return rss / 1024. ** 2
+    return rss / 1024.
+
+
+def current_rss():
+    '''
+    Current resident set size of this process in MB. Uses psutil when it is
+    installed, and otherwise /proc on Linux. NaN when it cannot be
+    determined.
+    '''
+
+    if _psutil_flag:
+        return psutil.Process(os.getpid()).memory_info().rss / 1024. ** 2
+
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024. ** 2
+    except (IOError, OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+def cpu_time():
+    '''
+    User + system CPU time of this process.
+    '''
+    times = os.times()
+    return times[0] + times[1]
+
+
+class StageProfiler(object):
+    '''
+    Wall time, CPU time, peak RSS and item counts for the stages of a run.
+
+    Each record is a dictionary with the stage name, channel (None when not
+    tied to a channel), number of calls, wall and CPU time in seconds, the
+    process ID of the process that ran it, and an optional item count.
+
+    The memory use, all in MB, is recorded as:
+
+    * rss_start, rss_end : The current RSS when the stage started and
+      stopped, so rss_end - rss_start is the memory the stage kept.
+    * peak_rss_increase : How much the stage raised the peak RSS of the
+      process. This is zero unless the stage set a new peak, so it gives
+      the memory a stage needed beyond any earlier stage.
+    * peak_rss : The peak RSS of the process when the stage stopped. This
+      is the high-water mark for the process up to that point, not for the
+      stage.
+
+    Accumulated records keep the first rss_start and last rss_end, and sum
+    the peak_rss_increase.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        When disabled, nothing is recorded.
+    log_file : str, optional
+        Append the records to this file as JSON lines when `write_log` is
+        called.
+    '''
+    def __init__(self, enabled=True, log_file=None):
+        super(StageProfiler, self).__init__()
+
+        self.enabled = enabled
+        self.log_file = log_file
+        self.records = []
+        self._accumulated = {}
+
+    def start(self, name, channel=None):
+        '''
+        Start timing a stage. Pass the returned token to `stop`.
+        '''
+
+        if not self.enabled:
+            return None
+
+        return (name, channel, time.time(), cpu_time(), current_rss(),
+                peak_rss())
+
+    def stop(self, token, count=None, accumulate=False):
+        '''
+        Finish timing the stage started with `start`. With accumulate
+        enabled, repeat calls with the same name and channel are summed into
+        one record.
+        '''
+
+        if token is None:
+            return
+
+        name, channel, wall0, cpu0, rss0, peak0 = token
+
+        peak = peak_rss()
+
+        record = {"stage": name, "channel": channel, "calls": 1,
+                  "wall": time.time() - wall0, "cpu": cpu_time() - cpu0,
+                  "rss_start": rss0, "rss_end": current_rss(),
+                  "peak_rss_increase": peak - peak0, "peak_rss": peak,
+                  "pid": os.getpid(), "count": count}
+
+        if accumulate:
+            self._accumulate(record)
+        else:
+            self.records.append(record)
+
+    @contextmanager
+    def stage(self, name, channel=None, count=None, accumulate=False):
+        '''
+        Record the time spent in the block. See `stop`. The stage is
+        recorded even when the block raises an exception.
+        '''
+
+        token = self.start(name, channel=channel)
+        try:
+            yield
+        finally:
+            self.stop(token, count=count, accumulate=accumulate)
+
+    def timed_iter(self, name, iterable, channel=None):
+        '''
+        Record the time spent producing each item of a generator in one
+        accumulated record. The count is the number of items.
+        '''
+
+        iterator = iter(iterable)
+        num = 0
+        while True:
+            with self.stage(name, channel=channel, accumulate=True):
+                item = next(iterator, StopIteration)
+
+            if item is StopIteration:
+                if self.enabled:
+                    self._accumulated[(name, channel)]["count"] = num
+                return
+
+            num += 1
+            yield item
+
+    def _accumulate(self, record):
+        key = (record["stage"], record["channel"])
+
+        if key not in self._accumulated:
+            self._accumulated[key] = record
+            self.records.append(record)
+            return
+
+        prev = self._accumulated[key]
+        prev["calls"] += 1
+        prev["wall"] += record["wall"]
+        prev["cpu"] += record["cpu"]
+        prev["rss_end"] = record["rss_end"]
+        prev["peak_rss_increase"] += record["peak_rss_increase"]
+        prev["peak_rss"] = max(prev["peak_rss"], record["peak_rss"])
+        if record["count"] is not None:
+            prev["count"] = (prev["count"] or 0) + record["count"]
+
+    def extend(self, records):
+        '''
+        Add records made elsewhere (e.g., in a pool worker).
+        '''
+        if self.enabled:
+            self.records.extend(records)
+
+    def summary(self):
+        '''
+        Totals for each stage over all channels and processes.
+
+        Returns
+        -------
+        totals : dict
+            Wall time, CPU time, calls, count, the summed change in RSS and
+            increase in the peak RSS, and the largest peak RSS for each
+            stage.
+        '''
+
+        totals = {}
+        for rec in self.records:
+            tot = totals.setdefault(rec["stage"],
+                                    {"calls": 0, "wall": 0., "cpu": 0.,
+                                     "count": 0, "rss_change": 0.,
+                                     "peak_rss_increase": 0.,
+                                     "peak_rss": 0.})
+            tot["calls"] += rec["calls"]
+            tot["wall"] += rec["wall"]
+            tot["cpu"] += rec["cpu"]
+            tot["count"] += rec["count"] or 0
+            tot["rss_change"] += rec["rss_end"] - rec["rss_start"]
+            tot["peak_rss_increase"] += rec["peak_rss_increase"]
+            tot["peak_rss"] = max(tot["peak_rss"], rec["peak_rss"])
+
+        return totals
+
+    def report(self, file=None):
+        '''
+        Print the summary as a table, ordered by wall time.
+        '''
+
+        if file is None:
+            file = sys.stdout
+
+        totals = self.summary()
+
+        file.write("{0:<24}{1:>8}{2:>12}{3:>12}{4:>10}{5:>14}{6:>14}\n"
+                   .format("Stage", "Calls", "Wall (s)", "CPU (s)", "Count",
+                           "RSS +/- (MB)", "Peak + (MB)"))
+        for name in sorted(totals, key=lambda key: -totals[key]["wall"]):
+            tot = totals[name]
+            file.write("{0:<24}{1:>8}{2:>12.3f}{3:>12.3f}{4:>10}{5:>14.1f}"
+                       "{6:>14.1f}\n"
+                       .format(name, tot["calls"], tot["wall"], tot["cpu"],
+                               tot["count"], tot["rss_change"],
+                               tot["peak_rss_increase"]))
+
+    def write_log(self, log_file=None, **extra):
+        '''
+        Append the records to a JSON-lines file. Extra keywords are added
+        to every record (e.g., the name of the cube).
+        '''
+
+        if log_file is None:
+            log_file = self.log_file
+        if log_file is None:
+            raise ValueError("No log_file given.")
+
+        with open(log_file, "a") as f:
+            for rec in self.records:
+                rec = dict(rec, **extra)
+                f.write(json.dumps(rec) + "\n")
@@ -6,6 +6,7 @@ from astropy import wcs
 from astropy.modeling import Fittable2DModel, Parameter
 from astropy.modeling.utils import ellipse_extent
 from scipy.special import lambertw
+from scipy import ndimage as nd
 
 from basics.log import overlap_metric
 
@@ -173,6 +174,114 @@ def add_gaussian_holes(array, nholes=100, rad_max=30, rad_min=10,
     return array
 
 
+def make_ppv_cube(shape=(16, 128, 128), hole_density=1.0, noise=0.05,
+                  rad_min=6, rad_max=15, hole_channels=(3, 8), beam_pix=3.,
+                  seed=0, return_info=False):
+    '''
+    Reproducible synthetic PPV cube of a disk with holes. Each hole is
+    placed with `add_holes` and persists over a random range of channels.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the cube (channels, y, x).
+    hole_density : float
+        Number of holes per 100 x 100 pixels.
+    noise : float
+        Noise standard deviation relative to the peak of the disk.
+    rad_min, rad_max : float
+        Range of the hole major radii in pixels.
+    hole_channels : tuple
+        Range of the number of channels a hole is present in, limited to
+        the number of channels in the cube.
+    beam_pix : float
+        FWHM of the beam in pixels. The disk is smoothed by the beam before
+        the noise is added.
+    seed : int
+        Random seed.
+    return_info : bool
+        Also return the hole parameters [y, x, major, minor, pa] and the
+        channel range of each hole.
+
+    Returns
+    -------
+    cube : SpectralCube
+        The synthetic cube.
+    '''
+
+    from spectral_cube import SpectralCube
+    from astropy.io import fits
+
+    nchan, ylim, xlim = shape
+
+    np.random.seed(seed)
+
+    nholes = int(round(hole_density * ylim * xlim / 1.e4))
+
+    # add_holes always places at least one hole
+    if nholes > 0:
+        _, params = add_holes((ylim, xlim), nholes=nholes, rad_max=rad_max,
+                              rad_min=rad_min, return_info=True)
+        # Move the centres into the array frame
+        params[:, 0] += ylim / 2
+        params[:, 1] += xlim / 2
+    else:
+        params = np.empty((0, 5))
+
+    # Holes cannot span more channels than the cube has
+    num_chans = np.random.random_integers(min(hole_channels[0], nchan),
+                                          min(hole_channels[1], nchan),
+                                          size=len(params))
+    starts = np.array([np.random.random_integers(0, nchan - num)
+                       for num in num_chans])
+    chan_ranges = np.vstack([starts, starts + num_chans - 1]).T
+
+    yy, xx = np.mgrid[:ylim, :xlim]
+    disk = np.exp(-((yy - ylim / 2.) ** 2 + (xx - xlim / 2.) ** 2) /
+                  (2 * (0.4 * max(ylim, xlim)) ** 2))
+
+    hole_masks = [Ellipse2D(True, par[1], par[0], par[2], par[3],
+                            par[4])(xx, yy).astype(bool) for par in params]
+
+    smooth = beam_pix / np.sqrt(8 * np.log(2))
+
+    data = np.empty(shape)
+    for chan in range(nchan):
+        plane = disk.copy()
+        for mask, (start, end) in zip(hole_masks, chan_ranges):
+            if start <= chan <= end:
+                plane[mask] = 0.
+        data[chan] = nd.gaussian_filter(plane, smooth)
+
+    data += np.random.normal(0, noise, shape)
+
+    hdr = fits.Header()
+    hdr['NAXIS'] = 3
+    for i, (ctype, cdelt) in enumerate([("RA---SIN", -1.5 / 3600.),
+                                        ("DEC--SIN", 1.5 / 3600.)]):
+        hdr['CTYPE{}'.format(i + 1)] = ctype
+        hdr['CRVAL{}'.format(i + 1)] = 150. if i == 0 else 30.
+        hdr['CDELT{}'.format(i + 1)] = cdelt
+        hdr['CRPIX{}'.format(i + 1)] = shape[2 - i] / 2.
+        hdr['CUNIT{}'.format(i + 1)] = 'deg'
+    hdr['CTYPE3'] = 'VRAD'
+    hdr['CRVAL3'] = 0.
+    hdr['CDELT3'] = 2600.
+    hdr['CRPIX3'] = 1
+    hdr['CUNIT3'] = 'm/s'
+    hdr['BMAJ'] = beam_pix * 1.5 / 3600.
+    hdr['BMIN'] = beam_pix * 1.5 / 3600.
+    hdr['BPA'] = 0.
+    hdr['BUNIT'] = 'K'
+
+    cube = SpectralCube.read(fits.PrimaryHDU(data, hdr))
+
+    if return_info:
+        return cube, params, chan_ranges
+
+    return cube
+
+
 class InvertedEllipse2D(Fittable2DModel):
     """
     A 2D Ellipse model.
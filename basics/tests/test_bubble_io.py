@@ -0,0 +1,43 @@
+
+import os
+import numpy as np
+import numpy.testing as npt
+import astropy.units as u
+
+from basics.bubble_objects import Bubble2D, RegionTable
+from basics.bubble_io import write_bubble_file, BubbleFile
+
+
+def test_bubble_file_roundtrip(tmpdir):
+
+    props = np.array([[10., 12., 5., 3., 0.2, 1., 0.8, 0.1, 0.01],
+                      [20., 22., 4., 4., 0., 2., 0.6, 0.2, 0.02]])
+    coords = [np.array([[1., 2.], [3., 4.]]), None]
+
+    bubbles = [Bubble2D(prop, shell_coords=coord, channel=3,
+                        distance=1 * u.Mpc)
+               for prop, coord in zip(props, coords)]
+
+    table = RegionTable.from_arrays(props, [np.array([[5., 6.]]),
+                                            np.array([[7., 8.]])])
+
+    filename = os.path.join(str(tmpdir), "bubbles.npz")
+
+    write_bubble_file(filename, bubbles=bubbles, regions=[table, table[1:]],
+                      metadata={"sigma": 0.5, "distance": 1 * u.Mpc})
+
+    with BubbleFile(filename) as bubble_file:
+        assert len(bubble_file) == 2
+        assert bubble_file.metadata["distance"] == 1 * u.Mpc
+
+        bub = bubble_file[1]
+        npt.assert_allclose(bub.params, bubbles[1].params)
+        assert bub.shell_coords is None
+        assert bub.distance == bubbles[1].distance
+
+        npt.assert_allclose(bubble_file[0].shell_coords, coords[0])
+
+        regions = bubble_file.regions
+        assert len(regions) == 2
+        npt.assert_allclose(regions[0].params, table.params)
+        npt.assert_allclose(regions[1].all_shell_coords(), [[7., 8.]])
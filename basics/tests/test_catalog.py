@@ -0,0 +1,81 @@
+
+import os
+import pytest
+import numpy as np
+import numpy.testing as npt
+import astropy.units as u
+from astropy.table import Table, Column
+from astropy.coordinates import SkyCoord
+
+from basics.bubble_catalog import (PPV_Catalog, write_catalog_store,
+                                   read_table, write_table)
+
+
+def _make_table(num):
+    coords = SkyCoord(np.linspace(10, 11, num), np.linspace(40, 41, num),
+                      unit=(u.deg, u.deg))
+    diams = Column(np.linspace(50, 500, num), name="diameter_physical",
+                   unit=u.pc, description="Physical diameter")
+    types = Column(np.arange(num) % 3, name="bubble_type",
+                   unit=u.dimensionless_unscaled)
+    return Table([coords, diams, types])
+
+
+def test_catalog_store(tmpdir):
+
+    tables = {"NGC_628": _make_table(10), "NGC_3031": _make_table(4)}
+
+    filename = os.path.join(str(tmpdir), "store.npz")
+
+    write_catalog_store(filename, tables)
+
+    cat = PPV_Catalog.from_file(filename)
+    assert len(cat.table) == 14
+    assert cat.table.colnames == ["galaxy", "col0", "diameter_physical",
+                                  "bubble_type"]
+    npt.assert_allclose(cat.table["col0"].ra.deg[:4],
+                        tables["NGC_3031"]["col0"].ra.deg)
+
+    cat = PPV_Catalog.from_file(filename, columns=["diameter_physical"],
+                                where=[("galaxy", "==", "NGC_628"),
+                                       ("diameter_physical", ">", 200 * u.pc)])
+    assert cat.table.colnames == ["diameter_physical"]
+    assert cat.table["diameter_physical"].unit == u.pc
+    npt.assert_allclose(cat.table["diameter_physical"],
+                        tables["NGC_628"]["diameter_physical"][4:])
+
+
+@pytest.mark.parametrize(("ext", "requires"),
+                         [(".npz", None), (".ecsv", "yaml"),
+                          (".hdf5", "h5py"), (".parquet", "pyarrow")])
+def test_catalog_roundtrip(tmpdir, ext, requires):
+
+    if requires is not None:
+        pytest.importorskip(requires)
+
+    table = _make_table(6)
+
+    filename = os.path.join(str(tmpdir), "catalog" + ext)
+    write_table(table, filename)
+
+    new_table = read_table(filename)
+    assert new_table.colnames == table.colnames
+    assert isinstance(new_table["col0"], SkyCoord)
+    npt.assert_allclose(new_table["col0"].dec.deg, table["col0"].dec.deg)
+    npt.assert_allclose(new_table["diameter_physical"],
+                        table["diameter_physical"])
+    assert new_table["diameter_physical"].unit == u.pc
+
+    # The store is joined back into a SkyCoord column too
+    store = os.path.join(str(tmpdir), "store" + ext)
+    write_catalog_store(store, {"NGC_628": table})
+
+    cat = PPV_Catalog.from_file(store)
+    assert cat.table.colnames == ["galaxy"] + table.colnames
+    npt.assert_allclose(cat.table["col0"].ra.deg, table["col0"].ra.deg)
+
+    cat = PPV_Catalog.from_file(store, columns=["col0", "bubble_type"],
+                                where=[("diameter_physical", ">",
+                                        200 * u.pc)])
+    assert cat.table.colnames == ["col0", "bubble_type"]
+    assert len(cat.table) == (table["diameter_physical"] > 200).sum()
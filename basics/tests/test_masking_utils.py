@@ -2,7 +2,8 @@ import pytest
 import numpy as np
 from astropy.modeling.models import Ellipse2D
 
-from basics.masking_utils import fraction_in_mask
+from basics.masking_utils import (fraction_in_mask, ChannelRangeMask,
+                                  PackedMask)
 
 
 def test_all_in_fraction():
@@ -43,3 +44,48 @@ def test_half_ellipse_in_fraction_rotate():
 
     np.testing.assert_allclose(fraction_in_mask(blob, mask), 1.0,
                                rtol=0.01)
+
+
+def test_channel_range_mask():
+
+    twoD_mask = np.zeros((10, 12), dtype=bool)
+    twoD_mask[2:5, 3:9] = True
+
+    lazy = ChannelRangeMask(twoD_mask, 8, start=2, end=6)
+
+    full = np.zeros((8, 10, 12), dtype=bool)
+    full[2:6] = twoD_mask
+
+    assert lazy.shape == full.shape
+    assert lazy.sum() == full.sum()
+    np.testing.assert_equal(lazy.sum(axis=0), full.sum(axis=0))
+    np.testing.assert_equal(np.asarray(lazy), full)
+
+    other = np.random.RandomState(0).rand(*full.shape) > 0.5
+    np.testing.assert_equal(lazy & other, full & other)
+    np.testing.assert_equal(other & lazy, full & other)
+
+    sub = lazy[3:7, 1:4]
+    assert isinstance(sub, ChannelRangeMask)
+    np.testing.assert_equal(np.asarray(sub), full[3:7, 1:4])
+
+    np.testing.assert_equal(lazy[2], full[2])
+    np.testing.assert_equal(lazy[other], full[other])
+
+
+def test_packed_mask():
+
+    mask = np.random.RandomState(0).rand(5, 11, 19) > 0.5
+
+    packed = PackedMask.from_array(mask)
+
+    assert packed.nbytes < mask.nbytes / 6
+    assert packed.sum() == mask.sum()
+    np.testing.assert_equal(np.asarray(packed), mask)
+    np.testing.assert_equal(packed[2], mask[2])
+    np.testing.assert_equal(packed[:, 3:8, 5:17], mask[:, 3:8, 5:17])
+
+    packed[1, 2:6, 3:12] = False
+    mask[1, 2:6, 3:12] = False
+    np.testing.assert_equal(np.asarray(packed), mask)
+
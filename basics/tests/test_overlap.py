@@ -144,6 +144,37 @@ def test_shell_similarity():
         npt.assert_almost_equal(shell_similarity(data1, data2), params[2])
 
 
+def test_shell_similarity_optimal():
+
+    coords1 = np.array([[0., 1.5], [0., -2.5]])
+    coords2 = np.array([[0., 0.], [0., 2.]])
+
+    # The greedy matching uses up the only match of the second point
+    assert shell_similarity(coords1, coords2) == 0.5
+    assert shell_similarity(coords1, coords2, optimal=True) == 1.0
+
+
+def test_shape_from_blob_moments():
+
+    from skimage.measure import regionprops
+    from astropy.modeling.models import Ellipse2D
+    from basics.log import shapes_from_blob_moments, weighted_props
+
+    yy, xx = np.mgrid[:60, :60]
+    response = np.exp(-((yy - 30.) ** 2 / 50. + (xx - 25.) ** 2 / 20.))
+
+    blobs = np.array([[30., 25., 8., 8., 0.], [10., 50., 5., 5., 0.]])
+    new_blobs = shapes_from_blob_moments(blobs, response, expand_factor=1.)
+
+    # Compare to the moments of the region over the whole image
+    mask = Ellipse2D.evaluate(yy, xx, True, 30., 25., 8., 8., 0.)
+    props = regionprops(mask.astype(int), intensity_image=response)[0]
+
+    npt.assert_allclose(new_blobs[0, :5], weighted_props(props))
+    assert new_blobs[0, 2] > new_blobs[0, 3]
+    assert new_blobs.shape == (2, 6)
+
+
 def test_merge_to_larger():
 
     larger_blob = np.array([0.0, 0.0, 20., 10., 0.0, 1.0, 1.0])
@@ -172,3 +203,68 @@ def test_not_merge_to_larger():
 
     result_clip = merge_pair_to_larger(larger_blob, smaller_blobs)
     assert len(result_clip) == 0
+
+
+def test_cross_match():
+
+    from basics.cross_match import cross_match, best_matches
+    from basics.log import overlap_metric
+
+    np.random.seed(0)
+
+    major = np.random.uniform(3, 10, 30)
+    minor = major * np.random.uniform(0.5, 1., 30)
+    params1 = np.column_stack([np.random.uniform(0, 200, (30, 2)),
+                               major, minor,
+                               np.random.uniform(0, np.pi, 30)])
+    params1[::3, 3] = params1[::3, 2]
+    # Circles stay circles, so both the circle and ellipse pairs are used
+    params2 = params1[::2] + np.array([2., -1., 1., 1., 0.])
+
+    idx1, idx2, overlaps = cross_match(params1, params2)
+
+    brute = np.array([[overlap_metric(one, two) for two in params2]
+                      for one in params1])
+
+    npt.assert_allclose(overlaps, brute[idx1, idx2])
+    assert (brute > 0).sum() == len(overlaps)
+
+    best_overlap, best_idx = best_matches(len(params1), idx1, idx2, overlaps)
+    npt.assert_allclose(best_overlap, brute.max(1))
+
+    idx1, idx2, corrs = cross_match(params1, params2, return_corr=True)
+
+    brute_corrs = np.array([[overlap_metric(one, two, return_corr=True)
+                             for two in params2] for one in params1])
+
+    npt.assert_allclose(corrs, brute_corrs[idx1, idx2])
+
+
+def test_pairwise_overlaps():
+
+    from basics.log import pairwise_overlaps, overlap_metric
+
+    np.random.seed(0)
+
+    radii = np.random.uniform(3, 10, 40)
+    blobs = np.column_stack([np.random.uniform(0, 100, (40, 2)), radii,
+                             radii, np.zeros(40)])
+    blobs[::3, 3] *= 0.7
+    blobs[::3, 4] = 0.5
+
+    fracs, corrs = pairwise_overlaps(blobs)
+
+    brute_fracs = np.zeros((40, 40))
+    brute_corrs = np.zeros((40, 40))
+    for i in range(40):
+        for j in range(i + 1, 40):
+            brute_fracs[i, j] = brute_fracs[j, i] = \
+                overlap_metric(blobs[i], blobs[j])
+            brute_corrs[i, j] = brute_corrs[j, i] = \
+                overlap_metric(blobs[i], blobs[j], return_corr=True)
+
+    # Only the neighbouring pairs are stored
+    assert fracs.nnz < 40 * 39
+
+    npt.assert_allclose(fracs.toarray(), brute_fracs, atol=1e-10)
+    npt.assert_allclose(corrs.toarray(), brute_corrs, atol=1e-10)
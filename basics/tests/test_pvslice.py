@@ -0,0 +1,97 @@
+
+import numpy as np
+import numpy.testing as npt
+
+from pvextractor import Path, extract_pv_slice
+
+from basics.fan_pvslice import pv_wedge, pv_wedges, bubble_pv_slices
+from basics.bubble_objects import Bubble3D
+
+
+def _pvextractor_wedge(cube, center, length, ntheta, width=None):
+    '''
+    Average of the pvextractor slices along each path of a wedge.
+    '''
+
+    slices = []
+    for theta in np.linspace(0, np.pi, ntheta):
+        start = (center[1] - length / 2. * np.cos(theta),
+                 center[0] - length / 2. * np.sin(theta))
+        end = (center[1] + length / 2. * np.cos(theta),
+               center[0] + length / 2. * np.sin(theta))
+        slices.append(extract_pv_slice(cube, Path([start, end],
+                                                  width=width)).data)
+
+    path_length = min([pv_slice.shape[1] for pv_slice in slices])
+    return np.mean([pv_slice[:, :path_length] for pv_slice in slices],
+                   axis=0)
+
+
+def _noise_cube():
+    rng = np.random.RandomState(0)
+    cube = rng.randn(4, 30, 30)
+    cube[1, 12, 14] = np.NaN
+    return cube
+
+
+def test_pv_wedge_line_path():
+
+    cube = _noise_cube()
+
+    center = (15, 14)
+    length = 16.
+
+    expected = _pvextractor_wedge(cube, center, length, 5)
+
+    pv_slice = pv_wedge(cube, center, length, 0, np.pi, ntheta=5, width=None)
+
+    npt.assert_allclose(pv_slice.data, expected)
+
+    # All centers are extracted together
+    both = pv_wedges(cube, [(8, 9), center], [10., length], ntheta=5,
+                     width=None)
+
+    npt.assert_allclose(both[1].data, expected)
+
+
+def test_pv_wedge_width():
+
+    cube = _noise_cube()
+
+    # Include a path running off the edge of the cube
+    for center in [(15, 14), (4, 25)]:
+
+        expected = _pvextractor_wedge(cube, center, 16., 9, width=1)
+
+        pv_slice = pv_wedge(cube, center, 16., 0, np.pi, ntheta=9, width=1)
+
+        # The sub-sampled average is approximate. For unit noise, the
+        # differences are a few percent.
+        assert pv_slice.data.shape == expected.shape
+        npt.assert_array_equal(np.isnan(pv_slice.data), np.isnan(expected))
+        npt.assert_allclose(pv_slice.data, expected, atol=0.05)
+
+
+def test_bubble_pv_slices():
+
+    cube = _noise_cube()
+
+    bubbles = [Bubble3D([15., 14., 6., 5., 0., 2, 1, 3]),
+               Bubble3D([8., 20., 4., 3., 0.5, 2, 1, 3])]
+
+    pv_slices = bubble_pv_slices(bubbles, cube, spatial_pad=1)
+
+    for bub, pv_slice in zip(bubbles, pv_slices):
+        expected = pv_wedge(cube, (bub.y, bub.x), 2 * (bub.major + 1), 0,
+                            np.pi)
+        npt.assert_allclose(pv_slice.data, expected.data)
+
+        single = bub.extract_pv_slice(cube, use_subcube=False,
+                                      spatial_pad=1)
+        npt.assert_allclose(single.data, expected.data)
+
+    # One bubble per batch
+    batched = bubble_pv_slices(bubbles, cube, spatial_pad=1, max_samples=1)
+
+    for pv_slice, batch_slice in zip(pv_slices, batched):
+        npt.assert_allclose(batch_slice.data, pv_slice.data)
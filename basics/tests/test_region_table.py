@@ -0,0 +1,101 @@
+
+import numpy as np
+import numpy.testing as npt
+
+from basics.bubble_objects import Bubble2D, RegionTable
+
+
+def test_regiontable_roundtrip():
+
+    props = np.array([[10., 12., 5., 3., 0.2, 1., 0.8, 0.1, 0.01],
+                      [20., 22., 4., 4., 0., 2., 0.6, 0.2, 0.02]])
+    coords = [np.array([[1., 2.], [3., 4.]]), np.array([[5., 6.]])]
+
+    table = RegionTable.from_arrays(props, coords, channel=3)
+
+    assert len(table) == 2
+
+    regions = [Bubble2D(prop, shell_coords=coord, channel=3)
+               for prop, coord in zip(props, coords)]
+
+    npt.assert_allclose(table.params,
+                        np.array([reg.params for reg in regions]))
+
+    npt.assert_allclose(table[1].shell_coords, coords[1])
+
+    new_table = RegionTable.from_regions(regions)
+    npt.assert_allclose(new_table.params, table.params)
+    npt.assert_allclose(new_table.all_shell_coords(),
+                        table.all_shell_coords())
+
+
+def test_regiontable_subset():
+
+    props = np.array([[10., 12., 5., 3., 0.2],
+                      [20., 22., 4., 4., 0.],
+                      [30., 32., 6., 6., 0.]])
+    coords = [np.array([[1., 2.], [3., 4.]]), np.array([[5., 6.]]),
+              np.array([[7., 8.], [9., 10.], [11., 12.]])]
+
+    table = RegionTable.from_arrays(props, coords)
+
+    sub = table[np.array([False, True, True])]
+
+    assert len(sub) == 2
+    npt.assert_allclose(sub.all_shell_coords(), np.vstack(coords[1:]))
+    npt.assert_allclose(sub[1].shell_coords, coords[2])
+
+    sub.shift(1, 2)
+    npt.assert_allclose(sub["y"], props[1:, 0] + 1)
+    # The parent table is not changed
+    npt.assert_allclose(table["y"], props[:, 0])
+
+
+def test_regiontable_profile_lines():
+
+    from basics.profile import profile_line, _line_profile_coordinates
+
+    props = np.array([[20., 22., 5., 3., 0.2, 1., 0.8, 0.1, 0.01],
+                      [30., 25., 4., 4., 0., 2., 0.6, 0.2, 0.02]])
+    table = RegionTable.from_arrays(props, channel=3)
+
+    image = np.random.RandomState(0).normal(size=(50, 50))
+    # Within both regions
+    image[24, 23] = np.NaN
+
+    # chunk_size=1 computes the regions separately, in order of size
+    for linewidth, chunk_size in [(1, None), (3, None), (1, 1), (3, 1)]:
+        profiles, dists, valid, end_pts = \
+            table.profile_lines(image, ntheta=36, linewidth=linewidth,
+                                chunk_size=chunk_size)
+
+        assert profiles.shape[:2] == (2, 36)
+
+        num_dropped = 0
+
+        # Same as a profile_line along each ray
+        for i, (y0, x0, a, b, pa) in enumerate(props[:, :5]):
+            a *= 1.5
+            b *= 1.5
+            for j, theta in enumerate(np.linspace(0.0, 2 * np.pi, 36)):
+                end_pt = (y0 + a * np.cos(theta) * np.sin(pa) +
+                          b * np.sin(theta) * np.cos(pa),
+                          x0 + a * np.cos(theta) * np.cos(pa) -
+                          b * np.sin(theta) * np.sin(pa))
+
+                profile, dist = profile_line(image, (y0, x0), end_pt,
+                                             linewidth=linewidth)
+
+                npt.assert_allclose(end_pts[i, j], end_pt)
+                npt.assert_allclose(dists[i, j][valid[i, j]], dist)
+                npt.assert_allclose(profiles[i, j][valid[i, j]], profile)
+
+                num_samples = \
+                    _line_profile_coordinates((y0, x0), end_pt,
+                                              linewidth=linewidth).shape[1]
+                num_dropped += num_samples - len(profile)
+
+        # The NaN pixel removes points from some of the profiles. With a
+        # larger width, it is skipped in the average across the line.
+        if linewidth == 1:
+            assert num_dropped > 0
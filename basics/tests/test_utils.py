@@ -1,8 +1,10 @@
 
 import pytest
 import numpy as np
+import numpy.testing as npt
 
-from basics.utils import in_circle, in_ellipse
+from basics.utils import (in_circle, in_ellipse, masked_moments, sig_clip,
+                          dist_uppertri)
 
 
 def test_in_circle():
@@ -57,3 +59,192 @@ def test_not_in_ellipse():
                  (-4, -4, 5, 3, np.pi/5),
                  (-4, -4, 5, 3, 1.23*np.pi)]:
         assert not in_ellipse(pt, pars)
+
+
+def test_masked_moments():
+    from astropy import wcs
+    import astropy.units as u
+    from spectral_cube import SpectralCube
+
+    np.random.seed(0)
+
+    cube_wcs = wcs.WCS(naxis=3)
+    cube_wcs.wcs.ctype = ['RA---SIN', 'DEC--SIN', 'VRAD']
+    cube_wcs.wcs.cunit = ['deg', 'deg', 'm/s']
+    cube_wcs.wcs.cdelt = [-0.001, 0.001, 1000.]
+    cube_wcs.wcs.crval = [10., 10., 5000.]
+    cube_wcs.wcs.crpix = [10., 10., 1.]
+
+    data = np.random.random((8, 20, 20))
+    cube = SpectralCube(data * u.K, cube_wcs)
+
+    mask = np.zeros_like(data, dtype=bool)
+    mask[2:6, 5:12, 4:15] = np.random.random((4, 7, 11)) > 0.3
+
+    shell_cube = cube.with_mask(mask).minimal_subcube()
+
+    mom0, mom1, lwidth = \
+        masked_moments(data, mask, cube.spectral_axis.value, 1000.)
+
+    npt.assert_equal(mom0, shell_cube.moment0().value)
+    npt.assert_equal(mom1, shell_cube.moment1().value)
+    npt.assert_equal(lwidth, shell_cube.linewidth_fwhm().value)
+
+
+def test_sig_clip():
+
+    np.random.seed(0)
+
+    arr = np.random.randn(20, 64, 64)
+    arr[:, 10:20, 10:20] += 20.
+    arr[0, :5] = np.NaN
+
+    # Clip the full array directly
+    thresh = 3 * np.nanstd(arr)
+    while True:
+        good_pix = np.abs(arr[np.isfinite(arr)]) <= thresh
+        new_thresh = 3 * np.std(arr[np.isfinite(arr)][good_pix])
+        if np.abs(new_thresh - thresh) / thresh <= 0.01:
+            break
+        thresh = new_thresh
+
+    npt.assert_allclose(sig_clip(arr, nsig=3), new_thresh / 3., rtol=1e-4)
+    npt.assert_allclose(sig_clip(arr, nsig=3, chunk_size=3),
+                        sig_clip(arr, nsig=3))
+
+
+def test_dist_uppertri():
+
+    from scipy.spatial.distance import pdist, squareform
+
+    pts = np.random.RandomState(0).uniform(size=(7, 2))
+    cond_arr = pdist(pts)
+
+    npt.assert_equal(dist_uppertri(cond_arr, 7),
+                     np.tril(squareform(cond_arr), k=-1))
+
+
+def test_noise_model(tmpdir):
+
+    import os
+    from basics.noise import NoiseModel
+
+    np.random.seed(0)
+
+    scales = np.linspace(1, 2, 5)
+    cube = np.random.randn(5, 64, 64) * scales[:, np.newaxis, np.newaxis]
+
+    cache_file = os.path.join(str(tmpdir), "noise.npz")
+
+    model = NoiseModel.from_cube(cube, noise_map=True, cache_file=cache_file)
+
+    npt.assert_allclose(model.channel_sigma, scales, rtol=0.05)
+    assert model.noise_map.shape == (64, 64)
+
+    cached = NoiseModel.from_cube(cube, noise_map=True, cache_file=cache_file)
+    npt.assert_allclose(cached.channel_sigma, model.channel_sigma)
+    npt.assert_allclose(cached.noise_map, model.noise_map)
+    assert cached.map_nsig == 3
+
+    # The map is remade for a different clipping level
+    remade = NoiseModel.from_cube(cube, noise_map=True, map_nsig=2,
+                                  cache_file=cache_file)
+    assert remade.map_nsig == 2
+    assert NoiseModel.load(cache_file).map_nsig == 2
+
+    # Different data with the same shape does not use the cache
+    other = NoiseModel.from_cube(2 * cube, noise_map=True,
+                                 cache_file=cache_file)
+    npt.assert_allclose(other.channel_sigma, 2 * model.channel_sigma)
+
+
+def test_noise_model_blank_channel():
+
+    from basics.noise import NoiseModel
+
+    cube = np.random.RandomState(0).normal(0, 1., (4, 64, 64))
+    cube[0] = np.NaN
+    cube[-1] = 0.
+
+    model = NoiseModel.from_cube(cube, noise_map=True)
+
+    assert np.isnan(model.channel_sigma[[0, -1]]).all()
+    npt.assert_allclose(model.channel_sigma[1:-1], 1., rtol=0.1)
+    assert np.isfinite(model.sigma)
+
+    # Blank channels fall back to the median
+    assert model[0] == model.sigma
+    npt.assert_equal(model[:2], [model.sigma, model.channel_sigma[1]])
+
+
+def test_estimate_sigma_masked_channel():
+
+    import astropy.units as u
+    from astropy.coordinates import SkyCoord
+    from basics.bubble_segment3D import BubbleFinder
+    from _testing_data import make_ppv_cube
+
+    cube = make_ppv_cube(shape=(4, 48, 48), hole_density=0.)
+
+    mask = np.ones(cube.shape, dtype=bool)
+    mask[0] = False
+    cube = cube.with_mask(mask)
+
+    galaxy_props = {"center_coord": SkyCoord(150., 30., unit=u.deg),
+                    "scale_height": 100 * u.pc,
+                    "inclination": 30 * u.deg,
+                    "position_angle": 10 * u.deg}
+
+    finder = BubbleFinder(cube, sigma=0.05, galaxy_props=galaxy_props)
+    finder.estimate_sigma(per_channel=True)
+
+    assert np.isnan(finder.noise_model.channel_sigma[0])
+    assert finder.channel_sigma(0) == finder.sigma
+    assert np.isfinite(finder.sigma)
+
+
+def test_stage_profiler(tmpdir):
+
+    import os
+    import json
+    from basics.profiling import StageProfiler
+
+    profiler = StageProfiler()
+
+    for chan in range(3):
+        for item in profiler.timed_iter("loop", range(4), channel=chan):
+            with profiler.stage("inner", channel=chan, count=1,
+                                accumulate=True):
+                pass
+
+    totals = profiler.summary()
+    assert totals["loop"]["count"] == 12
+    assert totals["inner"]["calls"] == 12
+    assert len(profiler.records) == 6
+
+    log_file = os.path.join(str(tmpdir), "profile.jsonl")
+    profiler.write_log(log_file, cube="test")
+    with open(log_file) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 6
+    assert records[0]["cube"] == "test"
+
+    disabled = StageProfiler(enabled=False)
+    with disabled.stage("nothing"):
+        pass
+    assert len(disabled.records) == 0
+
+    # Stages that raise are still recorded
+    with pytest.raises(ValueError):
+        with profiler.stage("fails"):
+            raise ValueError()
+    assert profiler.records[-1]["stage"] == "fails"
+
+    # Memory kept by a stage shows up in the change of the current RSS
+    with profiler.stage("allocate"):
+        kept = np.ones(2 ** 22)
+    record = profiler.records[-1]
+    if np.isfinite(record["rss_start"]):
+        assert record["rss_end"] - record["rss_start"] > 20
+    assert record["peak_rss_increase"] >= 0
+    del kept
@@ -1,6 +1,5 @@
 
 import numpy as np
-from functools import partial
 from astropy.modeling.models import Ellipse2D
 from spectral_cube import SpectralCube
 from spectral_cube.lower_dimensional_structures import LowerDimensionalObject
@@ -37,14 +36,11 @@ def dist_uppertri(cond_arr, shape):
     '''
     dist_arr = np.zeros((shape, ) * 2, dtype=cond_arr.dtype)
 
-    def unrav_ind(i, j, n):
-        return n * j - j * (j + 1) / 2 + i - 1 - j
-
-    arr_ind = partial(unrav_ind, n=shape)
-
-    for i in xrange(shape):
-        for j in xrange(i):
-            dist_arr[i, j] = cond_arr[arr_ind(i, j)]
+    # Entry (i, j) with i > j is the distance between j and i, which is
+    # at n * j - j * (j + 1) / 2 + i - 1 - j in the condensed matrix.
+    rows, cols = np.tril_indices(shape, k=-1)
+    dist_arr[rows, cols] = \
+        cond_arr[shape * cols - cols * (cols + 1) // 2 + rows - 1 - cols]
 
     return dist_arr
 
@@ -73,31 +69,178 @@ def beam_struct(beam, scale, pixscale, return_beam=False):
     return struct
 
 
+def _iter_chunks(array, chunk_size=None):
+    '''
+    Yield the data in pieces along the first axis. Cubes are read one
+    chunk of channels at a time, so the whole cube is never in memory.
+    '''
+
+    if isinstance(array, SpectralCube):
+        chunk_size = 1 if chunk_size is None else chunk_size
+        for start in xrange(0, array.shape[0], chunk_size):
+            yield array.filled_data[start:start + chunk_size].value
+        return
+
+    if hasattr(array, "unit"):
+        array = array.value
+
+    array = np.asarray(array)
+
+    if chunk_size is None or array.ndim == 0:
+        yield array
+        return
+
+    for start in xrange(0, array.shape[0], chunk_size):
+        yield array[start:start + chunk_size]
+
+
+class _AbsHistogram(object):
+    '''
+    Histogram of the absolute values holding the count, sum and sum of
+    squares in each bin. The bins are spaced logarithmically by splitting
+    each power of 2 into 2**mant_bits bins, so the relative bin width is
+    fixed and no range needs to be known before reading the data.
+    '''
+
+    def __init__(self, chunks, mant_bits=10):
+
+        self.mant_bits = mant_bits
+        nsub = 2 ** mant_bits
+
+        self._emin = None
+        stats = np.zeros((0, nsub, 3))
+        zero_count = 0
+
+        for chunk in chunks:
+            vals = chunk[np.isfinite(chunk)].astype(np.float64).ravel()
+
+            nonzero = vals != 0
+            zero_count += vals.size - nonzero.sum()
+            vals = vals[nonzero]
+
+            if vals.size == 0:
+                continue
+
+            mant, expon = np.frexp(np.abs(vals))
+            # The mantissa is in [0.5, 1)
+            sub = ((mant - 0.5) * 2 * nsub).astype(int)
+
+            stats = self._grow(stats, expon.min(), expon.max())
+
+            idx = (expon - self._emin) * nsub + sub
+            size = stats.shape[0] * nsub
+
+            stats[..., 0] += np.bincount(idx, minlength=size).reshape(-1,
+                                                                     nsub)
+            stats[..., 1] += np.bincount(idx, weights=vals,
+                                         minlength=size).reshape(-1, nsub)
+            stats[..., 2] += np.bincount(idx, weights=vals ** 2,
+                                         minlength=size).reshape(-1, nsub)
+
+        if stats.shape[0] == 0 and zero_count == 0:
+            raise ValueError("No finite values in the data.")
+
+        if self._emin is None:
+            self._emin = 0
+
+        # Lower and upper edges of the bins.
+        expons = np.arange(self._emin, self._emin + stats.shape[0])
+        mants = 0.5 + np.arange(nsub + 1) / (2. * nsub)
+        edges = np.ldexp(mants[np.newaxis], expons[:, np.newaxis])
+
+        # The zeros make up the first bin
+        self.lower = np.append(0., edges[:, :-1].ravel())
+        self.upper = np.append(0., edges[:, 1:].ravel())
+
+        stats = np.vstack([[zero_count, 0., 0.], stats.reshape(-1, 3)])
+        self.bin_stats = stats
+        self.cum_stats = np.cumsum(stats, axis=0)
+
+    def _grow(self, stats, emin, emax):
+        '''
+        Extend the exponent range of the bins.
+        '''
+
+        if self._emin is None:
+            self._emin = emin
+            return np.zeros((emax - emin + 1, ) + stats.shape[1:])
+
+        cur_max = self._emin + stats.shape[0] - 1
+
+        before = max(self._emin - emin, 0)
+        after = max(emax - cur_max, 0)
+
+        if before == 0 and after == 0:
+            return stats
+
+        self._emin -= before
+        return np.pad(stats, ((before, after), (0, 0), (0, 0)),
+                      mode='constant')
+
+    def std(self, thresh=np.inf):
+        '''
+        Standard deviation of the values with absolute values below thresh.
+        The bin containing the threshold is assumed to be uniformly filled.
+        '''
+
+        if not np.isfinite(thresh):
+            count, total, total_sq = self.cum_stats[-1]
+        else:
+            idx = np.searchsorted(self.lower, thresh, side='right') - 1
+            count, total, total_sq = self.cum_stats[idx] - self.bin_stats[idx]
+
+            width = self.upper[idx] - self.lower[idx]
+            if width > 0:
+                frac = min((thresh - self.lower[idx]) / width, 1.)
+            else:
+                frac = 1.
+
+            count, total, total_sq = \
+                np.array([count, total, total_sq]) + \
+                frac * self.bin_stats[idx]
+
+        if count == 0:
+            return np.NaN
+
+        mean = total / count
+
+        return np.sqrt(max(total_sq / count - mean ** 2, 0.))
+
+
 def sig_clip(array, nsig=6, tol=0.01, max_iters=500,
-             return_clipped=False):
+             return_clipped=False, chunk_size=None, mant_bits=10):
     '''
     Sigma clipping based on the getsources method.
+
+    The data are summarized once in a histogram of the absolute values
+    (see `_AbsHistogram`) and the clipping iterations are done on the
+    histogram. SpectralCubes are read in chunks of channels.
+
+    Parameters
+    ----------
+    chunk_size : int, optional
+        Number of planes along the first axis to read at once. SpectralCubes
+        are read one channel at a time by default.
+    mant_bits : int, optional
+        Each power of 2 is split into 2**mant_bits bins in the histogram.
     '''
 
     # Check if a quantity has been passed
     if hasattr(array, "unit"):
         unit = array.unit
-        if isinstance(array, SpectralCube):
-            array = array.filled_data[:].copy()
-        else:
-            array = array.value.copy()
     else:
         unit = 1.
 
+    hist = _AbsHistogram(_iter_chunks(array, chunk_size=chunk_size),
+                         mant_bits=mant_bits)
+
     nsig = float(nsig)
-    mask = np.isfinite(array)
-    std = np.nanstd(array)
+    std = hist.std()
     thresh = nsig * std
 
     iters = 0
     while True:
-        good_pix = np.abs(array * mask) <= thresh
-        new_thresh = nsig * np.nanstd(array[good_pix])
+        new_thresh = nsig * hist.std(thresh)
         diff = np.abs(new_thresh - thresh) / thresh
         thresh = new_thresh
 
@@ -113,7 +256,13 @@ def sig_clip(array, nsig=6, tol=0.01, max_iters=500,
     if not return_clipped:
         return sigma
 
-    output = array.copy()
+    if isinstance(array, SpectralCube):
+        output = array.filled_data[:].value.copy()
+    elif hasattr(array, "unit"):
+        output = array.value.copy()
+    else:
+        output = np.array(array, copy=True)
+
     output[output < thresh] = np.NaN
 
     sigma *= unit
@@ -386,3 +535,69 @@ def check_give_beam(data):
             return data.meta['beam']
         except KeyError:
             return None
+
+
+def masked_moments(data, mask, spectral_axis, channel_width):
+    '''
+    Moment 0, moment 1 and the FWHM linewidth along the spectral axis of
+    the masked data. This follows SpectralCube's calculation for a cube
+    with the mask applied and cut to its minimal sub-cube, without creating
+    the cube or using the lazy masks. The sums are done in the same order,
+    so the results are identical.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        3D data, with NaNs where the data are not valid.
+    mask : np.ndarray
+        Boolean mask with the same shape as data.
+    spectral_axis : np.ndarray
+        Spectral values of the channels in data.
+    channel_width : float
+        Width of one channel in the units of spectral_axis.
+
+    Returns
+    -------
+    moment0 : np.ndarray
+        Integrated intensity in units of the data times the spectral unit.
+    moment1 : np.ndarray
+        Intensity-weighted spectral value.
+    linewidth : np.ndarray
+        FWHM linewidth from the second moment.
+    '''
+
+    include = mask & np.isfinite(data)
+
+    if not include.any():
+        empty = np.empty((0, 0))
+        return empty, empty.copy(), empty.copy()
+
+    # Minimal sub-cube containing the mask
+    slices = []
+    for axes in [(1, 2), (0, 2), (0, 1)]:
+        posns = np.where(np.any(include, axis=axes))[0]
+        slices.append(slice(posns[0], posns[-1] + 1))
+    slices = tuple(slices)
+
+    data = np.where(include, data, np.NaN)[slices] * channel_width
+
+    spectral = spectral_axis[slices[0]]
+    spectral_offset = (spectral - spectral[0])[:, np.newaxis, np.newaxis]
+
+    # Pixels with no valid data are NaN in moment 0
+    moment0 = np.nansum(data, axis=0)
+    moment0[np.all(np.isnan(data), axis=0)] = np.NaN
+
+    weights = np.nansum(data, axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        moment1 = np.nansum(data * spectral_offset, axis=0) / weights
+
+        moment2 = np.nansum(data * (spectral_offset - moment1) ** 2,
+                            axis=0) / weights
+
+        linewidth = np.sqrt(moment2) * (2. * np.sqrt(2. * np.log(2.)))
+
+    moment1 = moment1 + spectral[0]
+
+    return moment0, moment1, linewidth
@@ -0,0 +1,137 @@
+
+'''
+Timing benchmarks of the main steps of the bubble finding on synthetic
+cubes. The classes follow the asv conventions (setup, time_* methods and
+params), and can also be run without asv using run_benchmarks.py.
+'''
+
+import numpy as np
+from copy import copy
+
+from basics import BubbleFinder, BubbleFinder2D, RegionTable
+from basics.log import blob_log
+from basics.bubble_edge import find_bubble_edges
+from basics.fit_models import fit_region
+from basics.clustering import cluster_brute_force, threeD_overlaps
+
+from synthetic import (synthetic_cube, noise_level, busiest_channel,
+                       bubble_finder_run, GALAXY_PROPS, DISTANCE,
+                       FIND_KWARGS)
+
+
+class Segmentation2D(object):
+    '''
+    The steps of the segmentation in the channel with the most holes.
+    '''
+
+    params = [["small", "medium", "dense", "noisy"]]
+    param_names = ["cube"]
+    timeout = 600
+
+    def setup(self, config):
+        cube = synthetic_cube(config)[0]
+        chan = busiest_channel(config)
+
+        self.plane = cube[chan]
+        self.chan = chan
+        self.sigma = noise_level(config)
+        self.nsig = FIND_KWARGS["nsig"]
+
+        self.finder = BubbleFinder2D(self.plane, channel=chan,
+                                     sigma=self.sigma, auto_cut=True)
+
+        self.blobs = list(blob_log(self.finder.array,
+                                   sigma_list=self.finder.scales,
+                                   overlap=None,
+                                   threshold=self.nsig * self.sigma,
+                                   weighting=self.finder.weightings))
+
+        self.edges = []
+        for blob in self.blobs:
+            coords = find_bubble_edges(self.finder.array, blob,
+                                       max_extent=1.35,
+                                       value_thresh=(self.nsig + 1) *
+                                       self.sigma,
+                                       nsig_thresh=3,
+                                       edge_mask=self.finder.mask)[0]
+            if len(coords) >= 4:
+                self.edges.append((blob, np.array(coords)))
+
+    def time_create_mask(self, config):
+        BubbleFinder2D(self.plane, channel=self.chan, sigma=self.sigma,
+                       auto_cut=True)
+
+    def time_multiscale_bubblefind(self, config):
+        finder = copy(self.finder)
+        finder.multiscale_bubblefind(nsig=self.nsig)
+
+    def time_blob_log(self, config):
+        list(blob_log(self.finder.array, sigma_list=self.finder.scales,
+                      overlap=None, threshold=self.nsig * self.sigma,
+                      weighting=self.finder.weightings))
+
+    def time_find_bubble_edges(self, config):
+        for blob in self.blobs:
+            find_bubble_edges(self.finder.array, blob, max_extent=1.35,
+                              value_thresh=(self.nsig + 1) * self.sigma,
+                              nsig_thresh=3, edge_mask=self.finder.mask)
+
+    def time_fit_region(self, config):
+        for blob, coords in self.edges:
+            fit_region(coords, initial_props=blob,
+                       beam_pix=self.finder.beam_pix,
+                       mask=self.finder.mask,
+                       image_shape=self.finder.array.shape,
+                       max_resid=2 * self.finder.beam_pix)
+
+
+class Clustering(object):
+    '''
+    Clustering the 2D regions and removing overlapping 3D bubbles.
+    '''
+
+    params = [["small", "medium", "dense", "noisy"]]
+    param_names = ["cube"]
+    timeout = 600
+
+    def setup(self, config):
+        bub_find = bubble_finder_run(config)
+
+        # All of the 2D regions, ordered by channel as in get_bubbles
+        regions = RegionTable.concatenate(
+            [bub.twoD_regions for bub in bub_find.bubbles] +
+            list(bub_find.unclustered_regions))
+        order = np.argsort(regions["channel"], kind='mergesort')
+        self.region_props = regions[order].params
+        self.bubbles = bub_find.bubbles
+
+    def time_cluster_brute_force(self, config):
+        cluster_brute_force(self.region_props, min_corr=0.5,
+                            min_overlap=0.5, global_corr=0.5, verbose=False,
+                            multiprocess=False)
+
+    def time_threeD_overlaps(self, config):
+        threeD_overlaps(list(self.bubbles))
+
+
+class Pipeline(object):
+    '''
+    A full run of BubbleFinder.get_bubbles.
+    '''
+
+    params = [["small", "medium", "dense", "noisy"]]
+    param_names = ["cube"]
+    timeout = 1800
+    # Too slow to repeat many times
+    number = 1
+    repeat = 1
+
+    def setup(self, config):
+        self.cube = synthetic_cube(config)[0]
+        self.sigma = noise_level(config)
+
+    def time_get_bubbles(self, config):
+        bub_find = BubbleFinder(self.cube, distance=DISTANCE,
+                                galaxy_props=GALAXY_PROPS, sigma=self.sigma)
+        bub_find.get_bubbles(verbose=False, multiprocess=False,
+                             **FIND_KWARGS)
@@ -0,0 +1,291 @@
+
+'''
+Micro-benchmarks of the hot paths, each paired with an accuracy check so
+that a faster kernel which changes the results is caught. The time_*
+methods are timed and the track_* methods return the accuracy (asv records
+both). The limits in each class's `accuracy_limits`, which may be given
+for each parameter, are checked by run_benchmarks.py, which prints a table
+of the speed and accuracy.
+
+The accuracy is measured against independent references: the overlap of
+two ellipses integrated on finely spaced rows, the distance to an ellipse
+from a densely sampled perimeter, and the hole parameters of the
+`add_holes` fields.
+'''
+
+import numpy as np
+
+from basics.bubble_segment2D import BubbleFinder2D
+from basics.bubble_edge import find_bubble_edges
+from basics.fit_models import EllipseModel
+from basics.log import overlap_metric
+from basics.cross_match import cross_match, best_matches
+
+from synthetic import hole_field, HOLE_FIELD_NOISE
+
+
+def _row_intervals(blob, rows):
+    '''
+    Start and end in x of the chord of an ellipse [y, x, major, minor, pa]
+    along each row. NaN where the row misses the ellipse.
+    '''
+
+    y0, x0, major, minor, pa = blob[:5]
+    cpa, spa = np.cos(pa), np.sin(pa)
+
+    # Quadratic form of the ellipse in dx, dy
+    a = (cpa / major) ** 2 + (spa / minor) ** 2
+    b = 2 * cpa * spa * (1 / major ** 2 - 1 / minor ** 2)
+    c = (spa / major) ** 2 + (cpa / minor) ** 2
+
+    dy = rows - y0
+    disc = (b * dy) ** 2 - 4 * a * (c * dy ** 2 - 1)
+
+    with np.errstate(invalid='ignore'):
+        root = np.sqrt(disc)
+
+    return x0 + (-b * dy - root) / (2 * a), x0 + (-b * dy + root) / (2 * a)
+
+
+def reference_overlap(blob1, blob2, row_space=0.005, return_corr=False):
+    '''
+    Overlap of two ellipses from the exact chord lengths on finely spaced
+    rows. Same normalization as `~basics.log.overlap_metric`.
+    '''
+
+    area1 = np.pi * blob1[2] * blob1[3]
+    area2 = np.pi * blob2[2] * blob2[3]
+
+    low = max(blob1[0] - blob1[2], blob2[0] - blob2[2])
+    high = min(blob1[0] + blob1[2], blob2[0] + blob2[2])
+
+    if low >= high:
+        return 0.0
+
+    rows = np.arange(low, high, row_space) + row_space / 2.
+
+    start1, end1 = _row_intervals(blob1, rows)
+    start2, end2 = _row_intervals(blob2, rows)
+
+    chords = np.minimum(end1, end2) - np.maximum(start1, start2)
+    overlap_area = np.nansum(np.maximum(chords, 0)) * row_space
+
+    if return_corr:
+        return overlap_area / np.sqrt(area1 * area2)
+
+    return overlap_area / min(area1, area2)
+
+
+def reference_ellipse_distance(points, params, num_samples=20000):
+    '''
+    Distance from each (x, y) point to the nearest of a dense sampling of
+    the perimeter of an ellipse with `EllipseModel` parameters.
+    '''
+
+    model = EllipseModel()
+    perim = model.predict_xy(np.linspace(0, 2 * np.pi, num_samples,
+                                         endpoint=False), params=params)
+
+    dists = np.empty(len(points))
+    for i in range(0, len(points), 100):
+        block = points[i:i + 100]
+        sep = np.hypot(block[:, :1] - perim[:, 0],
+                       block[:, 1:] - perim[:, 1])
+        dists[i:i + 100] = sep.min(axis=1)
+
+    return dists
+
+
+def random_ellipse_pairs(num, circles=False, seed=0):
+    '''
+    Pairs of ellipses whose bounding circles intersect, with a range of
+    sizes, shapes and separations.
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    major = rng.uniform(3, 20, size=(num, 2))
+    if circles:
+        minor = major.copy()
+    else:
+        minor = major * rng.uniform(0.5, 1., size=(num, 2))
+    pa = rng.uniform(0, np.pi, size=(num, 2))
+
+    sep = rng.uniform(0, 1, size=num) * major.sum(1)
+    angle = rng.uniform(0, 2 * np.pi, size=num)
+
+    blobs1 = np.column_stack([np.zeros(num), np.zeros(num), major[:, 0],
+                              minor[:, 0], pa[:, 0]])
+    blobs2 = np.column_stack([sep * np.sin(angle), sep * np.cos(angle),
+                              major[:, 1], minor[:, 1], pa[:, 1]])
+
+    return blobs1, blobs2
+
+
+def detection_scores(truth, found, min_corr=0.5):
+    '''
+    Recall and precision of the found regions, where a match has an area
+    correlation of at least min_corr.
+    '''
+
+    if len(found) == 0:
+        return 0., 0.
+
+    idx1, idx2, corrs = cross_match(truth, found, return_corr=True)
+
+    truth_best = best_matches(len(truth), idx1, idx2, corrs)[0]
+    found_best = best_matches(len(found), idx2, idx1, corrs)[0]
+
+    return (truth_best >= min_corr).mean(), (found_best >= min_corr).mean()
+
+
+class EllipseOverlap(object):
+    '''
+    `~basics.log.overlap_metric` on random pairs of circles and ellipses.
+    '''
+
+    params = [["circle", "ellipse"]]
+    param_names = ["shape"]
+    # The ellipse errors are dominated by the bounding box test for one
+    # ellipse being inside of the other, and then by the 0.5 pixel grid.
+    accuracy_limits = {"track_overlap_max_error":
+                       {"circle": ("max", 1e-4), "ellipse": ("max", 0.26)},
+                       "track_overlap_mean_error":
+                       {"circle": ("max", 1e-5), "ellipse": ("max", 0.01)},
+                       "track_corr_max_error":
+                       {"circle": ("max", 1e-4), "ellipse": ("max", 0.12)}}
+
+    def setup(self, shape):
+        self.blobs1, self.blobs2 = \
+            random_ellipse_pairs(100, circles=shape == "circle")
+
+    def _errors(self, return_corr=False):
+        errs = [overlap_metric(blob1, blob2, return_corr=return_corr) -
+                reference_overlap(blob1, blob2, return_corr=return_corr)
+                for blob1, blob2 in zip(self.blobs1, self.blobs2)]
+        return np.abs(errs)
+
+    def time_overlap_metric(self, shape):
+        for blob1, blob2 in zip(self.blobs1, self.blobs2):
+            overlap_metric(blob1, blob2)
+
+    def track_overlap_max_error(self, shape):
+        return float(self._errors().max())
+
+    def track_overlap_mean_error(self, shape):
+        return float(self._errors().mean())
+
+    def track_corr_max_error(self, shape):
+        return float(self._errors(return_corr=True).max())
+
+
+class EllipseResiduals(object):
+    '''
+    `~basics.fit_models.EllipseModel.residuals` for noisy points around an
+    ellipse.
+    '''
+
+    params = [[20, 200]]
+    param_names = ["num_points"]
+    accuracy_limits = {"track_residuals_max_error": ("max", 1e-3)}
+
+    def setup(self, num_points):
+        rng = np.random.RandomState(0)
+
+        self.model = EllipseModel()
+        self.model.params = (40., 30., 15., 9., 0.6)
+
+        angles = rng.uniform(0, 2 * np.pi, num_points)
+        points = self.model.predict_xy(angles)
+        self.points = points + rng.normal(0, 2., points.shape)
+
+    def time_residuals(self, num_points):
+        self.model.residuals(self.points)
+
+    def track_residuals_max_error(self, num_points):
+        ref = reference_ellipse_distance(self.points, self.model.params)
+        return float(np.abs(self.model.residuals(self.points) - ref).max())
+
+
+class BubbleEdges(object):
+    '''
+    `~basics.bubble_edge.find_bubble_edges` started from the true holes.
+    The accuracy is the median distance of the edge pixels from the true
+    hole boundary, and the fraction of the holes with an edge found.
+    '''
+
+    params = [["sparse", "crowded"]]
+    param_names = ["field"]
+    accuracy_limits = {"track_edge_median_distance": ("max", 0.75),
+                       "track_edge_found_fraction": ("min", 1.0)}
+
+    def setup(self, field):
+        proj, self.truth = hole_field(field)
+
+        self.finder = BubbleFinder2D(proj, channel=0, sigma=HOLE_FIELD_NOISE)
+        self.nsig = 1.5
+
+    def _edges(self):
+        return [find_bubble_edges(self.finder.array, blob, max_extent=1.35,
+                                  value_thresh=(self.nsig + 1) *
+                                  self.finder.sigma,
+                                  nsig_thresh=3,
+                                  edge_mask=self.finder.mask)[0]
+                for blob in self.truth]
+
+    def time_find_bubble_edges(self, field):
+        self._edges()
+
+    def track_edge_median_distance(self, field):
+        dists = []
+        for blob, coords in zip(self.truth, self._edges()):
+            if len(coords) == 0:
+                continue
+            # EllipseModel is in (x, y)
+            params = (blob[1], blob[0], blob[2], blob[3], blob[4])
+            dists.append(reference_ellipse_distance(coords[:, ::-1],
+                                                    params))
+        return float(np.median(np.concatenate(dists)))
+
+    def track_edge_found_fraction(self, field):
+        return float(np.mean([len(coords) > 0 for coords in self._edges()]))
+
+
+class Detection2D(object):
+    '''
+    `~basics.bubble_segment2D.BubbleFinder2D.multiscale_bubblefind` on the
+    `add_holes` fields, with the recall and precision of the detections.
+    '''
+
+    params = [["sparse", "crowded"]]
+    param_names = ["field"]
+    accuracy_limits = {"track_recall": ("min", 1.0),
+                       "track_precision": ("min", 0.9)}
+    timeout = 600
+    number = 1
+    repeat = 1
+
+    _results = {}
+
+    def setup(self, field):
+        self.proj, self.truth = hole_field(field)
+
+    def _find(self):
+        finder = BubbleFinder2D(self.proj, channel=0, sigma=HOLE_FIELD_NOISE)
+        finder.multiscale_bubblefind(nsig=1.5, edge_find=True)
+        return finder.region_params
+
+    def _scores(self, field):
+        # Only run the detection once for both scores
+        if field not in self._results:
+            self._results[field] = detection_scores(self.truth, self._find())
+        return self._results[field]
+
+    def time_multiscale_bubblefind(self, field):
+        self._find()
+
+    def track_recall(self, field):
+        return float(self._scores(field)[0])
+
+    def track_precision(self, field):
+        return float(self._scores(field)[1])
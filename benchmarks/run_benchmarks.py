@@ -0,0 +1,248 @@
+
+'''
+Run the benchmarks without asv and append the timings and accuracy
+measurements to a JSON-lines file, tagged with the current git commit, so
+runs on different commits can be compared. A table of the speed and
+accuracy is printed at the end, and the exit status is non-zero when an
+accuracy measurement is outside of the limits set by its benchmark.
+
+    python benchmarks/run_benchmarks.py                  # everything
+    python benchmarks/run_benchmarks.py -b Segmentation2D -p small
+    python benchmarks/run_benchmarks.py --compare HEAD~1
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import subprocess
+import itertools
+from datetime import datetime
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, bench_dir)
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+import bench_bubbles
+import bench_kernels
+
+BENCH_MODULES = [bench_bubbles, bench_kernels]
+
+DEFAULT_RESULTS = os.path.join(bench_dir, "results.jsonl")
+
+
+def git_commit(ref="HEAD"):
+    try:
+        return subprocess.check_output(["git", "rev-parse", ref],
+                                       cwd=bench_dir).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def find_benchmarks(names=None):
+    '''
+    Classes in the benchmark modules that have time_* methods.
+    '''
+
+    for module in BENCH_MODULES:
+        for name in sorted(dir(module)):
+            cls = getattr(module, name)
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+
+            methods = sorted(meth for meth in dir(cls)
+                             if meth.startswith("time_") or
+                             meth.startswith("track_"))
+            if len(methods) == 0:
+                continue
+
+            if names is not None and name not in names:
+                continue
+
+            yield cls, methods
+
+
+def run_class(cls, methods, params=None, repeat=None):
+    '''
+    Run each method for every combination of the class parameters.
+    '''
+
+    all_params = getattr(cls, "params", [[]])
+    if len(all_params) > 0 and not isinstance(all_params[0], list):
+        all_params = [all_params]
+
+    combos = list(itertools.product(*all_params)) if all_params else [()]
+
+    for combo in combos:
+        if params is not None and not set(combo) & set(params):
+            continue
+
+        bench = cls()
+        if hasattr(bench, "setup"):
+            bench.setup(*combo)
+
+        for meth in methods:
+            func = getattr(bench, meth)
+
+            if meth.startswith("track_"):
+                # Accuracy measurements are returned rather than timed
+                yield meth, combo, check_limit(cls, meth, combo,
+                                                  func(*combo))
+                continue
+
+            number = getattr(cls, "number", 1)
+            num_repeat = repeat or getattr(cls, "repeat", 3)
+
+            timer = timeit.Timer(lambda: func(*combo))
+            times = [tim / number for tim in
+                     timer.repeat(repeat=num_repeat, number=number)]
+            times.sort()
+
+            yield meth, combo, {"min": times[0],
+                                "median": times[len(times) // 2]}
+
+
+def check_limit(cls, meth, combo, value):
+    '''
+    Compare an accuracy measurement to the limit set in the
+    `accuracy_limits` of the benchmark class. The limit can be a dictionary
+    keyed by the parameter value.
+    '''
+
+    result = {"value": value}
+
+    limits = getattr(cls, "accuracy_limits", {})
+    if meth not in limits:
+        return result
+
+    limit = limits[meth]
+    if isinstance(limit, dict):
+        key = combo[0] if len(combo) == 1 else combo
+        if key not in limit:
+            return result
+        limit = limit[key]
+
+    kind, limit = limit
+    if kind == "max":
+        passed = value <= limit
+    elif kind == "min":
+        passed = value >= limit
+    else:
+        raise ValueError("Accuracy limits must be 'min' or 'max', not "
+                         "{}.".format(kind))
+
+    result.update(limit=[kind, limit], passed=bool(passed))
+    return result
+
+
+def print_table(records):
+    '''
+    Speed and accuracy of each benchmark.
+    '''
+
+    print("\n{0:<48}{1:<10}{2:>12}{3:>16}{4:>8}"
+          .format("Benchmark", "Params", "Time (s)", "Accuracy", "Limit"))
+
+    for rec in records:
+        params = "-".join(str(par) for par in rec["params"])
+
+        if "min" in rec:
+            print("{0:<48}{1:<10}{2:>12.4f}".format(rec["benchmark"], params,
+                                                    rec["min"]))
+            continue
+
+        if "limit" in rec:
+            status = "ok" if rec["passed"] else "FAIL"
+            limit = "{0} {1} {2}".format("<=" if rec["limit"][0] == "max"
+                                         else ">=", rec["limit"][1], status)
+        else:
+            limit = ""
+
+        print("{0:<48}{1:<10}{2:>12}{3:>16.5g}  {4}"
+              .format(rec["benchmark"], params, "", rec["value"], limit))
+
+
+def load_results(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results, commit, other):
+    '''
+    Ratio of the timings on commit to those on other.
+    '''
+
+    def latest(commit):
+        out = {}
+        for res in results:
+            if res["commit"] == commit:
+                value = res["min"] if "min" in res else res["value"]
+                out[(res["benchmark"], tuple(res["params"]))] = value
+        return out
+
+    new = latest(commit)
+    old = latest(other)
+
+    print("{0:<50}{1:>12}{2:>12}{3:>8}".format("Benchmark", "Before",
+                                               "After", "Ratio"))
+    for key in sorted(set(new) & set(old)):
+        name = "{0} {1}".format(key[0], "-".join(str(par) for par in key[1]))
+        ratio = new[key] / old[key] if old[key] != 0 else float('nan')
+        print("{0:<50}{1:>12.4g}{2:>12.4g}{3:>8.2f}"
+              .format(name, old[key], new[key], ratio))
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-b", "--bench", nargs="*", default=None,
+                        help="Names of the benchmark classes to run.")
+    parser.add_argument("-p", "--params", nargs="*", default=None,
+                        help="Only run these parameter values (e.g., small)")
+    parser.add_argument("-r", "--repeat", type=int, default=None,
+                        help="Number of repeats for each timing.")
+    parser.add_argument("-o", "--output", default=DEFAULT_RESULTS,
+                        help="JSON-lines file to append the results to.")
+    parser.add_argument("--compare", default=None,
+                        help="Compare the results on the current commit to "
+                             "those on this commit instead of running.")
+    args = parser.parse_args(args)
+
+    commit = git_commit()
+
+    if args.compare is not None:
+        compare(load_results(args.output), commit, git_commit(args.compare))
+        return
+
+    info = {"commit": commit, "date": datetime.now().isoformat(),
+            "machine": platform.node(), "python": platform.python_version()}
+
+    records = []
+    with open(args.output, "a") as f:
+        for cls, methods in find_benchmarks(args.bench):
+            for meth, combo, result in run_class(cls, methods,
+                                                 params=args.params,
+                                                 repeat=args.repeat):
+                name = "{0}.{1}".format(cls.__name__, meth)
+                record = dict(info, benchmark=name, params=list(combo),
+                              **result)
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+
+                records.append(record)
+
+    print_table(records)
+
+    if not all(rec.get("passed", True) for rec in records):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
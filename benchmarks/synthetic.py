@@ -0,0 +1,144 @@
+
+'''
+Synthetic cubes shared by the benchmarks. The cubes are made with
+`basics.tests._testing_data.make_ppv_cube` and are cached, so each
+configuration is only generated once per process.
+'''
+
+import numpy as np
+import astropy.units as u
+from astropy import wcs
+from astropy.coordinates import SkyCoord
+from radio_beam import Beam
+from spectral_cube.lower_dimensional_structures import Projection
+
+from basics.tests._testing_data import make_ppv_cube, add_holes
+
+
+# Keywords for make_ppv_cube. Add entries here to benchmark other sizes,
+# hole densities or noise levels.
+CUBE_CONFIGS = {"small": dict(shape=(8, 128, 128), hole_density=2.,
+                              noise=0.05),
+                "medium": dict(shape=(16, 256, 256), hole_density=2.,
+                               noise=0.05),
+                "dense": dict(shape=(16, 128, 128), hole_density=6.,
+                              noise=0.05),
+                "noisy": dict(shape=(16, 128, 128), hole_density=2.,
+                              noise=0.15)}
+
+GALAXY_PROPS = {"center_coord": SkyCoord(150., 30., unit=u.deg),
+                "scale_height": 100 * u.pc,
+                "inclination": 30 * u.deg,
+                "position_angle": 10 * u.deg}
+
+DISTANCE = 3 * u.Mpc
+
+# Parameters of the search used by all of the benchmarks
+FIND_KWARGS = dict(nsig=1.5, min_corr=0.5, min_overlap=0.5, global_corr=0.5,
+                   min_channels=3, min_shell_fraction=0.3)
+
+# Keywords for add_holes used to make the 2D hole fields
+HOLE_FIELD_CONFIGS = {"sparse": dict(shape=(128, 128), nholes=4, rad_min=8,
+                                     rad_max=16, seed=0),
+                      "crowded": dict(shape=(256, 256), nholes=12,
+                                      rad_min=8, rad_max=20, seed=1)}
+
+# Relative to the emission, which is 1
+HOLE_FIELD_NOISE = 0.05
+
+_cache = {}
+
+
+def synthetic_cube(config):
+    '''
+    The cube, hole parameters and hole channel ranges for a configuration.
+    '''
+
+    key = ("cube", config)
+    if key not in _cache:
+        _cache[key] = make_ppv_cube(return_info=True, **CUBE_CONFIGS[config])
+    return _cache[key]
+
+
+def noise_level(config):
+    return CUBE_CONFIGS[config]["noise"]
+
+
+def busiest_channel(config):
+    '''
+    Channel with the most holes in it.
+    '''
+
+    cube, params, chan_ranges = synthetic_cube(config)
+    counts = [((chan_ranges[:, 0] <= chan) &
+               (chan_ranges[:, 1] >= chan)).sum()
+              for chan in range(cube.shape[0])]
+    return int(np.argmax(counts))
+
+
+def bubble_finder_run(config):
+    '''
+    A finished `BubbleFinder` run on the cube. Used as the input for the
+    clustering and overlap benchmarks.
+    '''
+
+    key = ("run", config)
+    if key not in _cache:
+        from basics import BubbleFinder
+
+        cube = synthetic_cube(config)[0]
+        bub_find = BubbleFinder(cube, distance=DISTANCE,
+                                galaxy_props=GALAXY_PROPS,
+                                sigma=noise_level(config))
+        bub_find.get_bubbles(verbose=False, multiprocess=False,
+                             save_regions=False, **FIND_KWARGS)
+        _cache[key] = bub_find
+    return _cache[key]
+
+
+def hole_field(config):
+    '''
+    A 2D field of empty holes made with `add_holes`, with noise, and the
+    hole parameters [y, x, major, minor, pa] in the pixel frame of the
+    array.
+    '''
+
+    key = ("holes", config)
+    if key in _cache:
+        return _cache[key]
+
+    kwargs = HOLE_FIELD_CONFIGS[config].copy()
+    shape = kwargs.pop("shape")
+    np.random.seed(kwargs.pop("seed"))
+
+    array, params = add_holes(shape, hole_level=0, return_info=True,
+                              max_corr=0.1, **kwargs)
+    array /= 255.
+
+    # add_holes evaluates the ellipses with the axes swapped, and about the
+    # centre of the array
+    truth = np.column_stack([params[:, 1] + shape[0] / 2,
+                             params[:, 0] + shape[1] / 2,
+                             params[:, 2], params[:, 3],
+                             np.pi / 2 - params[:, 4]])
+
+    # Emission touching the edges is removed from the mask
+    array[:4] = 0.
+    array[-4:] = 0.
+    array[:, :4] = 0.
+    array[:, -4:] = 0.
+
+    array += np.random.normal(0, HOLE_FIELD_NOISE, shape)
+
+    mywcs = wcs.WCS(naxis=2)
+    mywcs.wcs.ctype = ["RA---SIN", "DEC--SIN"]
+    mywcs.wcs.cdelt = [-1.5 / 3600., 1.5 / 3600.]
+    mywcs.wcs.crval = [150., 30.]
+    mywcs.wcs.crpix = [shape[1] / 2., shape[0] / 2.]
+    mywcs.wcs.cunit = ["deg", "deg"]
+
+    proj = Projection(array, wcs=mywcs, unit=u.K,
+                      meta={"beam": Beam((4.5 * u.arcsec).to(u.deg))})
+
+    _cache[key] = proj, truth
+    return _cache[key]